@@ -0,0 +1,81 @@
+"""
+build time, memory, p50/p99 query latency and recall@k of every ANN engine, against the exact one.
+
+    python -m benchmarks.bench_ann                       # synthetic 170k x 15 catalog
+    python -m benchmarks.bench_ann --bundle artifacts/<version>
+"""
+import time
+import argparse
+
+import numpy as np
+
+from src.model_store import load_bundle
+from src.vector_index import AnnoyEngine, ExactEngine, IVFEngine, engine_from_bundle
+
+CONFIGS = [
+    ("exact", {}),
+    ("annoy", {"n_trees": 10}),
+    ("annoy", {"n_trees": 25}),
+    ("annoy", {"n_trees": 50}),
+    ("ivf", {"n_probe": 1}),
+    ("ivf", {"n_probe": 3}),
+    ("ivf", {"n_probe": 6}),
+]
+
+
+def synthetic_features(n_rows: int, dim: int = 15, n_centers: int = 40, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(scale=2.0, size=(n_centers, dim))
+    return (centers[rng.integers(0, n_centers, n_rows)] + rng.normal(size=(n_rows, dim))).astype(np.float32)
+
+
+def build(name: str, params: dict, features: np.ndarray, bundle=None):
+    if bundle is not None and name == "ivf":
+        return engine_from_bundle(name, bundle, **params)
+    if name == "annoy":
+        return AnnoyEngine.build(features, **params)
+    if name == "ivf":
+        return IVFEngine.build(features, **params)
+    return ExactEngine.build(features, **params)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--bundle", help="benchmark on a built model bundle instead of synthetic data")
+    parser.add_argument("--rows", type=int, default=170_000)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("-k", type=int, default=10)
+    args = parser.parse_args()
+
+    bundle = load_bundle(args.bundle) if args.bundle else None
+    features = np.asarray(bundle.features) if bundle else synthetic_features(args.rows)
+
+    # queries look like seed centers: catalog rows nudged a little
+    rng = np.random.default_rng(1)
+    queries = features[rng.choice(len(features), args.queries, replace=False)]
+    queries = queries + rng.normal(scale=0.1, size=queries.shape).astype(np.float32)
+
+    truth, _ = ExactEngine.build(features).search(queries, args.k)
+
+    print(f"{len(features)} items, {features.shape[1]} dims, {args.queries} queries, recall@{args.k}")
+    print(f"{'engine':<22} {'build s':>8} {'mem MB':>8} {'p50 ms':>8} {'p99 ms':>8} {'recall':>7}")
+    for name, params in CONFIGS:
+        start = time.perf_counter()
+        engine = build(name, params, features, bundle)
+        build_s = time.perf_counter() - start
+
+        latencies, hits = [], 0
+        for query, expected in zip(queries, truth):
+            start = time.perf_counter()
+            found = engine.get_nns_by_vector(query, args.k)
+            latencies.append(time.perf_counter() - start)
+            hits += len(set(found) & set(expected.tolist()))
+
+        label = name + "".join(f" {key}={value}" for key, value in params.items())
+        p50, p99 = np.percentile(latencies, [50, 99]) * 1000
+        print(f"{label:<22} {build_s:>8.2f} {engine.memory_bytes() / 1e6:>8.1f} {p50:>8.2f} {p99:>8.2f} "
+              f"{hits / truth.size:>7.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+find_best_30s analysis cost on long inputs: the original whole-file librosa load + per frame python
+loop vs the streaming block analyzer. peak memory is the tracemalloc peak of the analysis itself.
+the original loop is only run up to --legacy-max-minutes, it takes minutes on long mixes.
+
+    python -m benchmarks.bench_best_30s [--minutes 3 30 120] [--legacy-max-minutes 3]
+"""
+import os
+import time
+import argparse
+import tempfile
+import tracemalloc
+
+import numpy as np
+import soundfile as sf
+
+from src.song_Gen.youTfileCreateor import find_best_start
+
+SAMPLE_RATE = 22050
+DURATION = 30
+
+
+def write_track(path: str, minutes: int, sr: int = SAMPLE_RATE, seed: int = 0):
+    """noise with a slowly varying envelope, written a minute at a time"""
+    rng = np.random.default_rng(seed)
+    with sf.SoundFile(path, "w", samplerate=sr, channels=1, subtype="PCM_16") as f:
+        for _ in range(minutes):
+            envelope = np.repeat(rng.random(60), sr)
+            f.write((0.3 * envelope * rng.standard_normal(sr * 60)).astype(np.float32))
+
+
+def legacy_best_start(path: str, duration: int = DURATION) -> float:
+    import librosa
+
+    y, sr = librosa.load(path, sr=None)
+    frame_length = int(sr * 0.5)
+    hop_length = int(sr * 0.25)
+    energy = np.array([
+        sum(abs(y[i:i+frame_length]**2))
+        for i in range(0, len(y), hop_length)
+    ])
+    window_size = int((duration * sr) / hop_length)
+    energy_sum = np.convolve(energy, np.ones(window_size), mode='valid')
+    return np.argmax(energy_sum) * hop_length / sr
+
+
+def measure(fn):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak / 2 ** 20
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--minutes", type=int, nargs="+", default=[3, 30, 120])
+    parser.add_argument("--legacy-max-minutes", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'minutes':>8} {'file MB':>8} {'legacy s':>9} {'legacy MB':>10} {'stream s':>9} {'stream MB':>10} {'start s':>8}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for minutes in args.minutes:
+            path = os.path.join(tmp, f"track_{minutes}m.wav")
+            write_track(path, minutes)
+            file_mb = os.path.getsize(path) / 2 ** 20
+
+            legacy = "-", "-"
+            if minutes <= args.legacy_max_minutes:
+                legacy_start, legacy_s, legacy_mb = measure(lambda: legacy_best_start(path))
+                legacy = f"{legacy_s:.2f}", f"{legacy_mb:.0f}"
+
+            stream_start, stream_s, stream_mb = measure(lambda: find_best_start(path, DURATION))
+            print(f"{minutes:>8} {file_mb:>8.0f} {legacy[0]:>9} {legacy[1]:>10} "
+                  f"{stream_s:>9.2f} {stream_mb:>10.1f} {stream_start:>8.2f}")
+            os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
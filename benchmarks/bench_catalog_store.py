@@ -0,0 +1,99 @@
+"""
+per-worker memory of the pandas catalog against the CatalogStore (src/store.py), and the time it
+takes to turn recommended row positions into response rows with each.
+
+  frame - load_bundle's DataFrame, numeric columns mapped, strings decoded into python objects
+  store - the bundle's CatalogStore, every array memory mapped
+
+memory is measured in a fresh spawned process per representation, after loading it and the
+per-row lookups the app builds from it (SongLookup holds its own name strings either way).
+
+    python -m benchmarks.bench_catalog_store [n_songs]
+"""
+import os
+import sys
+import time
+import tempfile
+import multiprocessing as mp
+
+import numpy as np
+
+from benchmarks.bench_shared_catalog import make_sources, memory
+from src.model_store import build_bundle, load_bundle
+from src.store import CatalogStore
+
+N_SONGS = 170_000
+N_QUERIES = 2000
+METADATA_COLS = ['name', 'year', 'artists', 'predicted_genre']
+
+
+def loaded_worker(path, representation, results):
+    before = memory()
+    started = time.perf_counter()
+    if representation == "frame":
+        catalog = load_bundle(path, shared=True).data
+    else:
+        catalog = CatalogStore.load(os.path.join(path, "store"), mmap=True)
+    # what load_model derives from the catalog, genre and artist columns as whole arrays
+    np.asarray(catalog['predicted_genre'])
+    np.asarray(catalog['first_artist'])
+    # touch the rows like serving does for a while
+    rng = np.random.default_rng(0)
+    for rows in rng.integers(0, len(catalog), (500, 10)):
+        build_rows(catalog, representation, rows)
+    after = memory()
+    results.put((time.perf_counter() - started, {k: (after[k] - before[k]) / 2 ** 20 for k in after}))
+
+
+def build_rows(catalog, representation: str, rows: np.ndarray) -> list:
+    if representation == "frame":
+        return catalog.iloc[rows][METADATA_COLS].to_dict(orient='records')
+    return [record.as_dict() for record in catalog.records(rows)]
+
+
+def measure_memory(path: str, representation: str):
+    ctx = mp.get_context("spawn")
+    results = ctx.Queue()
+    proc = ctx.Process(target=loaded_worker, args=(path, representation, results))
+    proc.start()
+    sample = results.get()
+    proc.join()
+    return sample
+
+
+def measure_latency(catalog, representation: str, n_rows: int) -> tuple:
+    rng = np.random.default_rng(1)
+    latencies = []
+    for _ in range(N_QUERIES):
+        rows = rng.integers(0, len(catalog), n_rows)
+        started = time.perf_counter()
+        build_rows(catalog, representation, rows)
+        latencies.append(time.perf_counter() - started)
+    return tuple(np.percentile(latencies, [50, 99]) * 1e6)
+
+
+def main():
+    n_songs = int(sys.argv[1]) if len(sys.argv) > 1 else N_SONGS
+
+    with tempfile.TemporaryDirectory() as tmp:
+        songs_csv, genres_csv = make_sources(tmp, n_songs)
+        path = build_bundle(songs_csv, genres_csv, os.path.join(tmp, "artifacts"))
+
+        print(f"{n_songs} songs")
+        print(f"{'catalog':>8} {'load s':>7} {'rss MB':>8} {'uss MB':>8} {'pss MB':>8}")
+        for representation in ("frame", "store"):
+            load_s, mb = measure_memory(path, representation)
+            print(f"{representation:>8} {load_s:>7.2f} {mb['rss']:>8.1f} {mb['uss']:>8.1f} {mb['pss']:>8.1f}")
+
+        bundle = load_bundle(path, shared=True)
+        catalogs = {"frame": bundle.data, "store": bundle.store}
+        print(f"\nresponse rows, {N_QUERIES} requests")
+        print(f"{'catalog':>8} {'rows':>5} {'p50 us':>8} {'p99 us':>8}")
+        for n_rows in (10, 100):
+            for representation, catalog in catalogs.items():
+                p50, p99 = measure_latency(catalog, representation, n_rows)
+                print(f"{representation:>8} {n_rows:>5} {p50:>8.1f} {p99:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
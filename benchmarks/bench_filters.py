@@ -0,0 +1,138 @@
+"""
+filtered top-k queries at falling selectivity, three ways against the exact filtered answer:
+
+  post     - ann candidates filtered with pandas isin and column reads, widened in rounds (the old path)
+  bits     - ann candidates filtered by reading their bits from the packed filter
+  switch   - what the app does: the bitset, and an exact search over its rows below FILTER_EXACT_SELECTIVITY
+
+    python -m benchmarks.bench_filters [--rows 170000] [--queries 200]
+"""
+import time
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.bench_ann import synthetic_features
+from src.filters import CatalogFilters, FILTER_EXACT_SELECTIVITY, contains, rows_of
+from src.partitions import GenrePartitions, nearest_rows
+from src.vector_index import AnnoyEngine
+
+K = 10
+MAX_ROUNDS = 5
+EXPANSION = 4
+
+
+def make_catalog(features: np.ndarray, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    n_rows = len(features)
+    # a long tailed genre distribution, like predicted_genre
+    genre_weights = 1 / np.arange(1, 2001)
+    return pd.DataFrame({
+        'year': rng.integers(1921, 2021, n_rows),
+        'predicted_genre': [f"genre {g}" for g in rng.choice(2000, n_rows, p=genre_weights / genre_weights.sum())],
+        'cluster_label': rng.integers(0, 20, n_rows),
+        'explicit': (rng.random(n_rows) < 0.1).astype(int),
+        'energy': rng.random(n_rows),
+        'valence': rng.random(n_rows),
+        'tempo': rng.uniform(60, 200, n_rows),
+    })
+
+
+CASES = [
+    ("not explicit", {"explicit": False}),
+    ("5 top genres", {"genres": [f"genre {g}" for g in range(5)]}),
+    ("1990s", {"year_min": 1990, "year_max": 1999}),
+    ("workout", {"mood": "workout"}),
+    ("3 mid genres", {"genres": ["genre 40", "genre 41", "genre 42"]}),
+    ("workout 1990s", {"mood": "workout", "year_min": 1990, "year_max": 1999}),
+    ("1 rare genre", {"genres": ["genre 1500"]}),
+]
+
+
+def post_filter(engine, data, query, case):
+    """the pandas way, filters spelled out as column reads on the candidate rows"""
+    n_candidates = K * 4
+    for _ in range(MAX_ROUNDS):
+        idxs = np.asarray(engine.get_nns_by_vector(query, n_candidates), dtype=np.int64)
+        rows = data.iloc[idxs]
+        keep = np.ones(len(idxs), dtype=bool)
+        if "genres" in case:
+            keep &= rows['predicted_genre'].isin(case["genres"]).to_numpy()
+        if "year_min" in case:
+            keep &= rows['year'].between(case["year_min"], case["year_max"]).to_numpy()
+        if "explicit" in case:
+            keep &= (rows['explicit'] == int(case["explicit"])).to_numpy()
+        if "mood" in case:
+            keep &= ((rows['energy'] >= 0.7) & (rows['tempo'] >= 95)).to_numpy()
+        picked = idxs[keep]
+        if len(picked) >= K or n_candidates >= len(data):
+            break
+        n_candidates = min(n_candidates * EXPANSION, len(data))
+    return picked[:K]
+
+
+def bits_filter(engine, filters, bits, selectivity, query):
+    n_candidates = min(int(K * 4 / max(selectivity, 1e-6)), filters.n_rows)
+    for _ in range(MAX_ROUNDS):
+        idxs = np.asarray(engine.get_nns_by_vector(query, n_candidates), dtype=np.int64)
+        picked = idxs[contains(bits, idxs)]
+        if len(picked) >= K or n_candidates >= filters.n_rows:
+            break
+        n_candidates = min(n_candidates * EXPANSION, filters.n_rows)
+    return picked[:K]
+
+
+def switch(engine, filters, case, query):
+    bits = filters.mask(**case)
+    selectivity = filters.selectivity(bits)
+    if selectivity <= FILTER_EXACT_SELECTIVITY:
+        return filters.nearest(query, bits, K)
+    return bits_filter(engine, filters, bits, selectivity, query)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=170_000)
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+
+    features = synthetic_features(args.rows)
+    data = make_catalog(features)
+    start = time.perf_counter()
+    filters = CatalogFilters(data, GenrePartitions(data['predicted_genre'].to_numpy(), features))
+    print(f"{args.rows} rows, bitsets built in {time.perf_counter() - start:.2f}s, "
+          f"{filters.memory_bytes() / 1e6:.1f} MB")
+    engine = AnnoyEngine.build(features, n_trees=10)
+
+    rng = np.random.default_rng(1)
+    queries = features[rng.choice(len(features), args.queries, replace=False)]
+
+    print(f"{'filter':<15} {'select':>7} {'post ms':>8} {'recall':>7} {'bits ms':>8} {'recall':>7} "
+          f"{'switch ms':>10} {'recall':>7}")
+    for label, case in CASES:
+        bits = filters.mask(**case)
+        selectivity = filters.selectivity(bits)
+        rows = rows_of(bits, filters.n_rows)
+        truth = [set(nearest_rows(features, rows, q, K).tolist()) for q in queries]
+
+        runs = {
+            "post": lambda q: post_filter(engine, data, q, case),
+            "bits": lambda q: bits_filter(engine, filters, filters.mask(**case), selectivity, q),
+            "switch": lambda q: switch(engine, filters, case, q),
+        }
+        line = f"{label:<15} {selectivity:>7.4f}"
+        for name, run in runs.items():
+            latencies, hits = [], 0
+            for q, expected in zip(queries, truth):
+                start = time.perf_counter()
+                found = run(q)
+                latencies.append(time.perf_counter() - start)
+                hits += len(set(found.tolist()) & expected)
+            width = 10 if name == "switch" else 8
+            line += f" {np.median(latencies) * 1000:>{width}.2f} {hits / max(sum(map(len, truth)), 1):>7.3f}"
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+"""
+attach time and per-worker memory of N api workers holding the same model bundle:
+
+  copy  - spawned workers, every catalog column loaded into the worker (the old behaviour)
+  mmap  - spawned workers, numeric columns memory mapped from the bundle (CATALOG_SHARED=1)
+  fork  - loaded once in the parent and forked, like src.serve
+
+uss is what a worker holds alone, pss splits shared pages between the processes mapping them.
+
+    python -m benchmarks.bench_shared_catalog [n_songs] [n_workers]
+"""
+import gc
+import os
+import sys
+import time
+import tempfile
+import multiprocessing as mp
+
+import numpy as np
+import pandas as pd
+
+from src.model_store import build_bundle, load_bundle
+from src.reoc import SongLookup
+from src.utils import number_cols
+
+N_SONGS = 170_000
+N_WORKERS = 4
+N_QUERIES = 200
+
+
+def make_sources(directory: str, n_songs: int, n_genres: int = 300, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    songs = pd.DataFrame(rng.random((n_songs, len(number_cols))), columns=number_cols)
+    songs['year'] = rng.integers(1921, 2021, n_songs)
+    songs['duration_ms'] = rng.integers(90_000, 400_000, n_songs)
+    for col in ('explicit', 'mode'):
+        songs[col] = rng.integers(0, 2, n_songs)
+    songs['key'] = rng.integers(0, 12, n_songs)
+    songs['popularity'] = rng.integers(0, 101, n_songs)
+    songs['artists'] = [str([f"Artist {i % 30_000}", f"Feat {i % 997}"]) for i in range(n_songs)]
+    songs['id'] = [f"{i:022d}" for i in range(n_songs)]
+    songs['name'] = [f"Song number {i}" for i in range(n_songs)]
+    songs['release_date'] = [f"{y}-01-01" for y in songs['year']]
+
+    genre_cols = ['acousticness', 'danceability', 'duration_ms', 'energy', 'instrumentalness', 'liveness',
+                  'loudness', 'speechiness', 'tempo', 'valence', 'popularity', 'key', 'mode']
+    genres = pd.DataFrame(rng.random((n_genres, len(genre_cols))), columns=genre_cols)
+    genres['genres'] = [f"genre {i}" for i in range(n_genres)]
+
+    songs_csv, genres_csv = os.path.join(directory, "data.csv"), os.path.join(directory, "genres.csv")
+    songs.to_csv(songs_csv, index=False)
+    genres.to_csv(genres_csv, index=False)
+    return songs_csv, genres_csv
+
+
+def serve_like(bundle, lookup):
+    """what a request touches: seed lookup, feature rows, an ann query and the result metadata"""
+    rng = np.random.default_rng(os.getpid())
+    data = bundle.data
+    for i in rng.integers(0, len(data), N_QUERIES):
+        pos = lookup.get(data['name'].iat[i], int(data['year'].iat[i]))
+        center = data.iloc[[pos]][number_cols].to_numpy(dtype=np.float64).mean(axis=0)
+        idxs = bundle.annoy_index.get_nns_by_vector(np.asarray(bundle.features[pos]), 20)
+        data.iloc[idxs][['name', 'year', 'artists', 'predicted_genre']].to_dict(orient='records')
+    return center
+
+
+def memory() -> dict:
+    """rss, uss (private pages) and pss of this process from /proc/self/smaps_rollup, linux only"""
+    fields = {}
+    with open("/proc/self/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == "kB":
+                fields[parts[0].rstrip(":")] = int(parts[1]) * 1024
+    return {"rss": fields["Rss"], "pss": fields["Pss"],
+            "uss": fields["Private_Clean"] + fields["Private_Dirty"]}
+
+
+def spawned_worker(path, shared, results, release):
+    started = time.perf_counter()
+    bundle = load_bundle(path, shared=shared)
+    lookup = SongLookup(bundle.data)
+    attach = time.perf_counter() - started
+    serve_like(bundle, lookup)
+    results.put((attach, memory()))
+    release.wait()
+
+
+_preloaded = None
+
+
+def forked_worker(started, results, release):
+    bundle, lookup = _preloaded
+    attach = time.perf_counter() - started
+    serve_like(bundle, lookup)
+    results.put((attach, memory()))
+    release.wait()
+
+
+def run(mode: str, path: str, n_workers: int):
+    global _preloaded
+
+    ctx = mp.get_context("fork" if mode == "fork" else "spawn")
+    results, release = ctx.Queue(), ctx.Event()
+    if mode == "fork":
+        bundle = load_bundle(path, shared=True)
+        _preloaded = (bundle, SongLookup(bundle.data))
+        gc.collect()
+        gc.freeze()
+        procs = [ctx.Process(target=forked_worker, args=(time.perf_counter(), results, release))
+                 for _ in range(n_workers)]
+    else:
+        procs = [ctx.Process(target=spawned_worker, args=(path, mode == "mmap", results, release))
+                 for _ in range(n_workers)]
+
+    for p in procs:
+        p.start()
+    # everybody reports before anyone exits, so pss sees all the sharing processes
+    samples = [results.get() for _ in procs]
+    release.set()
+    for p in procs:
+        p.join()
+    if mode == "fork":
+        gc.unfreeze()
+        _preloaded = None
+
+    attach = np.mean([a for a, _ in samples])
+    mb = {k: np.mean([m[k] for _, m in samples]) / 2 ** 20 for k in ("rss", "uss", "pss")}
+    return attach, mb
+
+
+def main():
+    n_songs = int(sys.argv[1]) if len(sys.argv) > 1 else N_SONGS
+    n_workers = int(sys.argv[2]) if len(sys.argv) > 2 else N_WORKERS
+
+    with tempfile.TemporaryDirectory() as tmp:
+        songs_csv, genres_csv = make_sources(tmp, n_songs)
+        path = build_bundle(songs_csv, genres_csv, os.path.join(tmp, "artifacts"))
+
+        print(f"{n_songs} songs, {n_workers} workers")
+        print(f"{'mode':>6} {'attach s':>9} {'rss MB':>8} {'uss MB':>8} {'pss MB':>8} {'total pss MB':>13}")
+        for mode in ("copy", "mmap", "fork"):
+            attach, mb = run(mode, path, n_workers)
+            print(f"{mode:>6} {attach:>9.3f} {mb['rss']:>8.1f} {mb['uss']:>8.1f} {mb['pss']:>8.1f} "
+                  f"{mb['pss'] * n_workers:>13.1f}")
+
+
+if __name__ == "__main__":
+    main()
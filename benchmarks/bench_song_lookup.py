@@ -0,0 +1,53 @@
+"""
+per request seed resolution cost as the catalog grows, full boolean mask scan vs the (name, year) index.
+
+    python -m benchmarks.bench_song_lookup
+"""
+import time
+
+import numpy as np
+import pandas as pd
+
+from src.reoc import SongLookup, get_mean_vector
+from src.utils import number_cols
+
+CATALOG_SIZES = [10_000, 50_000, 170_000, 500_000]
+N_SEEDS = 50
+REPEATS = 5
+
+
+def make_catalog(n_rows: int, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    data = pd.DataFrame(rng.random((n_rows, len(number_cols))), columns=number_cols)
+    data['year'] = rng.integers(1921, 2021, n_rows)
+    data['name'] = [f"Song {i}" for i in range(n_rows)]
+    return data
+
+
+def time_it(fn, repeats: int = REPEATS) -> float:
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    print(f"{'catalog':>10} {'scan ms':>10} {'index ms':>10} {'index build s':>14}")
+    for n_rows in CATALOG_SIZES:
+        data = make_catalog(n_rows)
+        rows = np.random.default_rng(1).choice(n_rows, N_SEEDS, replace=False)
+        song_list = [{'name': data['name'].iat[i], 'year': int(data['year'].iat[i])} for i in rows]
+
+        start = time.perf_counter()
+        lookup = SongLookup(data)
+        build_s = time.perf_counter() - start
+
+        scan = time_it(lambda: get_mean_vector(song_list, data), repeats=1)
+        indexed = time_it(lambda: get_mean_vector(song_list, data, lookup))
+        print(f"{n_rows:>10} {scan * 1000:>10.1f} {indexed * 1000:>10.2f} {build_s:>14.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -27,7 +27,7 @@ CREATE TABLE music.songs (
 
 
 CREATE TABLE music.artists (
-    artist_id TEXT PRIMARY KEY,
+    artist_id TEXT NOT NULL,
     user_id TEXT NOT NULL,
     name VARCHAR(255) NOT NULL,
     genres TEXT[],
@@ -37,3 +37,41 @@ CREATE TABLE music.artists (
     PRIMARY KEY (artist_id, user_id)
 
 );
+
+
+-- song catalog the recommender is built from (python -m src.catalog import data/data.csv seeds it)
+CREATE TABLE music.song_features (
+    id TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    artists TEXT[] NOT NULL,
+    year INTEGER NOT NULL,
+    release_date TEXT,
+    valence DOUBLE PRECISION,
+    acousticness DOUBLE PRECISION,
+    danceability DOUBLE PRECISION,
+    duration_ms INTEGER,
+    energy DOUBLE PRECISION,
+    explicit SMALLINT,
+    instrumentalness DOUBLE PRECISION,
+    key SMALLINT,
+    liveness DOUBLE PRECISION,
+    loudness DOUBLE PRECISION,
+    mode SMALLINT,
+    popularity SMALLINT CHECK (popularity >= 0 AND popularity <= 100),
+    speechiness DOUBLE PRECISION,
+    tempo DOUBLE PRECISION,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+-- count(*) + max(updated_at) is the catalog fingerprint, both answered from this index
+CREATE INDEX song_features_updated_at ON music.song_features (updated_at);
+
+CREATE FUNCTION music.touch_updated_at() RETURNS TRIGGER AS $$
+BEGIN
+    NEW.updated_at = now();
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER song_features_touch BEFORE UPDATE ON music.song_features
+    FOR EACH ROW EXECUTE FUNCTION music.touch_updated_at();
@@ -1,166 +1,551 @@
 import os
 import pandas as pd
 import numpy as np
-import requests
-import redis
-import time 
+import json
+import threading
 
-from annoy import AnnoyIndex
 from fastapi import FastAPI, HTTPException, FastAPI, Request
-from fastapi.responses import RedirectResponse, JSONResponse
+from fastapi.responses import RedirectResponse, JSONResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from urllib.parse import urlencode
 
 from typing import List, Dict
-from sklearn.cluster import KMeans
-from sklearn.preprocessing import StandardScaler
-from sklearn.pipeline import Pipeline
-from sklearn.metrics.pairwise import cosine_similarity
-
-from src.reoc import flatten_dict_list, get_mean_vector
-from src.utils import number_cols, SongList, GenSongInput
-
-from src.song_Gen.murka_test import generate_song, upload_file_to_mureka
-from src.song_Gen.youTfileCreateor import download_songs_sample
-
-from src.database.postgres.index import get_db_conn, release_db_conn, close_db_pools ,insert_top_artists, init_db_pools
-from src.database.redis.index import get_redis
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from src.reoc import SongLookup, normalize_song_name, unique_seeds
+from src.model_store import load_or_build_bundle
+from src.rec_cache import RecommendationCache
+from src.partitions import GenrePartitions
+from src.vector_index import engine_from_bundle, build_engine
+from src.ingest import LiveIndex, prepare_tracks, ingested_version
+from src.artists import MAX_PER_ARTIST, cap_per_artist
+from src.store import CatalogStore
+from src.filters import CatalogFilters, FILTER_EXACT_SELECTIVITY, contains, rows_of
+from src.taste import TasteProfiles, artist_item, items_from_rows, empty_profile, fold_items, top_genres
+from src.utils import number_cols, SongList, SongListBatch, TrackBatch
+from src.profiling import STARTUP_PROFILE, phase, print_phases, startup_phases
+
+from src.database.postgres.index import close_db_pools, init_db_pools, pool_stats, fetch_user_artists, fetch_user_songs
+from src.database.postgres.write_behind import WriteBehindWriter, WriteBehindFull, ARTISTS, artist_row
+from src.database.redis.index import init_redis_pool, ping_redis, close_redis_pool
+from src.spotify import SpotifyClient, SpotifyError, SpotifyAuthError
 
 CLIENT_ID = os.getenv("CLIENT_ID")
 CLIENT_SECRET = os.getenv("CLIENT_SECRET")
 REDIRECT_URI = os.getenv("REDIRECT_URI")
 SCOPES = "user-top-read"
 
-# r = redis.Redis(host="localhost", port=6379, decode_responses=True)
+
+# the generation api is served here too unless SERVE_GENERATION=0, it also runs on its own as src.gen_app
+SERVE_GENERATION = os.getenv("SERVE_GENERATION", "1") == "1"
 
 app = FastAPI()
 
-annoy_index = None
-index_map = {}  # maps Annoy index ID to original DataFrame index
+generation = None
+if SERVE_GENERATION:
+    from src.song_Gen import service as generation
+    app.include_router(generation.router)
 
-# TODO move this def to utils (handle circular imports)
-def recommend_songs(song_list: List[Dict], spotify_data: pd.DataFrame, n_songs=10):
-    metadata_cols = ['name', 'year', 'artists', 'predicted_genre']
+spotify_client = SpotifyClient(CLIENT_ID, CLIENT_SECRET, REDIRECT_URI)
 
-    song_dict = flatten_dict_list(song_list) # => {'name': ['Blinding Lights', 'Bad Guy', 'Shape of You'], 'year': [2019, 2019, 2017]}
-    song_center = get_mean_vector(song_list, spotify_data)
+data = None  # the song catalog, a CatalogStore memory mapped from the bundle (see src/store.py)
+model_bundle = None  # the loaded ModelBundle, its sklearn pipeline is only unpickled for ingest
+song_scaler = None  # the pipeline's fitted scaler as arrays, scales query vectors without sklearn
+song_index = None  # LiveIndex over the ANN_BACKEND engine, ids are row positions in `data`
+model_version = None  # version of the loaded model bundle
+song_lookup = None  # (name, year) -> row position in `data`
+artist_index = None  # first_artist -> row positions and centroids, artist seeds, the per artist cap and taste joins
 
-    if song_center is None:
-        raise ValueError("None of the input songs were found in the database.")
+genre_partitions = None  # predicted_genre -> row positions, the genre filter
+catalog_filters = None  # bitsets over the rows of `data` for the request filters, see src/filters.py
+genre_model = None  # fitted genre scaler and vectors, to label ingested tracks
+ann_params = {}
+ingest_lock = threading.Lock()
 
-    input_songs_df = pd.DataFrame(song_list)
+artist_writer = None  # WriteBehindWriter for music.artists, drained by close_db_pools
 
-    merged = input_songs_df.merge(
-        spotify_data[['name', 'year', 'predicted_genre']],
-        on=['name', 'year'],
-        how='left'
+# "adaptive" searches the rows of a selective filter exactly (below FILTER_EXACT_SELECTIVITY of the
+# catalog) and otherwise widens the ann candidate pool in rounds until n_songs pass the filters,
+# "partitioned" always filters first and searches only the matching songs exactly
+ANN_BACKEND = os.getenv("ANN_BACKEND", "annoy")  # annoy | exact | ivf, see src/vector_index.py
+SEARCH_MODE = os.getenv("RECOMMEND_SEARCH_MODE", "adaptive")
+MAX_SEARCH_ROUNDS = int(os.getenv("RECOMMEND_MAX_SEARCH_ROUNDS", 5))
+SEARCH_EXPANSION = int(os.getenv("RECOMMEND_SEARCH_EXPANSION", 4))
+SEARCH_K_FACTOR = float(os.getenv("ANN_SEARCH_K_FACTOR", 0))
+
+BATCH_WORKERS = int(os.getenv("RECOMMEND_BATCH_WORKERS", min(32, (os.cpu_count() or 1) + 4)))
+
+recommendation_cache = RecommendationCache()
+taste_profiles = TasteProfiles()
+
+# TODO move this def to utils (handle circular imports)
+def recommend_songs(song_list: List[Dict], spotify_data: CatalogStore, n_songs=10, artists: List[str] = None,
+                    max_per_artist: int = None, constraints: Dict = None):
+    song_list, artists = unique_seeds(song_list, artists)
+    max_per_artist = MAX_PER_ARTIST if max_per_artist is None else max_per_artist
+    return recommendation_cache.get_or_compute(
+        song_list, n_songs,
+        lambda: _recommend_songs(song_list, spotify_data, n_songs, artists, max_per_artist, constraints),
+        options=_request_options(artists, max_per_artist, constraints),
     )
-    input_genres = merged['predicted_genre'].dropna().unique()### add  if teh songs is not in the init data pull it form sploify api 
 
-    if len(input_genres) == 0:
-        raise ValueError("Could not find genres for input songs.")
 
-    scaler = song_cluster_pipeline.named_steps['scaler']
-    query_vector = scaler.transform(song_center.reshape(1, -1))[0]
+def _request_options(artists: List[str], max_per_artist: int, constraints: Dict = None) -> Dict:
+    """the cache key part beyond the seed songs, empty for a plain song seeded request"""
+    options = {}
+    if artists:
+        options["artists"] = sorted({normalize_song_name(a) for a in artists})
+    if max_per_artist:
+        options["max_per_artist"] = max_per_artist
+    if constraints:
+        options["filters"] = constraints
+    return options
 
-    idxs = annoy_index.get_nns_by_vector(query_vector, n_songs + len(song_list) * 10)  # extra candidates
-    recs = spotify_data.iloc[idxs]
 
-    # Exclude input songs
-    recs = recs[~recs['name'].isin(song_dict['name'])]
+def _artist_seeds(artists: List[str], spotify_data: CatalogStore):
+    """artist ids of the seed artists that are in the catalog and the genres of their songs"""
+    artist_ids = [i for i in (artist_index.artist_id(a) for a in artists) if i is not None]
+    if not artist_ids:
+        return [], np.empty(0, dtype=object)
+    rows = np.concatenate([artist_index.positions(artist_index.names[i]) for i in artist_ids])
+    return artist_ids, _genres_of(spotify_data, rows[rows < len(spotify_data)])
 
-    # Filter recommendations by genre — only songs whose predicted_genre is in input genres
-    recs = recs[recs['predicted_genre'].isin(input_genres)]
 
-    return recs[metadata_cols].head(n_songs).to_dict(orient='records')
+def _genres_of(spotify_data: CatalogStore, rows: np.ndarray) -> np.ndarray:
+    return pd.unique(pd.Series(spotify_data.values('predicted_genre', rows)).dropna())
 
 
+def _seed_positions(song_list: List[Dict], spotify_data: CatalogStore) -> np.ndarray:
+    positions = song_lookup.positions(song_list)
+    # the lookup can already know rows ingested after this copy of the catalog was taken
+    return positions[positions < len(spotify_data)]
 
-@app.on_event("startup")
-def startup_event():
+
+def _with_artist_seeds(song_vector, n_song_seeds: int, artist_ids: List[int]):
+    """every seed weighs the same: the scaled mean of the seed songs and each seed artist's centroid"""
+    if not artist_ids:
+        return song_vector
+    parts = [artist_index.centroids[i] for i in artist_ids]
+    weights = [1] * len(artist_ids)
+    if n_song_seeds:
+        parts.append(song_vector)
+        weights.append(n_song_seeds)
+    return np.average(np.asarray(parts, dtype=np.float64), axis=0, weights=weights)
+
+
+def _recommend_songs(song_list: List[Dict], spotify_data: CatalogStore, n_songs=10, artists: List[str] = (),
+                     max_per_artist: int = 0, constraints: Dict = None):
+    # one dict lookup per seed instead of a scan of the whole catalog per seed
+    seeds = _seed_positions(song_list, spotify_data)
+    artist_ids, artist_genres = _artist_seeds(artists, spotify_data)
+
+    if not len(seeds) and not artist_ids:
+        raise ValueError("None of the input songs were found in the database." if not artists
+                         else "None of the input songs or artists were found in the database.")
+
+    input_genres = _genres_of(spotify_data, seeds)### add  if teh songs is not in the init data pull it form sploify api 
+    if len(artist_genres):
+        input_genres = pd.unique(np.concatenate([input_genres, artist_genres]))
+
+    if len(input_genres) == 0:
+        raise ValueError("Could not find genres for input songs.")
+
+    query_vector = None
+    if len(seeds):
+        song_center = spotify_data.numbers[seeds].mean(axis=0, dtype=np.float64)
+        query_vector = song_scaler.transform(song_center.reshape(1, -1))[0]
+    query_vector = _with_artist_seeds(query_vector, len(seeds), artist_ids)
+
+    return _recommend_from_vector(query_vector, spotify_data.names.take(seeds), input_genres, spotify_data, n_songs,
+                                  len(song_list) + len(artists), max_per_artist, constraints)
+
+
+def _search_k(n_candidates: int) -> int:
+    # annoy's default is n_candidates * n_trees, a smaller factor is faster and less exact.
+    # ivf reads it as a minimum scan size, exact ignores it
+    return int(n_candidates * SEARCH_K_FACTOR) if SEARCH_K_FACTOR > 0 else -1
+
+
+def _filter_bits(filters: CatalogFilters, input_genres, constraints: Dict = None) -> np.ndarray:
     """
-    here we do two things here two predictdict the genre of the songs and we create the annoy index for the songs simmlitifys
+    the request's filters as one bitset: the seeds' genres (or the requested ones) and whatever else
+    was asked for. discovery mode turns the genre filter around, anything but the seeds' genres
     """
+    constraints = dict(constraints or {})
+    genres = constraints.pop("genres", None)
+    if constraints.pop("discovery", False):
+        return filters.mask(genres=genres, exclude_genres=input_genres, **constraints)
+    return filters.mask(genres=input_genres if genres is None else genres, **constraints)
 
-    global data, song_cluster_pipeline, annoy_index, index_map
 
+def _not_seeds(spotify_data: CatalogStore, idxs: np.ndarray, seed_names) -> np.ndarray:
+    """drops candidates named like a seed song, only the candidates' names are decoded"""
+    seed_names = set(seed_names)
+    if not seed_names:
+        return idxs
+    keep = np.fromiter((name not in seed_names for name in spotify_data.names.take(idxs)), dtype=bool, count=len(idxs))
+    return idxs[keep]
 
-    init_db_pools()
 
-#   TODO read this from db and every time you pull a song you add it the data 
-    data = pd.read_csv("data/data.csv")
-    data["first_artist"] = data["artists"].apply(lambda x: eval(x)[0] if isinstance(x, str) else x)
+def _records(spotify_data: CatalogStore, rows: np.ndarray) -> List[Dict]:
+    return [record.as_dict() for record in spotify_data.records(rows)]
 
-    genre_df = pd.read_csv("data/data_by_genres.csv")
 
-    features = [
-        'acousticness', 'danceability', 'duration_ms', 'energy',
-        'instrumentalness', 'liveness', 'loudness', 'speechiness',
-        'tempo', 'valence', 'popularity', 'key', 'mode'
-    ]
+def _recommend_from_vector(query_vector, seed_names, input_genres, spotify_data: CatalogStore, n_songs: int, n_seeds: int,
+                           max_per_artist: int = 0, constraints: Dict = None):
+    """
+    a selective filter is searched exactly over just its rows, a loose one filters the ann candidates
+    by reading their bits. filtering, seed exclusion and the per artist cap work on candidate row
+    positions, only the rows that are returned are turned into records
+    """
+    row_artist = artist_index.row_artist
+    filters = catalog_filters
+    # rows ingested after this request grabbed `data` (or before the filters caught up) are left out
+    n_rows = min(len(spotify_data), filters.n_rows)
+
+    bits = _filter_bits(filters, input_genres, constraints)
+    selectivity = filters.selectivity(bits)
+
+    if SEARCH_MODE == "partitioned" or selectivity <= FILTER_EXACT_SELECTIVITY:
+        rows = rows_of(bits, filters.n_rows)
+        rows = rows[rows < n_rows]
+        n_candidates = n_songs + n_seeds
+        for _ in range(MAX_SEARCH_ROUNDS):
+            idxs = filters.nearest(query_vector, bits, n_candidates, rows=rows)
+            picked = cap_per_artist(_not_seeds(spotify_data, idxs, seed_names), row_artist, max_per_artist)
+            if len(picked) >= n_songs or len(idxs) < n_candidates:
+                break
+            n_candidates *= SEARCH_EXPANSION
+        return _records(spotify_data, picked[:n_songs])
+
+    n_items = song_index.get_n_items()
+    # extra candidates for the seeds, and enough that about n_songs of them pass the filters
+    n_candidates = min(int((n_songs + n_seeds * 10) / selectivity), n_items)
+    for _ in range(MAX_SEARCH_ROUNDS):
+        idxs = np.asarray(song_index.get_nns_by_vector(query_vector, n_candidates, search_k=_search_k(n_candidates)),
+                          dtype=np.int64)
+        idxs = idxs[idxs < n_rows]
+
+        # keep only songs that pass the filters, then exclude input songs
+        idxs = _not_seeds(spotify_data, idxs[contains(bits, idxs)], seed_names)
+        picked = cap_per_artist(idxs, row_artist, max_per_artist)
+
+        if len(picked) >= n_songs or n_candidates >= n_items:
+            break
+        # the filters left too few matches, widen the pool here instead of having the client retry
+        n_candidates = min(n_candidates * SEARCH_EXPANSION, n_items)
+
+    return _records(spotify_data, picked[:n_songs])
+
+
+def recommend_songs_batch(song_lists: List[List[Dict]], spotify_data: CatalogStore, n_songs=10, max_workers=BATCH_WORKERS,
+                          artists: List[List[str]] = None, max_per_artist: List[int] = None,
+                          constraints: List[Dict] = None):
+    """
+    recommend_songs for many seed lists at once. all seeds are resolved in one pass, all query
+    centers go through one scaler call and the ann queries fan out over a thread pool (annoy
+    releases the GIL). yields (i, recommendations) or (i, exception) as each list finishes, so
+    results come back out of order
+    """
+    if isinstance(n_songs, int):
+        n_songs = [n_songs] * len(song_lists)
+    artists = artists or [[] for _ in song_lists]
+    seeds = [unique_seeds(song_list, artists[i]) for i, song_list in enumerate(song_lists)]
+    song_lists = [songs for songs, _ in seeds]
+    artists = [seed_artists for _, seed_artists in seeds]
+    max_per_artist = [MAX_PER_ARTIST if cap is None else cap for cap in (max_per_artist or [None] * len(song_lists))]
+    constraints = constraints or [None] * len(song_lists)
+    options = [_request_options(artists[i], max_per_artist[i], constraints[i]) for i in range(len(song_lists))]
+
+    # cached lists are answered straight away, only the misses go through the pipeline. results are
+    # stored under the version they were computed for, an invalidate meanwhile drops them
+    cache_version = recommendation_cache.version
+    todo = []
+    for i, song_list in enumerate(song_lists):
+        cached = recommendation_cache.get(song_list, n_songs[i], options[i])
+        if cached is not None:
+            yield i, cached
+        else:
+            todo.append(i)
+    n_lists = len(todo)
+
+    per_list = [song_lookup.positions(song_lists[i]) for i in todo]
+    per_list = [pos[pos < len(spotify_data)] for pos in per_list]
+    owners = np.repeat(np.arange(n_lists), [len(pos) for pos in per_list])
+    seeds = np.concatenate(per_list) if per_list else np.empty(0, dtype=np.int64)
+
+    counts = np.bincount(owners, minlength=n_lists)
+    sums = np.zeros((n_lists, len(number_cols)))
+    np.add.at(sums, owners, spotify_data.numbers[seeds].astype(np.float64))
+
+    found = counts > 0
+    query_vectors = np.zeros_like(sums)
+    if found.any():
+        query_vectors[found] = song_scaler.transform(sums[found] / counts[found, None])
+
+    # seeds are grouped by owner, bounds[j]:bounds[j + 1] are the seed rows of list todo[j]
+    bounds = np.concatenate([[0], np.cumsum(counts)])
+    seed_names = np.array(spotify_data.names.take(seeds), dtype=object)
+    seed_genres = spotify_data.values('predicted_genre', seeds)
+
+    def run(j):
+        i = todo[j]
+        artist_ids, artist_genres = _artist_seeds(artists[i], spotify_data)
+        if not found[j] and not artist_ids:
+            raise ValueError("None of the input songs were found in the database." if not artists[i]
+                             else "None of the input songs or artists were found in the database.")
+        input_genres = pd.unique(pd.Series(np.concatenate([seed_genres[bounds[j]:bounds[j + 1]], artist_genres])).dropna())
+        if len(input_genres) == 0:
+            raise ValueError("Could not find genres for input songs.")
+        query_vector = _with_artist_seeds(query_vectors[j], counts[j], artist_ids)
+        recommendations = _recommend_from_vector(query_vector, seed_names[bounds[j]:bounds[j + 1]], input_genres,
+                                                 spotify_data, n_songs[i], len(song_lists[i]) + len(artists[i]),
+                                                 max_per_artist[i], constraints[i])
+        recommendation_cache.set(song_lists[i], n_songs[i], recommendations, options[i], version=cache_version)
+        return recommendations
+
+    pool = ThreadPoolExecutor(max_workers=max_workers)
+    try:
+        futures = {pool.submit(run, j): i for j, i in enumerate(todo)}
+        for future in as_completed(futures):
+            try:
+                yield futures[future], future.result()
+            except Exception as e:
+                yield futures[future], e
+    finally:
+        # a client that disconnects mid stream closes the generator, drop the queries nobody will read
+        pool.shutdown(wait=False, cancel_futures=True)
 
-    scaler_genre = StandardScaler()
-    scaled_song_features = scaler_genre.fit_transform(data[features])
-    scaled_genre_features = scaler_genre.transform(genre_df[features])
 
-    similarity_matrix = cosine_similarity(scaled_song_features, scaled_genre_features)
-    closest_genre_indices = np.argmax(similarity_matrix, axis=1)
-    data['predicted_genre'] = genre_df.iloc[closest_genre_indices]['genres'].values
 
-    # --- Clustering & Annoy index ---
-    song_cluster_pipeline = Pipeline([
-        ('scaler', StandardScaler()),
-        ('kmeans', KMeans(n_clusters=20, verbose=False))
-    ])
-    X = data[number_cols]
-    song_cluster_pipeline.fit(X)
-    data['cluster_label'] = song_cluster_pipeline.predict(X)
+@app.on_event("startup")
+def startup_event():
+    """
+    here we do two things here two predictdict the genre of the songs and we create the annoy index for the songs simmlitifys
+    """
 
-    scaler = song_cluster_pipeline.named_steps['scaler']
-    X_scaled = scaler.transform(X)
-    dim = X_scaled.shape[1]
-    annoy_index = AnnoyIndex(dim, 'euclidean')
+    global artist_writer
 
-    for i, vector in enumerate(X_scaled):
-        annoy_index.add_item(i, vector)
-        index_map[i] = i
 
-    annoy_index.build(n_trees=10)
-    print("✅ Annoy index built and genres assigned.")
+    with phase("postgres pools"):
+        init_db_pools()
+        artist_writer = WriteBehindWriter(ARTISTS)
+
+    # sessions, job state and the shared cache tiers live in redis (pool size: REDIS_MAX_CONNECTIONS).
+    # without a reachable redis the pool is dropped again and everything falls back to in-process state
+    with phase("redis pool"):
+        init_redis_pool()
+        if ping_redis():
+            print("✅ Redis pool ready.")
+        else:
+            print("Redis is not reachable, running without the shared tiers (Spotify login needs redis).")
+            close_redis_pool()
+
+    if generation is not None:
+        with phase("generation queue"):
+            generation.start()
+
+    # the genre assignment, kmeans and annoy index are fitted offline (python -m src.model_store build),
+    # here we only mmap the bundle and rebuild it if the catalog changed since it was built. the catalog is
+    # data/data.csv, or music.song_features with CATALOG_SOURCE=postgres (snapshotted on disk by src.catalog).
+    # under src.serve the model was already loaded once in the parent and this worker shares it
+    if model_version is None:
+        with phase("bundle load"):
+            bundle = load_or_build_bundle(frame=False)
+        load_model(bundle)
+    else:
+        print(f"✅ Model bundle {model_version} inherited from the loader process.")
+
+    if STARTUP_PROFILE:
+        print_phases()
+
+
+def load_model(bundle):
+    """puts a loaded ModelBundle into service, the catalog lookups and the live index are built on top of it"""
+    global data, model_bundle, song_scaler, song_index, model_version, song_lookup, artist_index, genre_partitions, genre_model
+    global ann_params, catalog_filters
+
+    data = bundle.store
+    model_bundle = bundle
+    song_scaler = bundle.scaler
+    # new tracks go into the live index's exact delta until it is compacted into a new main index
+    with phase("vector index"):
+        song_index = LiveIndex(engine_from_bundle(ANN_BACKEND, bundle), bundle.features, rebuild=_rebuild_index)
+    genre_model = bundle.genre_model
+    ann_params = {"n_trees": bundle.manifest["params"]["n_trees"]} if ANN_BACKEND == "annoy" else {}
+    model_version = bundle.version
+    with phase("song lookup"):
+        song_lookup = SongLookup(data)
+    with phase("artist index"):
+        artist_index = bundle.artists
+    with phase("genre partitions"):
+        genre_partitions = GenrePartitions(data['predicted_genre'], bundle.features)
+    with phase("catalog filters"):
+        catalog_filters = CatalogFilters(data, genre_partitions)
+    recommendation_cache.invalidate(model_version)
+    print(f"✅ Model bundle {model_version} loaded, serving with the {ANN_BACKEND} index.")
+
+def _rebuild_index(features: np.ndarray):
+    # compaction also folds the artists ingested since the last build into the centroid index
+    artist_index.rebuild_ann()
+    return build_engine(ANN_BACKEND, features, centroids=model_bundle.cluster_centers,
+                        labels=data.cluster_label[:len(features)], **ann_params)
+
+
+def ingest_tracks(tracks: pd.DataFrame) -> int:
+    """
+    adds new tracks to the running catalog without refitting or restarting: they are labelled with the
+    fitted models, appended to `data` and served from the live index delta right away.
+    tracks already in the catalog (same name and year) are skipped. returns how many were added
+    """
+    global data, genre_partitions, catalog_filters
+
+    with ingest_lock:
+        known = tracks.apply(lambda row: song_lookup.exact.get((row['name'], int(row['year']))) is not None, axis=1)
+        tracks = tracks[~known.astype(bool)].drop_duplicates(subset=['name', 'year'])
+        if tracks.empty:
+            return 0
+
+        rows, vectors = prepare_tracks(tracks, model_bundle.song_cluster_pipeline, genre_model)
+        start = len(data)
+        # the artist index is read by row position of any copy of `data`, so it grows first
+        artist_index.add(rows['first_artist'].to_numpy(), vectors, start)
+        # rows first, then the index, so an id coming out of the index always has a row
+        data = data.append(rows)
+        song_lookup.add(rows, start)
+        song_index.add(vectors)
+        genre_partitions = GenrePartitions(data['predicted_genre'], song_index.features())
+        catalog_filters = CatalogFilters(data, genre_partitions)
+        recommendation_cache.invalidate(ingested_version(recommendation_cache.version, rows))
+
+    print(f"✅ Ingested {len(rows)} tracks, {song_index.delta_size()} waiting for compaction.")
+    return len(rows)
+
+
+def user_taste(user_id: str, new_items: list = None) -> dict:
+    """
+    the user's taste profile, one cache read when it is current. it is built from their stored top
+    artists and tracks the first time (and after a model change), later top items are folded into it.
+    the update is one transaction on the stored profile, concurrent updates of a user don't lose items
+    """
+    spotify_data = data
+    profile = taste_profiles.get(user_id)
+    if profile is not None and profile["version"] == model_version and not new_items:
+        return profile
+
+    def change(stored, seen):
+        # profiles written before the folded ids moved to their own set still list them, start those over
+        if stored is None or stored["version"] != model_version or "items" in stored:
+            profile = empty_profile(model_version)
+            try:
+                stored_items = items_from_rows(fetch_user_artists(user_id), fetch_user_songs(user_id))
+            except Exception as e:
+                if not new_items:
+                    raise
+                # the new items alone still make a profile, the stored ones are picked up on the next build
+                print(f"Could not read stored top items for {user_id}: {e}")
+                stored_items = []
+            new_ids = fold_items(profile, stored_items + (new_items or []), spotify_data, song_lookup,
+                                 artist_index, song_scaler)
+            return profile, new_ids, True
+        items = new_items or []  # none when another worker built the profile since our read
+        new_ids = fold_items(stored, items, spotify_data, song_lookup, artist_index, song_scaler,
+                             seen(item["id"] for item in items))
+        return (stored, new_ids, False) if new_ids else None
+
+    return taste_profiles.update(user_id, change)
+
 
 @app.get("/health")
 def health_check():
-    if data is not None and annoy_index is not None:
+    if data is not None and song_index is not None:
         return {"status": "ok"}
     return {"status": "unhealthy"}, 500
 
 
+@app.get("/metrics")
+def metrics():
+    return {
+        "recommendation_cache": recommendation_cache.stats(),
+        "generation_queue": generation.stats() if generation else None,
+        "startup_phases": startup_phases(),
+        "sessions": spotify_client.sessions.stats(),
+        "artist_writer": artist_writer.stats() if artist_writer else None,
+        "postgres_pool": pool_stats(),
+        "taste_profiles": taste_profiles.stats(),
+        "catalog_filters_bytes": catalog_filters.memory_bytes() if catalog_filters else None,
+        "catalog_store_bytes": data.nbytes if data is not None else None,
+    }
+
+
 @app.post("/recommend")
 def recommend(song_input: SongList):
     try:
         input_songs = [song.dict() for song in song_input.songs]
-        recommendations = recommend_songs(input_songs, data, song_input.n_songs)
+        recommendations = recommend_songs(input_songs, data, song_input.n_songs, song_input.artists,
+                                          song_input.max_per_artist, song_input.constraints())
         return {"recommendations": recommendations}
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
-@app.post("/genSong")
-def gen_song(input_data: GenSongInput):
+@app.get("/recommend/me")
+def recommend_me(user_id: str, n_songs: int = 10):
+    """recommendations from the user's stored spotify top artists and tracks, no seed songs needed"""
     try:
-        if input_data.youTube_link:
-            download_songs_sample(youtube_url=input_data.youTube_link)
-            ref_id = upload_file_to_mureka()
-            result = generate_song(lyricsPrompt=input_data.lyric_prompt,
-                prompt=input_data.song_prompt,
-                reference_id=ref_id
-            )
-        else:
-            result = generate_song(
-                lyricsPrompt=input_data.lyric_prompt,
-                prompt=input_data.song_prompt
-            )
-        return {"status": "success", "generated_song": result}
+        profile = user_taste(user_id)
+    except Exception as e:
+        raise HTTPException(status_code=503, detail=f"Could not load the user's top items: {e}")
+    if not profile["count"]:
+        raise HTTPException(status_code=404, detail="None of the user's top artists or tracks are in the catalog, "
+                                                    "call /top-artists first.")
+
+    genres = top_genres(profile)
+    recommendations = _recommend_from_vector(np.asarray(profile["vector"], dtype=np.float32), profile["exclude"],
+                                             genres, data, n_songs, min(profile["count"], 10))
+    return {"recommendations": recommendations, "genres": genres}
+
+@app.post("/recommend/batch")
+def recommend_batch(batch_input: SongListBatch):
+    """streams one NDJSON line per song list, in completion order, tagged with its index in the request"""
+    song_lists = [[song.dict() for song in song_input.songs] for song_input in batch_input.requests]
+    n_songs = [song_input.n_songs for song_input in batch_input.requests]
+    artists = [song_input.artists for song_input in batch_input.requests]
+    max_per_artist = [song_input.max_per_artist for song_input in batch_input.requests]
+    constraints = [song_input.constraints() for song_input in batch_input.requests]
+
+    def stream():
+        for i, result in recommend_songs_batch(song_lists, data, n_songs, artists=artists, max_per_artist=max_per_artist,
+                                               constraints=constraints):
+            if isinstance(result, Exception):
+                line = {"index": i, "error": str(result)}
+            else:
+                line = {"index": i, "recommendations": result}
+            yield json.dumps(line) + "\n"
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+@app.get("/artists/similar")
+def similar_artists(name: str, n: int = 10):
+    """artists whose songs sound closest to `name`'s on average, from the artist centroid index"""
+    similar = artist_index.similar(name, n)
+    if similar is None:
+        raise HTTPException(status_code=404, detail=f"Unknown artist {name!r}")
+    return {"artist": artist_index.names[artist_index.artist_id(name)], "similar": similar}
+
+@app.post("/catalog/tracks")
+def add_tracks(track_input: TrackBatch):
+    tracks = pd.DataFrame([track.dict() for track in track_input.tracks])
+    try:
+        added = ingest_tracks(tracks)
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"added": added, "n_items": song_index.get_n_items(), "delta_size": song_index.delta_size()}
+
+
+@app.post("/catalog/compact")
+def compact_catalog():
+    song_index.compact_in_background()
+    return {"status": "compacting", "delta_size": song_index.delta_size()}
 
 @app.get("/login")
 def login():
@@ -175,68 +560,54 @@ def login():
 
 
 @app.get("/callback")
-def callback(request: Request, code: str):
-    token_url = "https://accounts.spotify.com/api/token"
-    payload = {
-        "grant_type": "authorization_code",
-        "code": code,
-        "redirect_uri": REDIRECT_URI,
-        "client_id": CLIENT_ID,
-        "client_secret": CLIENT_SECRET
-    }
-
-    res = requests.post(token_url, data=payload)
-    if res.status_code != 200:
+async def callback(request: Request, code: str):
+    try:
+        token_info = await spotify_client.exchange_code(code)
+    except SpotifyError:
         return JSONResponse(status_code=400, content={"error": "Token exchange failed"})
 
-    token_info = res.json()
-    access_token = token_info["access_token"]
-    refresh_token = token_info.get("refresh_token")
-    expires_in = token_info["expires_in"]
-
-    user_res = requests.get("https://api.spotify.com/v1/me", headers={
-        "Authorization": f"Bearer {access_token}"
-    })
-    user_info = user_res.json()
+    try:
+        user_info = await spotify_client.get_me(token_info["access_token"])
+    except SpotifyError as e:
+        return JSONResponse(status_code=502, content={"error": str(e)})
     user_id = user_info["id"]
 
-    redis_con = get_redis() # redis client 
-
-    redis_con.set(f"spotify:{user_id}:access_token", access_token)
-    redis_con.set(f"spotify:{user_id}:refresh_token", refresh_token)
-    redis_con.set(f"spotify:{user_id}:expires_at", str(int(time.time()) + expires_in - 10))
+    # one MULTI with the whole session hash and its ttl
+    await run_in_threadpool(spotify_client.store_tokens, user_id, token_info)
 
     return JSONResponse(content={"message": "Login successful", "user_id": user_id})
 
 
 @app.get("/top-artists")
-def get_top_artists(user_id: str):
-    redis_con = get_redis()
-    access_token = redis_con.get(f"spotify:{user_id}:access_token")
-    
-    if not access_token:
-        return JSONResponse(status_code=401, content={"error": "User not authenticated"})
-
-    headers = {"Authorization": f"Bearer {access_token}"}
-    res = requests.get("https://api.spotify.com/v1/me/top/artists", headers=headers)
-
-    if res.status_code == 401:
-        return JSONResponse(status_code=401, content={"error": "Token expired or invalid"})
-
+async def get_top_artists(user_id: str):
+    try:
+        top_artists = await spotify_client.get_top_artists(user_id)
+    except SpotifyAuthError as e:
+        return JSONResponse(status_code=401, content={"error": e.message})
+    except SpotifyError as e:
+        return JSONResponse(status_code=502, content={"error": str(e)})
 
-    artist_data = res.json().get("items", [])
+    artist_data = top_artists.get("items", [])
 
+    # written behind in batches by artist_writer, only a full buffer holds the response up
+    try:
+        await run_in_threadpool(artist_writer.submit, [artist_row(user_id, artist) for artist in artist_data])
+    except WriteBehindFull as e:
+        return JSONResponse(status_code=503, content={"error": str(e)}, headers={"Retry-After": "5"})
 
+    # the taste profile takes the new artists right away, the rows above may still be buffered
     try:
-        conn = get_db_conn()
-        insert_top_artists(user_id, artist_data, conn)
-        release_db_conn(conn)
+        await run_in_threadpool(user_taste, user_id, [artist_item(a['id'], a['name']) for a in artist_data])
     except Exception as e:
-        return JSONResponse(status_code=500, content={"error": f"DB insert failed: {str(e)}"})
+        print(f"Could not update the taste profile of {user_id}: {e}")
 
-    return res.json()
+    return top_artists
 
 
 @app.on_event("shutdown")
-def shutdown():
-    close_db_pools()
\ No newline at end of file
+async def shutdown():
+    close_db_pools()
+    if generation is not None:
+        generation.stop()
+    await spotify_client.close()
+    close_redis_pool()
\ No newline at end of file
@@ -0,0 +1,219 @@
+import os
+
+from typing import List, Optional
+
+import numpy as np
+import pandas as pd
+
+from annoy import AnnoyIndex
+
+from src.reoc import normalize_song_name
+from src.store import StringTable
+from src.vector_index import AnnoyEngine, build_engine, top_n
+
+# the centroid index is small (one vector per artist), annoy or exact
+ARTIST_ANN_BACKEND = os.getenv("ARTIST_ANN_BACKEND", "annoy")
+ARTIST_ANN_TREES = int(os.getenv("ARTIST_ANN_TREES", 10))
+# default per artist cap on a recommendation list, 0 is no cap
+MAX_PER_ARTIST = int(os.getenv("RECOMMEND_MAX_PER_ARTIST", 0))
+
+
+class ArtistIndex:
+    """
+    the catalog by first_artist: row positions per artist, each artist's centroid (mean of the
+    scaled features of their rows) and an ann index over the centroids. row_artist holds the artist
+    id of every catalog row (-1 for rows without one), so per artist logic is plain array indexing.
+    names are matched case, unicode form and whitespace insensitive, like song names in SongLookup.
+    built offline into the model bundle (save / load), ingest only updates the sums and counts and
+    the centroid index is rebuilt with the next compaction (rebuild_ann)
+    """
+
+    def __init__(self, first_artists: np.ndarray, features: np.ndarray, backend: str = ARTIST_ANN_BACKEND,
+                 n_trees: int = ARTIST_ANN_TREES):
+        self.backend = backend
+        self.n_trees = n_trees
+        self.names = []  # artist id -> name as first seen in the catalog
+        self._ids = {}  # normalized name -> artist id
+        # row positions by artist: order[bounds[i]:bounds[i + 1]] for the rows indexed at build time,
+        # rows added later in _added
+        self._order = np.empty(0, dtype=np.int64)
+        self._bounds = np.zeros(1, dtype=np.int64)
+        self._added = {}
+        self.row_artist = np.empty(0, dtype=np.int32)
+        self._sums = np.zeros((0, features.shape[1]))
+        self.counts = np.zeros(0, dtype=np.int64)
+        self.centroids = np.zeros((0, features.shape[1]), dtype=np.float32)
+        # (centroid index, number of artists it covers), swapped whole like LiveIndex's state
+        self._ann = (None, 0)
+        self.add(first_artists, features)
+        self.rebuild_ann()
+
+    def add(self, first_artists: np.ndarray, features: np.ndarray, start: int = None):
+        """
+        indexes rows appended to the catalog at row position `start` (the end of what is indexed),
+        with their scaled feature vectors. only the touched artists' centroids are recomputed, the
+        centroid index is not rebuilt: nearest() searches artists added since exactly
+        """
+        start = len(self.row_artist) if start is None else start
+        if start != len(self.row_artist):
+            raise ValueError(f"rows must be added in order, expected position {len(self.row_artist)}, got {start}")
+
+        artists = pd.Series(first_artists, dtype=object)
+        keys = artists.map(lambda a: normalize_song_name(a) if isinstance(a, str) else None)
+        codes, uniques = pd.factorize(keys, use_na_sentinel=True)
+
+        ids = np.empty(len(uniques), dtype=np.int32)
+        first_row = pd.Series(np.arange(len(codes))).groupby(codes).first()
+        for code, key in enumerate(uniques):
+            artist_id = self._ids.get(key)
+            if artist_id is None:
+                artist_id = self._ids[key] = len(self.names)
+                self.names.append(artists.iat[first_row[code]])
+            ids[code] = artist_id
+        row_artist = np.where(codes >= 0, ids[np.maximum(codes, 0)] if len(ids) else -1, -1).astype(np.int32)
+
+        n_artists = len(self.names)
+        vectors = np.asarray(features, dtype=np.float64)
+        has_artist = row_artist >= 0
+        # new arrays rather than in place updates, readers (and a running rebuild_ann) keep a consistent view
+        sums = np.zeros((n_artists, vectors.shape[1]))
+        sums[:len(self._sums)] = self._sums
+        for dim in range(vectors.shape[1]):
+            sums[:, dim] += np.bincount(row_artist[has_artist], weights=vectors[has_artist, dim], minlength=n_artists)
+        counts = np.zeros(n_artists, dtype=np.int64)
+        counts[:len(self.counts)] = self.counts
+        counts += np.bincount(row_artist[has_artist], minlength=n_artists)
+
+        order = np.argsort(row_artist, kind="stable")
+        bounds = np.searchsorted(row_artist[order], np.arange(n_artists + 1))
+        touched = np.flatnonzero(bounds[1:] > bounds[:-1])
+        if len(self.row_artist) == 0:
+            self._order, self._bounds = order[bounds[0]:] + start, bounds - bounds[0]
+        else:
+            for artist_id in touched:
+                rows = order[bounds[artist_id]:bounds[artist_id + 1]] + start
+                added = self._added.get(artist_id)
+                self._added[artist_id] = rows if added is None else np.concatenate([added, rows])
+
+        centroids = np.zeros((n_artists, vectors.shape[1]), dtype=np.float32)
+        centroids[:len(self.centroids)] = self.centroids
+        centroids[touched] = sums[touched] / counts[touched, None]
+
+        self._sums, self.counts = sums, counts
+        self.centroids = centroids
+        self.row_artist = np.concatenate([self.row_artist, row_artist])
+
+    def rebuild_ann(self):
+        """a new centroid index over every artist so far, built to the side and swapped in"""
+        centroids = self.centroids
+        params = {"n_trees": self.n_trees} if self.backend == "annoy" else {}
+        self._ann = (build_engine(self.backend, centroids, **params) if len(centroids) else None, len(centroids))
+
+    def save(self, directory: str):
+        os.makedirs(directory, exist_ok=True)
+        if self._added:
+            raise ValueError("only a freshly built index is saved, rows were added to this one")
+        np.save(os.path.join(directory, "row_artist.npy"), self.row_artist)
+        np.save(os.path.join(directory, "sums.npy"), self._sums)
+        np.save(os.path.join(directory, "counts.npy"), self.counts)
+        np.save(os.path.join(directory, "centroids.npy"), self.centroids)
+        np.save(os.path.join(directory, "order.npy"), self._order)
+        np.save(os.path.join(directory, "bounds.npy"), self._bounds)
+        keys = [None] * len(self._ids)
+        for key, artist_id in self._ids.items():
+            keys[artist_id] = key
+        StringTable.from_strings(self.names).save(directory, "names")
+        StringTable.from_strings(keys).save(directory, "keys")
+        ann = self._ann[0]
+        if isinstance(ann, AnnoyEngine):
+            ann.index.save(os.path.join(directory, "centroids.ann"))
+
+    @classmethod
+    def load(cls, directory: str, mmap: bool = False, backend: str = ARTIST_ANN_BACKEND,
+             n_trees: int = ARTIST_ANN_TREES) -> "ArtistIndex":
+        """the saved index with its arrays (and annoy centroid index) memory mapped, nothing is recomputed"""
+        mode = "r" if mmap else None
+        index = cls.__new__(cls)
+        index.backend = backend
+        index.n_trees = n_trees
+        index.names = StringTable.load(directory, "names").to_list()
+        index._ids = {key: artist_id for artist_id, key in enumerate(StringTable.load(directory, "keys").to_list())}
+        index._order = np.load(os.path.join(directory, "order.npy"), mmap_mode=mode)
+        index._bounds = np.load(os.path.join(directory, "bounds.npy"), mmap_mode=mode)
+        index._added = {}
+        index.row_artist = np.load(os.path.join(directory, "row_artist.npy"), mmap_mode=mode)
+        index._sums = np.load(os.path.join(directory, "sums.npy"), mmap_mode=mode)
+        index.counts = np.load(os.path.join(directory, "counts.npy"), mmap_mode=mode)
+        index.centroids = np.load(os.path.join(directory, "centroids.npy"), mmap_mode=mode)
+
+        ann_path = os.path.join(directory, "centroids.ann")
+        if backend == "annoy" and os.path.exists(ann_path):
+            ann = AnnoyIndex(index.centroids.shape[1], "euclidean")
+            ann.load(ann_path)  # mmap, like songs.ann
+            index._ann = (AnnoyEngine(ann, path=ann_path), len(index.centroids))
+        else:
+            index.rebuild_ann()
+        return index
+
+    def __len__(self):
+        return len(self.names)
+
+    def artist_id(self, name: str) -> Optional[int]:
+        return self._ids.get(normalize_song_name(name)) if isinstance(name, str) else None
+
+    def positions(self, name: str) -> np.ndarray:
+        artist_id = self.artist_id(name)
+        if artist_id is None:
+            return np.empty(0, dtype=np.int64)
+        built = self._order[self._bounds[artist_id]:self._bounds[artist_id + 1]] \
+            if artist_id + 1 < len(self._bounds) else np.empty(0, dtype=np.int64)
+        added = self._added.get(artist_id)
+        return np.asarray(built) if added is None else np.concatenate([built, added])
+
+    def centroid(self, name: str) -> Optional[np.ndarray]:
+        artist_id = self.artist_id(name)
+        return self.centroids[artist_id] if artist_id is not None else None
+
+    def nearest(self, vector, n: int) -> List[tuple]:
+        """(artist id, distance) of the n artists whose centroids are closest to vector"""
+        ann, n_indexed = self._ann
+        centroids = self.centroids
+        vector = np.asarray(vector, dtype=np.float32)
+        ids = np.asarray(ann.get_nns_by_vector(vector, min(n, n_indexed)) if ann is not None else [], dtype=np.int64)
+        # artists added since the last build are searched exactly, like LiveIndex's delta, and every
+        # candidate is ranked by its current centroid
+        ids = np.concatenate([ids, np.arange(n_indexed, len(centroids))])
+        if len(ids) == 0:
+            return []
+        diff = centroids[ids] - vector
+        dists = np.sqrt(np.einsum("ij,ij->i", diff, diff))
+        top = top_n(dists[None, :], min(n, len(ids)))[0]
+        return list(zip(ids[top].tolist(), dists[top].tolist()))
+
+    def similar(self, name: str, n: int = 10) -> Optional[List[dict]]:
+        """the n artists closest to `name`, None for an artist that is not in the catalog"""
+        artist_id = self.artist_id(name)
+        if artist_id is None:
+            return None
+        found = self.nearest(self.centroids[artist_id], n + 1)
+        return [{"name": self.names[i], "songs": int(self.counts[i]), "distance": round(float(d), 4)}
+                for i, d in found if i != artist_id][:n]
+
+
+def cap_per_artist(positions: np.ndarray, row_artist: np.ndarray, max_per_artist: int) -> np.ndarray:
+    """
+    positions in their order with at most max_per_artist rows per artist, rows without an artist
+    are never capped. one stable sort over the candidates, no per row python
+    """
+    positions = np.asarray(positions, dtype=np.int64)
+    if not max_per_artist or len(positions) == 0:
+        return positions
+
+    ids = row_artist[positions]
+    order = np.argsort(ids, kind="stable")
+    sorted_ids = ids[order]
+    group_start = np.r_[0, np.flatnonzero(sorted_ids[1:] != sorted_ids[:-1]) + 1]
+    group_sizes = np.diff(np.r_[group_start, len(ids)])
+    rank = np.empty(len(ids), dtype=np.int64)
+    rank[order] = np.arange(len(ids)) - np.repeat(group_start, group_sizes)
+    return positions[(rank < max_per_artist) | (ids < 0)]
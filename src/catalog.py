@@ -0,0 +1,241 @@
+import os
+import ast
+import sys
+import json
+import shutil
+import hashlib
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from typing import Callable
+
+from src.database.postgres import index
+from src.database.postgres.write_behind import TableSpec, upsert_batch
+
+# where the song catalog comes from: "csv" (SONGS_CSV) or "postgres" (music.song_features)
+CATALOG_SOURCE = os.getenv("CATALOG_SOURCE", "csv")
+CATALOG_SNAPSHOT_DIR = os.getenv("CATALOG_SNAPSHOT_DIR", "artifacts/catalog")
+# rows per round trip of the server side cursor, and per COPY batch on import
+CATALOG_FETCH_ROWS = int(os.getenv("CATALOG_FETCH_ROWS", 20_000))
+
+# data/data.csv columns, in file order
+CATALOG_COLUMNS = [
+    'valence', 'year', 'acousticness', 'artists', 'danceability', 'duration_ms', 'energy', 'explicit', 'id',
+    'instrumentalness', 'key', 'liveness', 'loudness', 'mode', 'name', 'popularity', 'release_date',
+    'speechiness', 'tempo',
+]
+
+SONG_FEATURES = TableSpec("music.song_features", tuple(CATALOG_COLUMNS), ("id",))
+
+_STRING_SEP = "\x00"
+
+
+def parse_artists(value) -> list:
+    """
+    "['A', 'B']" -> ["A", "B"]. literal_eval only accepts python literals, so a malformed or
+    hostile row raises ValueError instead of running code like eval did
+    """
+    if isinstance(value, (list, tuple)):
+        return list(value)
+    if not isinstance(value, str):
+        return []
+    try:
+        parsed = ast.literal_eval(value)
+    except (ValueError, SyntaxError) as e:
+        raise ValueError(f"not an artist list: {value[:80]!r}") from e
+    if isinstance(parsed, str):
+        return [parsed]
+    if not isinstance(parsed, (list, tuple)):
+        raise ValueError(f"not an artist list: {value[:80]!r}")
+    return [str(a) for a in parsed]
+
+
+def first_artists(artists: pd.Series) -> pd.Series:
+    """first_artist for a whole column, every distinct artists string is parsed once"""
+    firsts = {}
+    for value in pd.unique(artists.dropna()):
+        parsed = parse_artists(value)
+        firsts[value] = parsed[0] if parsed else None
+    return artists.map(firsts).astype(object)
+
+
+def save_columns(directory: str, df: pd.DataFrame) -> list:
+    """
+    one file per column: numeric columns as .npy, strings as a NUL separated utf8 blob and a null
+    mask. returns the column list load_columns needs
+    """
+    os.makedirs(directory, exist_ok=True)
+    columns = []
+    for col in df.columns:
+        values = df[col]
+        if pd.api.types.is_numeric_dtype(values) or pd.api.types.is_bool_dtype(values):
+            np.save(os.path.join(directory, f"{col}.npy"), values.to_numpy())
+            columns.append({"name": col, "kind": "numeric"})
+            continue
+
+        nulls = values.isna().to_numpy()
+        strings = ["" if is_null else str(v).replace(_STRING_SEP, "") for v, is_null in zip(values, nulls)]
+
+        # each string is NUL terminated so load_columns splits the blob in one go
+        with open(os.path.join(directory, f"{col}.utf8"), "wb") as f:
+            f.write(_STRING_SEP.join(strings).encode("utf-8") + _STRING_SEP.encode())
+        np.save(os.path.join(directory, f"{col}.nulls.npy"), nulls)
+        columns.append({"name": col, "kind": "string"})
+    return columns
+
+
+def load_columns(directory: str, columns: list, mmap: bool = False) -> pd.DataFrame:
+    """
+    with mmap=True the numeric columns are read only views of the files, every process that loads
+    the same directory shares their pages. strings are always decoded into this process
+    """
+    loaded = {}
+    for column in columns:
+        col = column["name"]
+        if column["kind"] == "numeric":
+            loaded[col] = np.load(os.path.join(directory, f"{col}.npy"), mmap_mode="r" if mmap else None)
+            continue
+
+        with open(os.path.join(directory, f"{col}.utf8"), "rb") as f:
+            strings = f.read().decode("utf-8").split(_STRING_SEP)[:-1]
+        nulls = np.load(os.path.join(directory, f"{col}.nulls.npy"))
+        values = np.array(strings, dtype=object)
+        values[nulls] = np.nan
+        loaded[col] = values
+    # copy=False keeps every column its own block, a consolidated frame would copy the mapped arrays
+    return pd.DataFrame(loaded, copy=False)
+
+
+def read_csv_catalog(songs_csv: str) -> pd.DataFrame:
+    data = pd.read_csv(songs_csv)
+    data["first_artist"] = first_artists(data["artists"])
+    return data
+
+
+def catalog_fingerprint(conn) -> str:
+    """
+    cheap change detector for music.song_features: row count plus the newest updated_at
+    (a trigger bumps it on every update), so a boot only pulls the table when it changed
+    """
+    with conn.cursor() as cur:
+        cur.execute("SELECT count(*), max(updated_at) FROM music.song_features")
+        count, updated_at = cur.fetchone()
+    payload = json.dumps({"rows": count, "updated_at": str(updated_at), "columns": CATALOG_COLUMNS})
+    return hashlib.sha256(payload.encode()).hexdigest()[:16]
+
+
+def fetch_catalog(conn, chunk_rows: int = CATALOG_FETCH_ROWS) -> pd.DataFrame:
+    """
+    pulls music.song_features through a server side cursor, chunk_rows per round trip, so neither
+    side materialises the whole result set as one python list
+    """
+    chunks = []
+    with conn.cursor(name="catalog_fetch") as cur:
+        cur.itersize = chunk_rows
+        cur.execute(f"SELECT {', '.join(CATALOG_COLUMNS)} FROM music.song_features ORDER BY id")
+        while True:
+            rows = cur.fetchmany(chunk_rows)
+            if not rows:
+                break
+            chunks.append(pd.DataFrame.from_records(rows, columns=CATALOG_COLUMNS))
+    conn.commit()  # closes the named cursor's transaction
+
+    data = pd.concat(chunks, ignore_index=True) if chunks else pd.DataFrame(columns=CATALOG_COLUMNS)
+    # artists come back as a text[] already, no parsing. the catalog keeps the csv representation
+    data["first_artist"] = data["artists"].map(lambda a: a[0] if a else None).astype(object)
+    data["artists"] = data["artists"].map(lambda a: str(list(a)) if a is not None else None).astype(object)
+    return data
+
+
+def save_snapshot(data: pd.DataFrame, fingerprint: str, snapshot_dir: str = CATALOG_SNAPSHOT_DIR) -> str:
+    """writes <snapshot_dir>/<fingerprint>/ atomically and drops older snapshots"""
+    os.makedirs(snapshot_dir, exist_ok=True)
+    final_path = os.path.join(snapshot_dir, fingerprint)
+    tmp_path = os.path.join(snapshot_dir, f".{fingerprint}.tmp-{os.getpid()}")
+    shutil.rmtree(tmp_path, ignore_errors=True)
+
+    columns = save_columns(tmp_path, data)
+    with open(os.path.join(tmp_path, "manifest.json"), "w") as f:
+        json.dump({"fingerprint": fingerprint, "n_rows": len(data), "columns": columns}, f, indent=2)
+    try:
+        os.rename(tmp_path, final_path)
+    except OSError:
+        # another worker wrote the same snapshot first
+        shutil.rmtree(tmp_path, ignore_errors=True)
+
+    for name in os.listdir(snapshot_dir):
+        if name != fingerprint and not name.startswith("."):
+            shutil.rmtree(os.path.join(snapshot_dir, name), ignore_errors=True)
+    return final_path
+
+
+def load_snapshot(fingerprint: str, snapshot_dir: str = CATALOG_SNAPSHOT_DIR):
+    path = os.path.join(snapshot_dir, fingerprint)
+    try:
+        with open(os.path.join(path, "manifest.json")) as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        return None
+    return load_columns(path, manifest["columns"])
+
+
+def load_postgres_catalog(snapshot_dir: str = None, chunk_rows: int = CATALOG_FETCH_ROWS,
+                          connection: Callable = None):
+    """
+    the catalog from music.song_features, served from the on-disk snapshot while the table's
+    fingerprint is unchanged. returns (data, fingerprint). both are read in one repeatable read
+    transaction, the fingerprint is the one of exactly the rows returned even with writes going on
+    """
+    snapshot_dir = snapshot_dir or CATALOG_SNAPSHOT_DIR
+    connection = connection or index.connection
+    with connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ READ ONLY")
+        fingerprint = catalog_fingerprint(conn)
+        data = load_snapshot(fingerprint, snapshot_dir)
+        if data is not None:
+            conn.commit()
+            return data, fingerprint
+        data = fetch_catalog(conn, chunk_rows)
+
+    save_snapshot(data, fingerprint, snapshot_dir)
+    print(f"✅ Catalog snapshot {fingerprint} written ({len(data)} songs).")
+    return data, fingerprint
+
+
+def import_csv(songs_csv: str, chunk_rows: int = CATALOG_FETCH_ROWS, transaction: Callable = None) -> int:
+    """seeds / refreshes music.song_features from a data.csv style file, COPY + upsert per chunk"""
+    transaction = transaction or index.transaction
+    written = 0
+    for chunk in pd.read_csv(songs_csv, chunksize=chunk_rows):
+        chunk = chunk[CATALOG_COLUMNS].astype(object).where(chunk[CATALOG_COLUMNS].notna(), None)
+        chunk["artists"] = chunk["artists"].map(parse_artists)
+        with transaction() as conn:
+            written += upsert_batch(conn, SONG_FEATURES, list(chunk.itertuples(index=False, name=None)))
+    return written
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="manage the song catalog in postgres")
+    sub = parser.add_subparsers(dest="command", required=True)
+    load = sub.add_parser("import", help="upsert a data.csv style file into music.song_features")
+    load.add_argument("csv")
+    sub.add_parser("snapshot", help="refresh the on-disk catalog snapshot from postgres")
+    args = parser.parse_args(argv)
+
+    index.init_db_pools()
+    try:
+        if args.command == "import":
+            print(f"✅ Imported {import_csv(args.csv)} songs into music.song_features.")
+        else:
+            data, fingerprint = load_postgres_catalog()
+            print(f"✅ Catalog snapshot {fingerprint} has {len(data)} songs.")
+    finally:
+        index.close_db_pools()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,61 +1,147 @@
 import os
+import asyncio
 
 from psycopg2 import pool
 from dotenv import load_dotenv
-from psycopg2.extras import execute_values
+from psycopg2.extras import execute_batch
+
+from src.database.postgres.managed_pool import ManagedPool, PreparingConnection, PoolTimeout, execute_prepared
 
 load_dotenv()
-  
+
+POSTGRES_POOL_MIN = int(os.getenv("POSTGRES_POOL_MIN", 1))
+POSTGRES_POOL_MAX = int(os.getenv("POSTGRES_POOL_MAX", 10))
+# seconds a caller waits for a free connection before PoolTimeout
+POSTGRES_ACQUIRE_TIMEOUT = float(os.getenv("POSTGRES_ACQUIRE_TIMEOUT", 5))
+
 PG_POOL = None
+# write-behind writers (write_behind.py) drained by close_db_pools before the pool goes away
+_WRITERS = []
 
-def init_db_pools():
+# hot queries, PREPAREd once per pooled connection the first time they run on it
+STATEMENTS = {
+    "insert_artist": """
+        INSERT INTO music.artists (artist_id, user_id, name, genres, popularity, image, external_url)
+        VALUES ($1, $2, $3, $4, $5, $6, $7)
+        ON CONFLICT (artist_id, user_id) DO NOTHING
+    """,
+    "user_artists": """
+        SELECT artist_id, name, genres, popularity FROM music.artists WHERE user_id = $1
+    """,
+    "user_songs": """
+        SELECT song_id, song_name, artist_name, release_date, popularity FROM music.songs WHERE user_id = $1
+    """,
+}
 
-    global PG_POOL
 
-    PG_POOL = pool.ThreadedConnectionPool(
-    minconn=1,
-    maxconn=5,
-    user=os.getenv("POSTGRES_USER"),
-    password=os.getenv("POSTGRES_PASSWORD"),
-    host=os.getenv("POSTGRES_HOST"),
-    port=int(os.getenv("POSTGRES_PORT", 5432)),
-    database=os.getenv("POSTGRES_DB_NAME")
-)
+def init_db_pools(minconn: int = None, maxconn: int = None, timeout: float = None, **connect_kwargs):
+
+    global PG_POOL
 
-def get_db_conn():
-    return PG_POOL.getconn()
+    maxconn = maxconn or POSTGRES_POOL_MAX
+    params = dict(
+        user=os.getenv("POSTGRES_USER"),
+        password=os.getenv("POSTGRES_PASSWORD"),
+        host=os.getenv("POSTGRES_HOST"),
+        port=int(os.getenv("POSTGRES_PORT", 5432)),
+        database=os.getenv("POSTGRES_DB_NAME"),
+        connect_timeout=int(os.getenv("POSTGRES_CONNECT_TIMEOUT", 5)),
+    )
+    params.update(connect_kwargs)
+
+    PG_POOL = ManagedPool(
+        pool.ThreadedConnectionPool(
+            minconn=minconn or POSTGRES_POOL_MIN,
+            maxconn=maxconn,
+            connection_factory=PreparingConnection,
+            **params,
+        ),
+        maxconn=maxconn,
+        timeout=POSTGRES_ACQUIRE_TIMEOUT if timeout is None else timeout,
+    )
+
+def get_db_conn(timeout: float = None):
+    """raw checkout, prefer `with connection()` / `with transaction()` which always give it back"""
+    return PG_POOL.getconn(timeout)
 
 def release_db_conn(conn):
     PG_POOL.putconn(conn)
 
+def connection(timeout: float = None):
+    return PG_POOL.connection(timeout)
+
+def transaction(timeout: float = None):
+    return PG_POOL.transaction(timeout)
+
+async def run_transaction(fn, *args, timeout: float = None):
+    """
+    runs fn(conn, *args) inside transaction() on a worker thread and returns its result, the async
+    entry point: psycopg2 blocks, so the checkout and the queries both stay off the event loop
+    """
+    def run():
+        with transaction(timeout) as conn:
+            return fn(conn, *args)
+    return await asyncio.to_thread(run)
+
+def pool_stats():
+    return PG_POOL.stats() if PG_POOL else None
+
 def close_db_pool():
     PG_POOL.closeall()
 
+def register_writer(writer):
+    _WRITERS.append(writer)
+
+def unregister_writer(writer):
+    if writer in _WRITERS:
+        _WRITERS.remove(writer)
+
 def close_db_pools():
+    global PG_POOL
+
+    # flush whatever is still buffered while the pool is up
+    for writer in list(_WRITERS):
+        writer.close()
     if PG_POOL:
         PG_POOL.closeall()
+        PG_POOL = None
+
+
+def insert_top_artists(user_id: str, artists: list, conn=None):
+    """
+    synchronous insert of a user's top artists through the prepared insert_artist statement.
+    /top-artists goes through the write-behind writer instead, this is for scripts and backfills
+    """
+    from src.database.postgres.write_behind import artist_row
 
+    values = [artist_row(user_id, artist) for artist in artists]
+    if not values:
+        return 0
 
+    if conn is None:
+        with transaction() as conn:
+            return insert_top_artists(user_id, artists, conn)
 
+    with conn.cursor() as cur:
+        execute_prepared(cur, "insert_artist", STATEMENTS["insert_artist"], values[0])
+        execute_batch(cur, "EXECUTE insert_artist (%s, %s, %s, %s, %s, %s, %s)", values[1:])
+    conn.commit()
+    return len(values)
 
-def insert_top_artists(user_id: str, artists: list, conn):
-    values = []
-    for artist in artists:
-        artist_id = artist['id']
-        name = artist['name']
-        genres = artist['genres']  
-        popularity = artist['popularity']
-        image = artist['images'][0]['url'] if artist['images'] else None
-        external_url = artist['external_urls']['spotify']
 
-        values.append((artist_id, user_id, name, genres, popularity, image, external_url))
+def fetch_user_artists(user_id: str, conn=None) -> list:
+    if conn is None:
+        with connection() as conn:
+            return fetch_user_artists(user_id, conn)
+    with conn.cursor() as cur:
+        execute_prepared(cur, "user_artists", STATEMENTS["user_artists"], (user_id,))
+        return cur.fetchall()
 
-    query = """
-        INSERT INTO music.artists (artist_id, user_id, name, genres, popularity, image, external_url)
-        VALUES %s
-        ON CONFLICT (artist_id) DO NOTHING;
-    """
 
+def fetch_user_songs(user_id: str, conn=None) -> list:
+    if conn is None:
+        with connection() as conn:
+            return fetch_user_songs(user_id, conn)
     with conn.cursor() as cur:
-        execute_values(cur, query, values)
-        conn.commit()
+        execute_prepared(cur, "user_songs", STATEMENTS["user_songs"], (user_id,))
+        return cur.fetchall()
@@ -0,0 +1,137 @@
+import time
+import bisect
+import threading
+
+from contextlib import contextmanager
+
+import psycopg2.extensions
+
+# acquisition latency histogram bucket upper bounds, in milliseconds
+LATENCY_BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class PreparingConnection(psycopg2.extensions.connection):
+    """psycopg2 connection that remembers which statements were PREPAREd on it"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared = set()
+
+
+def execute_prepared(cur, name: str, sql: str, args: tuple = ()):
+    """
+    EXECUTE `name`, PREPAREing `sql` ($1.. placeholders) on this connection the first time.
+    prepared statements live as long as the server session, so each pooled connection plans once
+    """
+    conn = cur.connection
+    prepared = getattr(conn, "prepared", None)
+    if prepared is None or name not in prepared:
+        cur.execute(f"PREPARE {name} AS {sql}")
+        if prepared is not None:
+            prepared.add(name)
+    if args:
+        cur.execute(f"EXECUTE {name} ({', '.join(['%s'] * len(args))})", args)
+    else:
+        cur.execute(f"EXECUTE {name}")
+
+
+class ManagedPool:
+    """
+    wraps a psycopg2 pool: getconn waits up to `timeout` for a free connection (psycopg2 raises
+    straight away when it is exhausted) and every acquisition is measured. broken connections are
+    closed instead of being handed back to the pool
+    """
+
+    def __init__(self, pool, maxconn: int, timeout: float):
+        self.pool = pool
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self._lock = threading.Lock()
+        self._in_use = 0
+        self._waiting = 0
+        self._counters = dict.fromkeys(["acquired", "timeouts", "discarded", "errors"], 0)
+        self._latency_counts = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self._latency_total_ms = 0.0
+
+    def getconn(self, timeout: float = None):
+        timeout = self.timeout if timeout is None else timeout
+        started = time.monotonic()
+        with self._lock:
+            self._waiting += 1
+        try:
+            acquired = self._slots.acquire(timeout=timeout)
+        finally:
+            with self._lock:
+                self._waiting -= 1
+        if not acquired:
+            with self._lock:
+                self._counters["timeouts"] += 1
+            raise PoolTimeout(f"no postgres connection free within {timeout}s ({self.maxconn} in use)")
+
+        try:
+            conn = self.pool.getconn()
+        except Exception:
+            self._slots.release()
+            with self._lock:
+                self._counters["errors"] += 1
+            raise
+
+        waited_ms = (time.monotonic() - started) * 1000
+        with self._lock:
+            self._in_use += 1
+            self._counters["acquired"] += 1
+            self._latency_counts[bisect.bisect_left(LATENCY_BUCKETS_MS, waited_ms)] += 1
+            self._latency_total_ms += waited_ms
+        return conn
+
+    def putconn(self, conn, close: bool = False):
+        close = close or bool(getattr(conn, "closed", False))
+        try:
+            self.pool.putconn(conn, close=close)
+        finally:
+            with self._lock:
+                self._in_use -= 1
+                if close:
+                    self._counters["discarded"] += 1
+            self._slots.release()
+
+    @contextmanager
+    def connection(self, timeout: float = None):
+        """a pooled connection for the with block, rolled back if the block raises, always returned"""
+        conn = self.getconn(timeout)
+        broken = False
+        try:
+            yield conn
+        except Exception:
+            try:
+                conn.rollback()
+            except Exception:
+                broken = True
+            raise
+        finally:
+            self.putconn(conn, close=broken)
+
+    @contextmanager
+    def transaction(self, timeout: float = None):
+        """like connection(), committing when the block finishes cleanly"""
+        with self.connection(timeout) as conn:
+            yield conn
+            conn.commit()
+
+    def closeall(self):
+        self.pool.closeall()
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._counters)
+            stats.update(in_use=self._in_use, waiting=self._waiting, max=self.maxconn)
+            buckets = [f"le_{bound}ms" for bound in LATENCY_BUCKETS_MS] + ["le_inf"]
+            stats["acquire_ms"] = dict(zip(buckets, self._latency_counts))
+            acquired = stats["acquired"]
+            stats["acquire_ms_avg"] = round(self._latency_total_ms / acquired, 3) if acquired else 0.0
+        return stats
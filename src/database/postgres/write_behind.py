@@ -0,0 +1,231 @@
+import io
+import os
+import time
+import threading
+import traceback
+
+from typing import Callable, List, Sequence
+from dataclasses import dataclass
+
+from src.database.postgres import index
+
+WRITE_BEHIND_BATCH_ROWS = int(os.getenv("WRITE_BEHIND_BATCH_ROWS", 2000))
+WRITE_BEHIND_FLUSH_INTERVAL = float(os.getenv("WRITE_BEHIND_FLUSH_INTERVAL", 2.0))
+WRITE_BEHIND_MAX_ROWS = int(os.getenv("WRITE_BEHIND_MAX_ROWS", 50_000))
+# how long a producer may block on a full buffer before it gets WriteBehindFull
+WRITE_BEHIND_SUBMIT_TIMEOUT = float(os.getenv("WRITE_BEHIND_SUBMIT_TIMEOUT", 2.0))
+WRITE_BEHIND_RETRIES = int(os.getenv("WRITE_BEHIND_RETRIES", 3))
+
+
+class WriteBehindFull(Exception):
+    pass
+
+
+@dataclass(frozen=True)
+class TableSpec:
+    table: str
+    columns: Sequence[str]
+    conflict_columns: Sequence[str]
+
+    @property
+    def staging(self) -> str:
+        return f"staging_{self.table.replace('.', '_')}"
+
+
+ARTISTS = TableSpec(
+    "music.artists",
+    ("artist_id", "user_id", "name", "genres", "popularity", "image", "external_url"),
+    ("artist_id", "user_id"),
+)
+
+SONGS = TableSpec(
+    "music.songs",
+    ("song_id", "user_id", "song_name", "artist_id", "artist_name", "release_date", "image1", "image2", "image3",
+     "external_url", "popularity", "preview_url"),
+    ("song_id", "user_id"),
+)
+
+
+def artist_row(user_id: str, artist: dict) -> tuple:
+    """a spotify artist object as a music.artists row"""
+    image = artist['images'][0]['url'] if artist.get('images') else None
+    return (artist['id'], user_id, artist['name'], artist.get('genres') or [], artist.get('popularity'), image,
+            artist.get('external_urls', {}).get('spotify'))
+
+
+def _escape_text(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n").replace("\r", "\\r")
+
+
+def _array_literal(values) -> str:
+    items = ("NULL" if v is None else '"' + str(v).replace("\\", "\\\\").replace('"', '\\"') + '"' for v in values)
+    return "{" + ",".join(items) + "}"
+
+
+def copy_text(rows: List[tuple]) -> io.StringIO:
+    """rows in COPY ... FROM STDIN text format: tab separated, \\N for NULL, lists as array literals"""
+    buffer = io.StringIO()
+    for row in rows:
+        fields = []
+        for value in row:
+            if value is None:
+                fields.append("\\N")
+            elif isinstance(value, (list, tuple)):
+                fields.append(_escape_text(_array_literal(value)))
+            else:
+                fields.append(_escape_text(str(value)))
+        buffer.write("\t".join(fields) + "\n")
+    buffer.seek(0)
+    return buffer
+
+
+def upsert_batch(conn, spec: TableSpec, rows: List[tuple]):
+    """COPY into a per connection temp staging table, then one INSERT .. ON CONFLICT DO UPDATE"""
+    # the same key twice in one INSERT .. ON CONFLICT is an error, the newest row wins
+    key_idx = [spec.columns.index(col) for col in spec.conflict_columns]
+    rows = list({tuple(row[i] for i in key_idx): row for row in rows}.values())
+
+    columns = ", ".join(spec.columns)
+    updates = ", ".join(f"{col} = EXCLUDED.{col}" for col in spec.columns if col not in spec.conflict_columns)
+    with conn.cursor() as cur:
+        cur.execute(f"CREATE TEMP TABLE IF NOT EXISTS {spec.staging} "
+                    f"(LIKE {spec.table} INCLUDING DEFAULTS) ON COMMIT DELETE ROWS")
+        cur.copy_expert(f"COPY {spec.staging} ({columns}) FROM STDIN", copy_text(rows))
+        cur.execute(f"INSERT INTO {spec.table} ({columns}) SELECT {columns} FROM {spec.staging} "
+                    f"ON CONFLICT ({', '.join(spec.conflict_columns)}) DO UPDATE SET {updates}")
+    conn.commit()
+    return len(rows)
+
+
+class WriteBehindWriter:
+    """
+    buffers rows for one table in memory and upserts them from a background thread in batches of
+    up to batch_rows, whenever a batch is full or flush_interval has passed. submit() blocks for at
+    most submit_timeout while the buffer holds max_rows and then raises WriteBehindFull.
+    close() stops taking rows and drains what is left, close_db_pools() calls it for every writer
+    """
+
+    def __init__(self, spec: TableSpec, batch_rows: int = WRITE_BEHIND_BATCH_ROWS,
+                 flush_interval: float = WRITE_BEHIND_FLUSH_INTERVAL, max_rows: int = WRITE_BEHIND_MAX_ROWS,
+                 submit_timeout: float = WRITE_BEHIND_SUBMIT_TIMEOUT, retries: int = WRITE_BEHIND_RETRIES,
+                 get_conn: Callable = None, release_conn: Callable = None):
+        self.spec = spec
+        self.batch_rows = batch_rows
+        self.flush_interval = flush_interval
+        self.max_rows = max_rows
+        self.submit_timeout = submit_timeout
+        self.retries = retries
+        self.get_conn = get_conn or index.get_db_conn
+        self.release_conn = release_conn or index.release_db_conn
+
+        self._rows = []
+        self._in_flight = 0
+        self._flush_now = False
+        self._cond = threading.Condition()
+        self._closed = False
+        self._counters = dict.fromkeys(["submitted", "flushed", "batches", "failed", "rejected", "retries"], 0)
+        self._last_flush_ms = None
+
+        self._thread = threading.Thread(target=self._run, name=f"write-behind-{spec.table}", daemon=True)
+        self._thread.start()
+        index.register_writer(self)
+
+    def submit(self, rows: List[tuple], timeout: float = None):
+        if not rows:
+            return
+        timeout = self.submit_timeout if timeout is None else timeout
+        with self._cond:
+            if self._closed:
+                raise WriteBehindFull(f"{self.spec.table} writer is closed")
+            # a single oversized submit is let in once the buffer is empty, it would never fit otherwise
+            fits = lambda: self._closed or not self._rows or len(self._rows) + len(rows) <= self.max_rows
+            if not self._cond.wait_for(fits, timeout):
+                self._counters["rejected"] += len(rows)
+                raise WriteBehindFull(f"{self.spec.table} write buffer is full ({len(self._rows)} rows waiting)")
+            if self._closed:
+                raise WriteBehindFull(f"{self.spec.table} writer is closed")
+            self._rows.extend(rows)
+            self._counters["submitted"] += len(rows)
+            if len(self._rows) >= self.batch_rows:
+                self._cond.notify_all()
+
+    def _take_batch(self) -> list:
+        with self._cond:
+            deadline = time.monotonic() + self.flush_interval
+            while not self._closed and not self._flush_now and len(self._rows) < self.batch_rows:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            batch, self._rows = self._rows[:self.batch_rows], self._rows[self.batch_rows:]
+            self._in_flight = len(batch)
+            self._flush_now = bool(self._rows) and self._flush_now
+            self._cond.notify_all()  # room for blocked producers
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._take_batch()
+            if batch:
+                self._flush(batch)
+            with self._cond:
+                self._in_flight = 0
+                self._cond.notify_all()
+                if self._closed and not self._rows:
+                    return
+
+    def _flush(self, batch: list):
+        started = time.monotonic()
+        for attempt in range(self.retries + 1):
+            conn = None
+            try:
+                conn = self.get_conn()
+                written = upsert_batch(conn, self.spec, batch)
+                with self._cond:
+                    self._counters["flushed"] += written
+                    self._counters["batches"] += 1
+                    self._last_flush_ms = round((time.monotonic() - started) * 1000, 1)
+                return
+            except Exception:
+                if conn is not None:
+                    try:
+                        conn.rollback()
+                    except Exception:
+                        pass
+                if attempt == self.retries:
+                    traceback.print_exc()
+                    with self._cond:
+                        self._counters["failed"] += len(batch)
+                    print(f"Dropped {len(batch)} rows for {self.spec.table} after {attempt + 1} attempts.")
+                    return
+                with self._cond:
+                    self._counters["retries"] += 1
+                time.sleep(min(0.2 * 2 ** attempt, 5))
+            finally:
+                # always handed back, a failed flush used to leak the connection
+                if conn is not None:
+                    self.release_conn(conn)
+
+    def pending(self) -> int:
+        with self._cond:
+            return len(self._rows) + self._in_flight
+
+    def flush(self, timeout: float = None) -> bool:
+        """wakes the flusher and waits until everything submitted so far is written (or dropped)"""
+        with self._cond:
+            self._flush_now = True
+            self._cond.notify_all()
+            return self._cond.wait_for(lambda: not self._rows and not self._in_flight, timeout)
+
+    def close(self, timeout: float = 30):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join(timeout)
+        index.unregister_writer(self)
+
+    def stats(self) -> dict:
+        with self._cond:
+            stats = dict(self._counters)
+            stats.update(pending=len(self._rows) + self._in_flight, last_flush_ms=self._last_flush_ms)
+        return stats
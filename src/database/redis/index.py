@@ -1,23 +1,46 @@
-
 import redis
 import os
 
 REDIS_POOL = None
 redis_client = None
 
+REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", 50))
+# seconds a caller waits for a free connection once all of them are checked out
+REDIS_POOL_TIMEOUT = float(os.getenv("REDIS_POOL_TIMEOUT", 5))
+
 
-def init_redis_pool():
-        global REDIS_POOL, redis_client
+def init_redis_pool(max_connections: int = None):
+    global REDIS_POOL, redis_client
 
-        if REDIS_POOL is None:
-            REDIS_POOL = redis.ConnectionPool(
+    if REDIS_POOL is None:
+        REDIS_POOL = redis.BlockingConnectionPool(
             host=os.getenv("REDIS_HOST", "localhost"),
             port=int(os.getenv("REDIS_PORT", 6379)),
             db=int(os.getenv("REDIS_DB", 0)),
-            decode_responses=True
+            decode_responses=True,
+            max_connections=max_connections or REDIS_MAX_CONNECTIONS,
+            timeout=REDIS_POOL_TIMEOUT,
+            socket_connect_timeout=float(os.getenv("REDIS_CONNECT_TIMEOUT", 2)),
+            health_check_interval=30,
         )
-        redis_client = redis.Redis(connection_pool=REDIS_POOL)
+    redis_client = redis.Redis(connection_pool=REDIS_POOL)
+
+
+def ping_redis() -> bool:
+    try:
+        return redis_client is not None and redis_client.ping()
+    except redis.RedisError:
+        return False
+
+
+def close_redis_pool():
+    global REDIS_POOL, redis_client
+
+    if REDIS_POOL is not None:
+        REDIS_POOL.disconnect()
+    REDIS_POOL = None
+    redis_client = None
+
 
 def get_redis():
     return redis_client
-
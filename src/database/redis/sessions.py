@@ -0,0 +1,127 @@
+import os
+import time
+import threading
+
+from typing import Callable, Optional
+from collections import OrderedDict
+
+from src.database.redis.index import get_redis
+
+# the hash lives for the token's expires_in plus this grace, so the refresh token outlives the access token
+SESSION_REFRESH_GRACE = int(os.getenv("SESSION_REFRESH_GRACE", 30 * 24 * 3600))
+SESSION_CACHE_TTL = float(os.getenv("SESSION_CACHE_TTL", 5))
+SESSION_CACHE_SIZE = int(os.getenv("SESSION_CACHE_SIZE", 1024))
+
+_LEGACY_FIELDS = ("access_token", "refresh_token", "expires_at")
+
+
+class SessionStore:
+    """
+    a user's spotify session as one redis hash (access_token, refresh_token, expires_at), written
+    with one MULTI and read with one HGETALL. hot users are answered from a small in-process cache
+    for cache_ttl seconds, which saving a session in this process refreshes
+    """
+
+    def __init__(self, redis_getter: Callable = get_redis, prefix: str = "spotify:session",
+                 refresh_grace: int = SESSION_REFRESH_GRACE, cache_ttl: float = SESSION_CACHE_TTL,
+                 cache_size: int = SESSION_CACHE_SIZE):
+        self.redis_getter = redis_getter
+        self.prefix = prefix
+        self.refresh_grace = refresh_grace
+        self.cache_ttl = cache_ttl
+        self.cache_size = cache_size
+
+        self._cache = OrderedDict()  # user_id -> (cached_until, session)
+        self._lock = threading.Lock()
+        self._counters = dict.fromkeys(["cache_hits", "redis_reads", "writes", "migrated"], 0)
+
+    def _redis(self):
+        redis_con = self.redis_getter()
+        if redis_con is None:
+            raise RuntimeError("redis pool is not initialised, call init_redis_pool() first")
+        return redis_con
+
+    def key(self, user_id: str) -> str:
+        return f"{self.prefix}:{user_id}"
+
+    def _remember(self, user_id: str, session: dict):
+        with self._lock:
+            self._cache[user_id] = (time.monotonic() + self.cache_ttl, session)
+            self._cache.move_to_end(user_id)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def invalidate(self, user_id: str):
+        with self._lock:
+            self._cache.pop(user_id, None)
+
+    def save(self, user_id: str, token_info: dict) -> dict:
+        """
+        stores a token response and returns the merged session. spotify only sometimes sends a new
+        refresh token, leaving the field out of the HSET keeps the stored one
+        """
+        expires_in = int(token_info["expires_in"])
+        fields = {
+            "access_token": token_info["access_token"],
+            "expires_at": str(int(time.time()) + expires_in - 10),
+        }
+        if token_info.get("refresh_token"):
+            fields["refresh_token"] = token_info["refresh_token"]
+
+        key = self.key(user_id)
+        pipe = self._redis().pipeline(transaction=True)
+        pipe.hset(key, mapping=fields)
+        pipe.expire(key, expires_in + self.refresh_grace)
+        pipe.hgetall(key)
+        session = pipe.execute()[-1]
+
+        self._remember(user_id, session)
+        with self._lock:
+            self._counters["writes"] += 1
+        return session
+
+    def get(self, user_id: str) -> Optional[dict]:
+        with self._lock:
+            cached = self._cache.get(user_id)
+            if cached is not None and cached[0] > time.monotonic():
+                self._cache.move_to_end(user_id)
+                self._counters["cache_hits"] += 1
+                return cached[1]
+
+        redis_con = self._redis()
+        session = redis_con.hgetall(self.key(user_id)) or self._migrate_legacy(redis_con, user_id)
+        with self._lock:
+            self._counters["redis_reads"] += 1
+        if not session:
+            self.invalidate(user_id)
+            return None
+        self._remember(user_id, session)
+        return session
+
+    def _migrate_legacy(self, redis_con, user_id: str) -> Optional[dict]:
+        """sessions written before the hash layout, spotify:{user_id}:<field> keys without a ttl"""
+        legacy_keys = [f"spotify:{user_id}:{field}" for field in _LEGACY_FIELDS]
+        values = redis_con.mget(legacy_keys)
+        if not values[1]:
+            return None
+
+        session = {field: value for field, value in zip(_LEGACY_FIELDS, values) if value}
+        key = self.key(user_id)
+        pipe = redis_con.pipeline(transaction=True)
+        pipe.hset(key, mapping=session)
+        pipe.expire(key, self.refresh_grace)
+        pipe.delete(*legacy_keys)
+        pipe.execute()
+        with self._lock:
+            self._counters["migrated"] += 1
+        return session
+
+    def delete(self, user_id: str):
+        self._redis().delete(self.key(user_id))
+        self.invalidate(user_id)
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._counters)
+            stats["cached"] = len(self._cache)
+        return stats
@@ -0,0 +1,149 @@
+import os
+
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from src.partitions import GenrePartitions, nearest_rows
+
+# below this share of the catalog a filtered query is answered exactly over the matching rows,
+# above it the ann index is queried and its candidates are filtered
+FILTER_EXACT_SELECTIVITY = float(os.getenv("FILTER_EXACT_SELECTIVITY", 0.05))
+
+# low < first bound <= mid < second bound <= high
+MOOD_BANDS = {
+    "energy": (0.4, 0.7),
+    "valence": (0.35, 0.65),
+    "tempo": (95.0, 125.0),
+}
+BANDS = ("low", "mid", "high")
+# a mood is an AND over features of the bands it allows for each
+MOODS = {
+    "workout": {"energy": ["high"], "tempo": ["mid", "high"]},
+    "party": {"energy": ["high"], "valence": ["high"]},
+    "happy": {"valence": ["high"]},
+    "chill": {"energy": ["low"], "tempo": ["low", "mid"]},
+    "focus": {"energy": ["low", "mid"], "valence": ["mid"]},
+    "sad": {"energy": ["low", "mid"], "valence": ["low"]},
+    "morning": {"energy": ["mid"], "valence": ["mid", "high"]},
+    "night": {"energy": ["low", "mid"], "tempo": ["low", "mid"]},
+}
+
+
+def pack(mask: np.ndarray) -> np.ndarray:
+    """one bit per catalog row, 8 rows per byte, the padding bits past the last row are 0"""
+    return np.packbits(np.asarray(mask, dtype=bool))
+
+
+def count(bits: np.ndarray) -> int:
+    return int(np.bitwise_count(bits).sum())
+
+
+def contains(bits: np.ndarray, positions: np.ndarray) -> np.ndarray:
+    """whether each row position is set, read straight from the packed bytes"""
+    positions = np.asarray(positions, dtype=np.int64)
+    return ((bits[positions >> 3] >> (7 - (positions & 7)).astype(np.uint8)) & 1).astype(bool)
+
+
+def rows_of(bits: np.ndarray, n_rows: int) -> np.ndarray:
+    return np.flatnonzero(np.unpackbits(bits, count=n_rows))
+
+
+def _grouped(values: np.ndarray, n_rows: int) -> Dict:
+    """value -> bitset of the rows holding it, one sort for all the values"""
+    codes, uniques = pd.factorize(pd.Series(values), use_na_sentinel=True)
+    order = np.argsort(codes, kind="stable")
+    bounds = np.searchsorted(codes[order], np.arange(len(uniques) + 1))
+    bitsets = {}
+    for i, value in enumerate(uniques):
+        mask = np.zeros(n_rows, dtype=bool)
+        mask[order[bounds[i]:bounds[i + 1]]] = True
+        bitsets[value.item() if hasattr(value, "item") else value] = pack(mask)
+    return bitsets
+
+
+class CatalogFilters:
+    """
+    precomputed bitsets over the catalog rows for the request filters: cumulative year bitsets
+    (rows up to a year, so any year range is one AND NOT), cluster_label, explicit and the
+    energy / valence / tempo bands the moods are made of. genres have thousands of values, they stay
+    as the row lists of GenrePartitions and are packed per query. a query ANDs what it asks for into
+    one bitset, whose popcount says how selective it is
+    """
+
+    def __init__(self, data: pd.DataFrame, genres: GenrePartitions):
+        self.n_rows = len(data)
+        self.genres = genres
+        self.features = genres.features
+        self.all = pack(np.ones(self.n_rows, dtype=bool))
+
+        years = np.asarray(data['year'])
+        self.years = np.unique(years)
+        self._years_upto = np.empty((len(self.years), len(self.all)), dtype=np.uint8)
+        per_year = _grouped(years, self.n_rows)
+        upto = np.zeros(len(self.all), dtype=np.uint8)
+        for i, year in enumerate(self.years):
+            upto = upto | per_year[year.item()]
+            self._years_upto[i] = upto
+
+        self.clusters = _grouped(np.asarray(data['cluster_label']), self.n_rows)
+        self.explicit = pack(np.asarray(data['explicit']) == 1)
+        self.bands = {}
+        for feature, bounds in MOOD_BANDS.items():
+            band = np.digitize(np.asarray(data[feature], dtype=np.float64), bounds)
+            self.bands[feature] = {name: pack(band == i) for i, name in enumerate(BANDS)}
+
+    def _upto(self, year: float) -> np.ndarray:
+        """rows with year <= `year`"""
+        i = np.searchsorted(self.years, year, side="right") - 1
+        return self._years_upto[i] if i >= 0 else np.zeros_like(self.all)
+
+    def year_range(self, year_min: Optional[int] = None, year_max: Optional[int] = None) -> np.ndarray:
+        hi = self._upto(year_max) if year_max is not None else self.all
+        return hi & ~self._upto(year_min - 1) if year_min is not None else hi
+
+    def genre_bits(self, genres) -> np.ndarray:
+        mask = np.zeros(self.n_rows, dtype=bool)
+        rows = self.genres.rows_for(genres)
+        mask[rows[rows < self.n_rows]] = True
+        return pack(mask)
+
+    def mood_bits(self, mood: str) -> np.ndarray:
+        if mood not in MOODS:
+            raise ValueError(f"Unknown mood {mood!r}, expected one of {sorted(MOODS)}")
+        bits = self.all
+        for feature, bands in MOODS[mood].items():
+            bits = bits & np.bitwise_or.reduce([self.bands[feature][band] for band in bands])
+        return bits
+
+    def mask(self, genres=None, exclude_genres=None, year_min: int = None, year_max: int = None,
+             clusters: List[int] = None, explicit: bool = None, mood: str = None) -> np.ndarray:
+        """the rows passing every filter that is given, as a bitset"""
+        bits = self.all
+        if genres is not None:
+            bits = bits & self.genre_bits(genres)
+        if exclude_genres is not None and len(exclude_genres):
+            bits = bits & ~self.genre_bits(exclude_genres)
+        if year_min is not None or year_max is not None:
+            bits = bits & self.year_range(year_min, year_max)
+        if clusters is not None:
+            zero = np.zeros_like(self.all)
+            bits = bits & np.bitwise_or.reduce([self.clusters.get(c, zero) for c in clusters] or [zero])
+        if explicit is not None:
+            bits = bits & (self.explicit if explicit else self.all & ~self.explicit)
+        if mood is not None:
+            bits = bits & self.mood_bits(mood)
+        return bits
+
+    def selectivity(self, bits: np.ndarray) -> float:
+        return count(bits) / self.n_rows if self.n_rows else 0.0
+
+    def nearest(self, query_vector, bits: np.ndarray, n: int, rows: np.ndarray = None) -> np.ndarray:
+        """exact search over the rows set in `bits` (or over `rows`, when they were already unpacked)"""
+        rows = rows_of(bits, self.n_rows) if rows is None else rows
+        return nearest_rows(self.features, rows, query_vector, n)
+
+    def memory_bytes(self) -> int:
+        n_bitsets = len(self.years) + len(self.clusters) + 2 + sum(len(b) for b in self.bands.values())
+        return n_bitsets * len(self.all)
@@ -0,0 +1,51 @@
+"""
+the song generation api on its own, for scaling it apart from the recommender:
+
+    uvicorn src.gen_app:app
+
+no catalog, model bundle, postgres or spotify client, so nothing of pandas or the ml stack is
+imported and a worker is up in a fraction of src.app's startup. run src.app with
+SERVE_GENERATION=0 next to it to serve only recommendations there
+"""
+from fastapi import FastAPI
+
+from src.song_Gen import service as generation
+from src.profiling import STARTUP_PROFILE, phase, print_phases, startup_phases
+from src.database.redis.index import init_redis_pool, ping_redis, close_redis_pool
+
+app = FastAPI()
+app.include_router(generation.router)
+
+
+@app.on_event("startup")
+def startup_event():
+    # job state is shared with the other workers through redis, in process without it
+    with phase("redis pool"):
+        init_redis_pool()
+        if ping_redis():
+            print("✅ Redis pool ready.")
+        else:
+            print("Redis is not reachable, generation jobs are kept in process.")
+            close_redis_pool()
+
+    with phase("generation queue"):
+        generation.start()
+
+    if STARTUP_PROFILE:
+        print_phases()
+
+
+@app.get("/health")
+def health_check():
+    return {"status": "ok"}
+
+
+@app.get("/metrics")
+def metrics():
+    return {"generation_queue": generation.stats(), "startup_phases": startup_phases()}
+
+
+@app.on_event("shutdown")
+def shutdown():
+    generation.stop()
+    close_redis_pool()
@@ -0,0 +1,67 @@
+import numpy as np
+
+# rows whose best and second best genre are closer than this in float32 are redone in float64,
+# so the result matches the old dense float64 cosine_similarity argmax
+TIE_TOLERANCE = 1e-4
+
+
+def _normalize_rows(x: np.ndarray, dtype) -> np.ndarray:
+    x = np.asarray(x, dtype=dtype)
+    norms = np.linalg.norm(x, axis=1, keepdims=True)
+    norms[norms == 0] = 1  # zero vectors get similarity 0 with everything, like sklearn
+    return x / norms
+
+
+def _top_k(sims: np.ndarray, k: int):
+    """column indices and scores of the k largest values per row, best first"""
+    if k < sims.shape[1]:
+        cand = np.argpartition(-sims, k - 1, axis=1)[:, :k]
+    else:
+        cand = np.broadcast_to(np.arange(sims.shape[1]), sims.shape).copy()
+    scores = np.take_along_axis(sims, cand, axis=1)
+    order = np.argsort(-scores, axis=1, kind="stable")
+    return np.take_along_axis(cand, order, axis=1), np.take_along_axis(scores, order, axis=1)
+
+
+def assign_genres(song_features, genre_features, block_size: int = 4096, top_k: int = None, dtype=np.float32):
+    """
+    closest genre per song by cosine similarity, streamed over the songs in blocks of `block_size`
+    so peak memory is block_size x n_genres instead of n_songs x n_genres.
+
+    returns (genre_idx, score) arrays of shape (n_songs,), or (n_songs, top_k) sorted best first
+    when top_k is given
+    """
+    song_features = np.asarray(song_features)
+    genres = _normalize_rows(genre_features, dtype)
+    genres_64 = _normalize_rows(genre_features, np.float64)
+
+    n_songs = len(song_features)
+    k = top_k or 1
+    k_search = min(max(k, 2), len(genres))
+    best_idx = np.empty((n_songs, k), dtype=np.int64)
+    best_score = np.empty((n_songs, k), dtype=dtype)
+
+    for start in range(0, n_songs, block_size):
+        block = song_features[start:start + block_size]
+        sims = _normalize_rows(block, dtype) @ genres.T
+
+        cand, cand_scores = _top_k(sims, k_search)
+
+        if k_search > 1:
+            ambiguous = np.flatnonzero(cand_scores[:, 0] - cand_scores[:, 1] < TIE_TOLERANCE)
+            if len(ambiguous):
+                exact = _normalize_rows(block[ambiguous], np.float64) @ genres_64.T
+                rows = np.arange(len(ambiguous))
+                # np.argmax keeps the first index on exact ties, pin it to column 0
+                best = np.argmax(exact, axis=1)
+                best_scores = exact[rows, best]
+                exact[rows, best] = np.inf
+                cand[ambiguous], cand_scores[ambiguous] = _top_k(exact, k_search)
+                cand_scores[ambiguous, 0] = best_scores
+
+        best_idx[start:start + len(block)] = cand[:, :k]
+        best_score[start:start + len(block)] = cand_scores[:, :k]
+
+    if top_k is None:
+        return best_idx[:, 0], best_score[:, 0]
+    return best_idx, best_score
@@ -0,0 +1,148 @@
+import os
+import json
+import hashlib
+import threading
+
+import numpy as np
+import pandas as pd
+
+from typing import Callable
+
+from src.utils import number_cols
+from src.catalog import parse_artists
+from src.genres import assign_genres
+from src.vector_index import VectorIndex, top_n
+
+COMPACT_THRESHOLD = int(os.getenv("INGEST_COMPACT_THRESHOLD", 5000))
+
+
+def _first_artist(artists):
+    if isinstance(artists, (list, tuple)):
+        return artists[0] if artists else None
+    if isinstance(artists, str):
+        parsed = parse_artists(artists)
+        return parsed[0] if parsed else None
+    return artists
+
+
+def ingested_version(version: str, rows: pd.DataFrame) -> str:
+    """
+    the catalog version after `rows` were ingested on top of `version`, chained over what they are.
+    ingested rows stay with the worker that took them in while the recommendation cache's redis tier
+    is shared, so two workers that ingested different tracks must never end up on the same version
+    """
+    columns = [c for c in ("id", "name", "year", "artists") if c in rows.columns]
+    payload = json.dumps(rows[columns].astype(str).values.tolist(), separators=(",", ":"))
+    base = version.split("+")[0]
+    return f"{base}+{hashlib.sha1(f'{version}:{payload}'.encode()).hexdigest()[:16]}"
+
+
+def prepare_tracks(tracks: pd.DataFrame, song_cluster_pipeline, genre_model: dict):
+    """
+    labels new tracks with the already fitted models, nothing is refitted.
+    returns the catalog rows (with first_artist, predicted_genre, cluster_label) and their scaled vectors
+    """
+    tracks = tracks.copy()
+    tracks["first_artist"] = tracks["artists"].apply(_first_artist)
+    # keep the csv representation so new rows look like the rest of the catalog
+    tracks["artists"] = tracks["artists"].apply(lambda x: str(list(x)) if isinstance(x, (list, tuple)) else x)
+
+    genre_cols = list(genre_model["genre_features"])
+    scaled = (tracks[genre_cols].to_numpy(dtype=np.float64) - genre_model["scaler_mean"]) / genre_model["scaler_scale"]
+    genre_idx, _ = assign_genres(scaled, genre_model["scaled_genre_features"])
+    tracks["predicted_genre"] = genre_model["genre_names"][genre_idx].astype(object)
+
+    X = tracks[number_cols]
+    tracks["cluster_label"] = song_cluster_pipeline.predict(X)
+    vectors = song_cluster_pipeline.named_steps['scaler'].transform(X).astype(np.float32)
+    return tracks, vectors
+
+
+class LiveIndex(VectorIndex):
+    """
+    main (immutable) index plus a small exact-search delta of the tracks ingested since it was built.
+    queries hit both and merge by distance. compact() folds the delta into a freshly built main index
+    and swaps it in; readers grab one immutable state tuple, so a swap never drops a query
+    """
+    name = "live"
+
+    def __init__(self, main: VectorIndex, main_features: np.ndarray, rebuild: Callable[[np.ndarray], VectorIndex],
+                 compact_threshold: int = COMPACT_THRESHOLD):
+        self.rebuild = rebuild
+        self.compact_threshold = compact_threshold
+        dim = main_features.shape[1]
+        # (main index, main features, delta vectors)
+        self._state = (main, main_features, np.empty((0, dim), dtype=np.float32))
+        self._lock = threading.Lock()
+        self._compact_lock = threading.Lock()
+        self._compacting = None
+
+    @property
+    def main(self) -> VectorIndex:
+        return self._state[0]
+
+    def delta_size(self) -> int:
+        return len(self._state[2])
+
+    def get_n_items(self) -> int:
+        _, main_features, delta = self._state
+        return len(main_features) + len(delta)
+
+    def features(self) -> np.ndarray:
+        _, main_features, delta = self._state
+        if len(delta) == 0:
+            return main_features
+        return np.concatenate([np.asarray(main_features, dtype=np.float32), delta])
+
+    def add(self, vectors: np.ndarray) -> np.ndarray:
+        """appends vectors to the delta and returns their ids, which continue the catalog row positions"""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        with self._lock:
+            main, main_features, delta = self._state
+            start = len(main_features) + len(delta)
+            self._state = (main, main_features, np.concatenate([delta, vectors]))
+        if self.delta_size() >= self.compact_threshold:
+            self.compact_in_background()
+        return np.arange(start, start + len(vectors))
+
+    def get_nns_by_vector(self, vector, n: int, search_k: int = -1, include_distances: bool = False):
+        main, main_features, delta = self._state
+        idxs, dists = main.get_nns_by_vector(vector, n, search_k=search_k, include_distances=True)
+        if len(delta):
+            diff = delta - np.asarray(vector, dtype=np.float32)
+            delta_dists = np.sqrt(np.einsum("ij,ij->i", diff, diff))
+            idxs = np.concatenate([np.asarray(idxs, dtype=np.int64), np.arange(len(delta)) + len(main_features)])
+            dists = np.concatenate([np.asarray(dists, dtype=np.float32), delta_dists])
+            top = top_n(dists[None, :], min(n, len(dists)))[0]
+            idxs, dists = idxs[top].tolist(), dists[top].tolist()
+
+        if include_distances:
+            return idxs, dists
+        return idxs
+
+    def compact(self):
+        """builds a new main index over everything ingested so far, then swaps it in"""
+        with self._compact_lock:
+            with self._lock:
+                _, main_features, delta = self._state
+                snapshot = np.concatenate([np.asarray(main_features, dtype=np.float32), delta])
+
+            new_main = self.rebuild(snapshot)
+
+            with self._lock:
+                _, main_features, delta = self._state
+                # rows ingested while the build ran stay in the delta
+                folded = len(snapshot) - len(main_features)
+                self._state = (new_main, snapshot, delta[folded:])
+        print(f"✅ Index compacted, {len(snapshot)} items in the main index.")
+
+    def compact_in_background(self) -> threading.Thread:
+        with self._lock:
+            if self._compacting is not None and self._compacting.is_alive():
+                return self._compacting
+            self._compacting = threading.Thread(target=self.compact, name="index-compaction", daemon=True)
+            self._compacting.start()
+            return self._compacting
+
+    def memory_bytes(self) -> int:
+        return self.main.memory_bytes() + self._state[2].nbytes
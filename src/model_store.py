@@ -0,0 +1,392 @@
+import os
+import sys
+import json
+import time
+import fcntl
+import shutil
+import hashlib
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from annoy import AnnoyIndex
+
+from src.utils import number_cols
+from src.genres import assign_genres
+from src.store import CatalogStore
+from src.artists import ArtistIndex
+from src.catalog import (CATALOG_SOURCE, first_artists, save_columns, load_columns, read_csv_catalog,
+                         catalog_fingerprint, load_postgres_catalog)
+from src.database.postgres import index
+
+# bump this whenever the on-disk layout or the build steps change, old bundles are then rebuilt
+BUNDLE_FORMAT = 4
+
+SONGS_CSV = os.getenv("SONGS_CSV", "data/data.csv")
+GENRES_CSV = os.getenv("GENRES_CSV", "data/data_by_genres.csv")
+ARTIFACT_DIR = os.getenv("MODEL_ARTIFACT_DIR", "artifacts")
+# memory map the numeric catalog columns like features.npy and songs.ann, so every worker serving
+# the same bundle shares one copy of them through the page cache
+CATALOG_SHARED = os.getenv("CATALOG_SHARED", "1") == "1"
+
+genre_features = [
+    'acousticness', 'danceability', 'duration_ms', 'energy',
+    'instrumentalness', 'liveness', 'loudness', 'speechiness',
+    'tempo', 'valence', 'popularity', 'key', 'mode'
+]
+
+BUILD_PARAMS = {
+    "n_clusters": 20,
+    "n_trees": 10,
+    "metric": "euclidean",
+    "number_cols": number_cols,
+    "genre_features": genre_features,
+}
+
+class SongScaler:
+    """
+    the fitted StandardScaler of song_cluster_pipeline as its two arrays. serving only ever scales
+    query vectors, this does it without unpickling the pipeline (and importing sklearn for it)
+    """
+
+    def __init__(self, mean: np.ndarray, scale: np.ndarray):
+        self.mean = mean
+        self.scale = scale
+
+    def transform(self, X) -> np.ndarray:
+        # what StandardScaler.transform computes, in float64 like it does
+        return (np.asarray(X, dtype=np.float64) - self.mean) / self.scale
+
+
+@dataclass
+class ModelBundle:
+    """
+    everything the recommender needs at serving time, loaded from one versioned artifact dir.
+    annoy item ids are the row positions of `data`
+    """
+    version: str
+    path: str
+    data: pd.DataFrame  # numeric columns memory mapped when loaded shared, None when loaded without the frame
+    scaler: SongScaler  # the pipeline's scaler, for query vectors
+    cluster_centers: np.ndarray  # the pipeline's kmeans centers, in scaled space
+    annoy_index: AnnoyIndex
+    features: np.ndarray  # scaled number_cols, float32, memory mapped
+    genre_model: dict = field(default_factory=dict)  # genre scaler and vectors, to label new tracks
+    manifest: dict = field(default_factory=dict)
+    store: CatalogStore = None  # the serving representation of `data`, see src/store.py
+    artists: ArtistIndex = None  # first_artist rows, centroids and their ann index, memory mapped
+    _pipeline: object = field(default=None, repr=False)
+
+    @property
+    def song_cluster_pipeline(self):
+        """the fitted sklearn pipeline, unpickled (and sklearn imported) the first time ingest needs it"""
+        if self._pipeline is None:
+            import joblib
+            self._pipeline = joblib.load(os.path.join(self.path, "pipeline.joblib"))
+        return self._pipeline
+
+
+def file_hash(path: str, chunk_size: int = 1 << 20) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def source_hash(songs_csv: str = SONGS_CSV, genres_csv: str = GENRES_CSV) -> str:
+    digest = hashlib.sha256()
+    for path in (songs_csv, genres_csv):
+        digest.update(file_hash(path).encode())
+    return digest.hexdigest()
+
+
+def postgres_source_hash(genres_csv: str = GENRES_CSV, fingerprint: str = None) -> str:
+    """
+    the music.song_features fingerprint combined with the genres csv, the postgres analogue of
+    source_hash. pass the fingerprint load_postgres_catalog returned to version the rows it read
+    """
+    if fingerprint is None:
+        with index.connection() as conn:
+            fingerprint = catalog_fingerprint(conn)
+    return hashlib.sha256(f"postgres:{fingerprint}:{file_hash(genres_csv)}".encode()).hexdigest()
+
+
+def bundle_version(src_hash: str, params: dict = BUILD_PARAMS) -> str:
+    """the version changes when the source data, the build params or the bundle format change"""
+    payload = json.dumps({"source": src_hash, "params": params, "format": BUNDLE_FORMAT}, sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()[:16]
+
+
+@contextmanager
+def build_lock(out_dir: str = ARTIFACT_DIR):
+    """one bundle build at a time per out_dir, for every worker and process on the host"""
+    os.makedirs(out_dir, exist_ok=True)
+    with open(os.path.join(out_dir, ".build.lock"), "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def build_bundle(songs_csv: str = SONGS_CSV, genres_csv: str = GENRES_CSV, out_dir: str = ARTIFACT_DIR,
+                 params: dict = BUILD_PARAMS, data: pd.DataFrame = None, src_hash: str = None,
+                 replace: bool = False) -> str:
+    """
+    fits the genre assignment, the kmeans pipeline and the annoy index offline and writes them
+    to `out_dir/<version>/`. returns the bundle path.
+    `data` / `src_hash` replace songs_csv when the catalog comes from somewhere else (postgres).
+    replace=True swaps the new build in over an existing bundle of the same version (--force)
+    """
+    import joblib
+    from sklearn.cluster import KMeans
+    from sklearn.preprocessing import StandardScaler
+    from sklearn.pipeline import Pipeline
+
+    started = time.time()
+    if data is None:
+        src_hash = source_hash(songs_csv, genres_csv)
+        data = read_csv_catalog(songs_csv)
+        songs_source = os.path.abspath(songs_csv)
+    else:
+        data = data.copy()
+        songs_source = "postgres:music.song_features"
+    if "first_artist" not in data.columns:
+        data["first_artist"] = first_artists(data["artists"])
+    version = bundle_version(src_hash, params)
+    final_path = os.path.join(out_dir, version)
+
+    genre_df = pd.read_csv(genres_csv)
+    features = params["genre_features"]
+
+    scaler_genre = StandardScaler()
+    scaled_song_features = scaler_genre.fit_transform(data[features])
+    scaled_genre_features = scaler_genre.transform(genre_df[features])
+
+    # streamed in blocks, a dense songs x genres similarity matrix is several GB on the full catalog
+    closest_genre_indices, _ = assign_genres(scaled_song_features, scaled_genre_features)
+    data['predicted_genre'] = genre_df['genres'].to_numpy()[closest_genre_indices]
+
+    # --- Clustering & Annoy index ---
+    song_cluster_pipeline = Pipeline([
+        ('scaler', StandardScaler()),
+        ('kmeans', KMeans(n_clusters=params["n_clusters"], verbose=False))
+    ])
+    X = data[params["number_cols"]]
+    song_cluster_pipeline.fit(X)
+    data['cluster_label'] = song_cluster_pipeline.predict(X)
+
+    X_scaled = song_cluster_pipeline.named_steps['scaler'].transform(X).astype(np.float32)
+    dim = X_scaled.shape[1]
+    annoy_index = AnnoyIndex(dim, params["metric"])
+    for i, vector in enumerate(X_scaled):
+        annoy_index.add_item(i, vector)
+    annoy_index.build(n_trees=params["n_trees"])
+
+    # write everything into a temp dir first so a half written bundle is never picked up
+    os.makedirs(out_dir, exist_ok=True)
+    tmp_path = os.path.join(out_dir, f".{version}.tmp-{os.getpid()}")
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+
+    annoy_index.save(os.path.join(tmp_path, "songs.ann"))
+    joblib.dump(song_cluster_pipeline, os.path.join(tmp_path, "pipeline.joblib"))
+    np.save(os.path.join(tmp_path, "features.npy"), X_scaled)
+    song_scaler = song_cluster_pipeline.named_steps['scaler']
+    np.savez(
+        os.path.join(tmp_path, "cluster_model.npz"),
+        scaler_mean=song_scaler.mean_,
+        scaler_scale=song_scaler.scale_,
+        cluster_centers=song_cluster_pipeline.named_steps['kmeans'].cluster_centers_,
+    )
+    np.savez(
+        os.path.join(tmp_path, "genre_model.npz"),
+        genre_names=genre_df['genres'].to_numpy(dtype=str),
+        scaler_mean=scaler_genre.mean_,
+        scaler_scale=scaler_genre.scale_,
+        scaled_genre_features=scaled_genre_features,
+    )
+    columns = save_columns(os.path.join(tmp_path, "catalog"), data)
+    # ~1s on the full catalog (30k artists), paid here once instead of at every worker start
+    ArtistIndex(data['first_artist'].to_numpy(), X_scaled).save(os.path.join(tmp_path, "artists"))
+    CatalogStore.from_frame(data).save(os.path.join(tmp_path, "store"))
+
+    manifest = {
+        "version": version,
+        "format": BUNDLE_FORMAT,
+        "source_hash": src_hash,
+        "sources": {"songs": songs_source, "genres": os.path.abspath(genres_csv)},
+        "params": params,
+        "dim": dim,
+        "n_items": len(data),
+        "columns": columns,
+        "built_at": int(time.time()),
+        "build_seconds": round(time.time() - started, 2),
+    }
+    with open(os.path.join(tmp_path, "manifest.json"), "w") as f:
+        json.dump(manifest, f, indent=2)
+
+    if replace and os.path.exists(final_path):
+        # the old copy is only moved aside once the new one is complete, workers that mapped its
+        # files keep reading them and a failed build leaves it in place
+        old_path = os.path.join(out_dir, f".{version}.old-{os.getpid()}")
+        os.rename(final_path, old_path)
+        os.rename(tmp_path, final_path)
+        shutil.rmtree(old_path, ignore_errors=True)
+    else:
+        try:
+            os.rename(tmp_path, final_path)
+        except OSError:
+            # another worker finished the same version first, theirs is identical
+            shutil.rmtree(tmp_path, ignore_errors=True)
+
+    with open(os.path.join(out_dir, "CURRENT.tmp"), "w") as f:
+        f.write(version)
+    os.replace(os.path.join(out_dir, "CURRENT.tmp"), os.path.join(out_dir, "CURRENT"))
+
+    print(f"✅ Model bundle {version} built in {time.time() - started:.1f}s")
+    return final_path
+
+
+def load_genre_model(path: str, manifest: dict) -> dict:
+    with np.load(os.path.join(path, "genre_model.npz")) as npz:
+        genre_model = {key: npz[key] for key in npz.files}
+    genre_model["genre_features"] = manifest["params"]["genre_features"]
+    return genre_model
+
+
+def load_bundle(path: str, shared: bool = None, frame: bool = True) -> ModelBundle:
+    """
+    frame=False skips the pandas catalog (every string column decoded into python objects), the
+    api serves from the store alone
+    """
+    with open(os.path.join(path, "manifest.json")) as f:
+        manifest = json.load(f)
+    shared = CATALOG_SHARED if shared is None else shared
+
+    annoy_index = AnnoyIndex(manifest["dim"], manifest["params"]["metric"])
+    annoy_index.load(os.path.join(path, "songs.ann"))  # mmap, pages are shared between workers
+    with np.load(os.path.join(path, "cluster_model.npz")) as npz:
+        cluster_model = {key: npz[key] for key in npz.files}
+
+    return ModelBundle(
+        version=manifest["version"],
+        path=path,
+        data=load_columns(os.path.join(path, "catalog"), manifest["columns"], mmap=shared) if frame else None,
+        scaler=SongScaler(cluster_model["scaler_mean"], cluster_model["scaler_scale"]),
+        cluster_centers=cluster_model["cluster_centers"],
+        annoy_index=annoy_index,
+        features=np.load(os.path.join(path, "features.npy"), mmap_mode="r"),
+        genre_model=load_genre_model(path, manifest),
+        manifest=manifest,
+        store=CatalogStore.load(os.path.join(path, "store"), mmap=shared),
+        artists=ArtistIndex.load(os.path.join(path, "artists"), mmap=shared),
+    )
+
+
+def current_version(out_dir: str = ARTIFACT_DIR):
+    try:
+        with open(os.path.join(out_dir, "CURRENT")) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def _build_once(out_dir: str, path: str, build) -> str:
+    """
+    runs build() unless the bundle at `path` is there. workers starting together wait for the one
+    holding the lock and load what it built instead of each fitting the same bundle
+    """
+    with build_lock(out_dir):
+        if os.path.exists(os.path.join(path, "manifest.json")):
+            return path
+        return build()
+
+
+def load_or_build_bundle(songs_csv: str = SONGS_CSV, genres_csv: str = GENRES_CSV, out_dir: str = ARTIFACT_DIR,
+                         params: dict = BUILD_PARAMS, source: str = CATALOG_SOURCE, frame: bool = True) -> ModelBundle:
+    """
+    loads the bundle matching the current source files, building it first if it is missing or stale.
+    when the source csvs are not shipped (prebuilt deploys) the CURRENT bundle is loaded as is.
+    with source="postgres" the songs come from music.song_features instead of songs_csv, through
+    the catalog snapshot (src/catalog.py), and an unreachable db falls back to CURRENT as well
+    """
+    if source == "postgres":
+        try:
+            src_hash = postgres_source_hash(genres_csv)
+        except Exception as e:
+            if current_version(out_dir) is None:
+                raise
+            print(f"Catalog database unavailable ({e}), loading the current bundle")
+            return load_bundle(os.path.join(out_dir, current_version(out_dir)), frame=frame)
+
+        version = bundle_version(src_hash, params)
+        path = os.path.join(out_dir, version)
+        if not os.path.exists(os.path.join(path, "manifest.json")):
+            print(f"Model bundle {version} is missing or stale, rebuilding from postgres")
+
+            def build():
+                data, fingerprint = load_postgres_catalog()
+                # the table may have changed since the check above, the bundle is versioned by what was read
+                return build_bundle(songs_csv, genres_csv, out_dir, params, data=data,
+                                    src_hash=postgres_source_hash(genres_csv, fingerprint))
+            path = _build_once(out_dir, path, build)
+    elif os.path.exists(songs_csv) and os.path.exists(genres_csv):
+        version = bundle_version(source_hash(songs_csv, genres_csv), params)
+        path = os.path.join(out_dir, version)
+        if not os.path.exists(os.path.join(path, "manifest.json")):
+            print(f"Model bundle {version} is missing or stale, rebuilding")
+            path = _build_once(out_dir, path, lambda: build_bundle(songs_csv, genres_csv, out_dir, params))
+    else:
+        version = current_version(out_dir)
+        if version is None:
+            raise FileNotFoundError(f"no source data at {songs_csv} and no prebuilt bundle in {out_dir}")
+        path = os.path.join(out_dir, version)
+
+    return load_bundle(path, frame=frame)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="build or inspect the recommender model bundle")
+    parser.add_argument("command", choices=["build", "status"])
+    parser.add_argument("--songs", default=SONGS_CSV)
+    parser.add_argument("--genres", default=GENRES_CSV)
+    parser.add_argument("--out", default=ARTIFACT_DIR)
+    parser.add_argument("--force", action="store_true", help="rebuild even if the bundle is up to date")
+    parser.add_argument("--source", choices=["csv", "postgres"], default=CATALOG_SOURCE)
+    args = parser.parse_args(argv)
+
+    if args.source == "postgres":
+        index.init_db_pools()
+        src_hash = postgres_source_hash(args.genres)
+    else:
+        src_hash = source_hash(args.songs, args.genres)
+    version = bundle_version(src_hash)
+    path = os.path.join(args.out, version)
+    up_to_date = os.path.exists(os.path.join(path, "manifest.json"))
+
+    if args.command == "status":
+        print(f"expected version: {version} ({'up to date' if up_to_date else 'stale'})")
+        print(f"current version:  {current_version(args.out)}")
+        return 0 if up_to_date else 1
+
+    with build_lock(args.out):
+        if os.path.exists(os.path.join(path, "manifest.json")) and not args.force:
+            print(f"Model bundle {version} is up to date")
+            return 0
+        # --force builds next to the live bundle and swaps it in, serving workers keep their copy
+        if args.source == "postgres":
+            data, fingerprint = load_postgres_catalog()
+            build_bundle(args.songs, args.genres, args.out, data=data,
+                         src_hash=postgres_source_hash(args.genres, fingerprint), replace=args.force)
+        else:
+            build_bundle(args.songs, args.genres, args.out, replace=args.force)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,48 @@
+import numpy as np
+import pandas as pd
+
+
+class GenrePartitions:
+    """
+    catalog row positions grouped by predicted_genre, so the genre filter can run before the
+    search: only the rows of the input genres are scored, exactly, against the query vector
+    """
+
+    def __init__(self, genres, features: np.ndarray):
+        codes, names = pd.factorize(pd.Series(genres), use_na_sentinel=True)
+        order = np.argsort(codes, kind="stable")
+        bounds = np.searchsorted(codes[order], np.arange(len(names) + 1))
+
+        self.features = features
+        self.rows = {name: order[bounds[i]:bounds[i + 1]] for i, name in enumerate(names)}
+
+    def __len__(self):
+        return len(self.rows)
+
+    def rows_for(self, genres) -> np.ndarray:
+        parts = [self.rows[genre] for genre in genres if genre in self.rows]
+        return np.concatenate(parts) if parts else np.empty(0, dtype=np.int64)
+
+    def nearest(self, query_vector, genres, n: int, exclude=None) -> np.ndarray:
+        """
+        the n rows of `genres` closest to query_vector (euclidean, like the annoy index), nearest
+        first. `exclude` is an optional boolean mask over the candidate rows' catalog positions
+        """
+        rows = self.rows_for(genres)
+        if exclude is not None:
+            rows = rows[~exclude[rows]]
+        return nearest_rows(self.features, rows, query_vector, n)
+
+
+def nearest_rows(features: np.ndarray, rows: np.ndarray, query_vector, n: int) -> np.ndarray:
+    """the n of `rows` whose features are closest to query_vector (euclidean), nearest first"""
+    if len(rows) == 0:
+        return rows
+
+    diff = np.asarray(features[rows], dtype=np.float32) - np.asarray(query_vector, dtype=np.float32)
+    dist = np.einsum("ij,ij->i", diff, diff)
+    if n < len(rows):
+        top = np.argpartition(dist, n - 1)[:n]
+    else:
+        top = np.arange(len(rows))
+    return rows[top[np.argsort(dist[top], kind="stable")]]
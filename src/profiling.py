@@ -0,0 +1,114 @@
+"""
+startup profiling. the app records how long each startup phase takes (pools, bundle load, lookups,
+indexes), /metrics reports them and STARTUP_PROFILE=1 prints them once startup is done.
+
+    python -m src.profiling [--service recommend|generate] [--top 20]
+
+imports the service the way a worker does and prints where the time goes: per module import times
+(python -X importtime, in a fresh interpreter so nothing is imported yet), the import of the app
+itself and every startup phase
+"""
+import os
+import sys
+import time
+import argparse
+import subprocess
+
+from contextlib import contextmanager
+from typing import Dict, List
+
+STARTUP_PROFILE = os.getenv("STARTUP_PROFILE", "0") == "1"
+
+SERVICES = {"recommend": "src.app", "generate": "src.gen_app"}
+
+_phases: Dict[str, float] = {}  # phase -> seconds, the last run of each
+
+
+@contextmanager
+def phase(name: str):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        _phases[name] = time.perf_counter() - started
+
+
+def startup_phases() -> Dict[str, float]:
+    return {name: round(seconds, 4) for name, seconds in _phases.items()}
+
+
+def print_phases():
+    print(f"{'phase':<24} {'ms':>9}")
+    for name, seconds in _phases.items():
+        print(f"{name:<24} {seconds * 1000:>9.1f}")
+    print(f"{'total':<24} {sum(_phases.values()) * 1000:>9.1f}")
+
+
+def parse_importtime(stderr: str) -> List[dict]:
+    """the lines of python -X importtime as {module, self_us, cumulative_us, depth}"""
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        modules.append({
+            "module": name.strip(),
+            "self_us": int(self_us),
+            "cumulative_us": int(cumulative_us),
+            "depth": (len(name) - len(name.lstrip())) // 2,
+        })
+    return modules
+
+
+def import_times(module: str) -> List[dict]:
+    """imports `module` in a fresh interpreter with -X importtime"""
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                            capture_output=True, text=True, cwd=os.getcwd())
+    if result.returncode != 0:
+        raise RuntimeError(f"importing {module} failed:\n{result.stderr[-2000:]}")
+    return parse_importtime(result.stderr)
+
+
+def by_package(modules: List[dict]) -> Dict[str, int]:
+    """self time summed per top level package, microseconds, slowest first"""
+    totals = {}
+    for m in modules:
+        package = m["module"].split(".")[0]
+        totals[package] = totals.get(package, 0) + m["self_us"]
+    return dict(sorted(totals.items(), key=lambda item: -item[1]))
+
+
+def print_imports(modules: List[dict], top: int):
+    total = sum(m["self_us"] for m in modules)
+    print(f"{len(modules)} modules imported in {total / 1000:.1f} ms\n")
+    print(f"{'package':<32} {'self ms':>9}")
+    for package, self_us in list(by_package(modules).items())[:top]:
+        print(f"{package:<32} {self_us / 1000:>9.1f}")
+    print(f"\n{'module':<48} {'self ms':>9} {'cumul ms':>9}")
+    for m in sorted(modules, key=lambda m: -m["cumulative_us"])[:top]:
+        print(f"{m['module']:<48} {m['self_us'] / 1000:>9.1f} {m['cumulative_us'] / 1000:>9.1f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="where a service's import and startup time goes")
+    parser.add_argument("--service", choices=sorted(SERVICES), default="recommend")
+    parser.add_argument("--top", type=int, default=20)
+    parser.add_argument("--imports-only", action="store_true", help="skip running the startup event")
+    args = parser.parse_args(argv)
+    module = SERVICES[args.service]
+    # run as python -m this file is __main__, the app records its phases in the src.profiling module
+    from src.profiling import phase, print_phases
+
+    print_imports(import_times(module), args.top)
+
+    with phase("import app"):
+        app_module = __import__(module, fromlist=["app"])
+    if not args.imports_only:
+        app_module.startup_event()
+    print()
+    print_phases()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
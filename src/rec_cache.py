@@ -0,0 +1,151 @@
+import os
+import json
+import time
+import hashlib
+import threading
+
+from typing import List, Dict, Callable, Optional
+from collections import OrderedDict
+
+from redis import RedisError
+
+from src.reoc import normalize_song_name
+from src.database.redis.index import get_redis
+
+REC_CACHE_SIZE = int(os.getenv("REC_CACHE_SIZE", 10_000))
+REC_CACHE_TTL = int(os.getenv("REC_CACHE_TTL", 3600))
+REC_CACHE_REDIS = os.getenv("REC_CACHE_REDIS", "1") == "1"
+
+_CURRENT = object()  # set()'s default version, whatever the cache is on when it is called
+
+
+def cache_key(song_list: List[Dict], n_songs: int, version: str, options: Dict = None) -> str:
+    """same seed set in any order, casing or duplication -> same key. `options` are any other request parameters"""
+    seeds = sorted({(normalize_song_name(song['name']), int(song['year'])) for song in song_list})
+    payload = {"seeds": seeds, "n": n_songs, "v": version}
+    if options:
+        payload["o"] = dict(sorted(options.items()))
+    payload = json.dumps(payload, separators=(",", ":"))
+    return hashlib.sha1(payload.encode()).hexdigest()
+
+
+class RecommendationCache:
+    """
+    two tier cache in front of recommend_songs: an in-process LRU and, when a redis pool is up,
+    a shared redis tier. keys include the model version so a rebuilt index never serves old results
+    """
+
+    def __init__(self, max_entries: int = REC_CACHE_SIZE, ttl: int = REC_CACHE_TTL, use_redis: bool = REC_CACHE_REDIS,
+                 redis_getter: Callable = get_redis, prefix: str = "rec"):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.use_redis = use_redis
+        self.redis_getter = redis_getter
+        self.prefix = prefix
+        self.version = None
+
+        self._entries = OrderedDict()  # key -> (expires_at, recommendations)
+        self._lock = threading.Lock()
+        self._counters = dict.fromkeys(
+            ["hits", "misses", "evictions", "expired", "redis_hits", "redis_errors", "invalidations", "stale_writes"], 0
+        )
+
+    def _count(self, name: str, n: int = 1):
+        with self._lock:
+            self._counters[name] += n
+
+    def _redis(self):
+        return self.redis_getter() if self.use_redis else None
+
+    def get(self, song_list: List[Dict], n_songs: int, options: Dict = None) -> Optional[List[Dict]]:
+        key = cache_key(song_list, n_songs, self.version, options)
+        now = time.time()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self._counters["hits"] += 1
+                    return [dict(row) for row in value]
+                del self._entries[key]
+                self._counters["expired"] += 1
+
+        redis_con = self._redis()
+        if redis_con is not None:
+            try:
+                raw = redis_con.get(f"{self.prefix}:{key}")
+            except RedisError:
+                raw = None
+                self._count("redis_errors")
+            if raw is not None:
+                value = json.loads(raw)
+                self._store(key, value)
+                self._count("redis_hits")
+                self._count("hits")
+                return value
+
+        self._count("misses")
+        return None
+
+    def _store(self, key: str, value: List[Dict], version=_CURRENT) -> bool:
+        with self._lock:
+            if version is not _CURRENT and version != self.version:
+                # computed before an invalidate, from the catalog / index that was replaced
+                self._counters["stale_writes"] += 1
+                return False
+            self._entries[key] = (time.time() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._counters["evictions"] += 1
+        return True
+
+    def set(self, song_list: List[Dict], n_songs: int, value: List[Dict], options: Dict = None,
+            version=_CURRENT):
+        """
+        `version` is the cache version taken before the value was computed (see get_or_compute),
+        the write is dropped when an invalidate switched versions in between
+        """
+        key = cache_key(song_list, n_songs, self.version if version is _CURRENT else version, options)
+        value = [dict(row) for row in value]
+        if not self._store(key, value, version):
+            return
+
+        redis_con = self._redis()
+        if redis_con is not None:
+            try:
+                redis_con.setex(f"{self.prefix}:{key}", self.ttl, json.dumps(value))
+            except RedisError:
+                self._count("redis_errors")
+
+    def get_or_compute(self, song_list: List[Dict], n_songs: int, compute: Callable[[], List[Dict]],
+                       options: Dict = None) -> List[Dict]:
+        version = self.version
+        cached = self.get(song_list, n_songs, options)
+        if cached is not None:
+            return cached
+        value = compute()
+        self.set(song_list, n_songs, value, options, version=version)
+        return value
+
+    def invalidate(self, version: str = None):
+        """
+        drops the local tier. redis entries are keyed on the version, so switching to the new
+        version orphans them and they run out on their ttl
+        """
+        with self._lock:
+            self._entries.clear()
+            self._counters["invalidations"] += 1
+            if version is not None:
+                self.version = version
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._counters)
+            stats["size"] = len(self._entries)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = round(stats["hits"] / lookups, 4) if lookups else 0.0
+        stats["version"] = self.version
+        return stats
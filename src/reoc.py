@@ -1,20 +1,102 @@
+import unicodedata
 
 import pandas as pd
 import numpy as np
 
-from typing import List, Dict
+from typing import List, Dict, Optional
 from collections import defaultdict
 from src.utils import number_cols 
 
 
-def get_song_data(song: Dict, spotify_data: pd.DataFrame):
+def normalize_song_name(name: str) -> str:
+    """case, unicode form and whitespace insensitive key, "Shut  Up and DANCE" -> "shut up and dance" """
+    return " ".join(unicodedata.normalize("NFKC", name).casefold().split())
+
+
+def unique_seeds(song_list: List[Dict], artists: List[str] = ()):
+    """
+    the seed songs and artists without repeats, first one kept. a repeated seed would weigh the
+    query mean twice while the cache key (same normalization) treats the lists as one
+    """
+    seen = set()
+    songs = []
+    for song in song_list:
+        key = (normalize_song_name(song['name']), int(song['year']))
+        if key not in seen:
+            seen.add(key)
+            songs.append(song)
+    seen = set()
+    unique_artists = []
+    for artist in artists or ():
+        if normalize_song_name(artist) not in seen:
+            seen.add(normalize_song_name(artist))
+            unique_artists.append(artist)
+    return songs, unique_artists
+
+
+class SongLookup:
+    """
+    (name, year) -> row position index over spotify_data, built once at load time so resolving
+    seed songs is a dict hit instead of a boolean mask over the whole catalog.
+    duplicates keep the first row, same as `.iloc[0]` on the mask did
+    """
+
+    def __init__(self, spotify_data: pd.DataFrame):
+        self.exact = {}
+        self.normalized = {}
+        self.add(spotify_data)
+
+    def add(self, spotify_data: pd.DataFrame, start: int = 0):
+        """indexes rows that were appended to the catalog at row position `start`"""
+        names = np.asarray(spotify_data['name'])
+        years = np.asarray(spotify_data['year'])
+        for pos, (name, year) in enumerate(zip(names, years), start):
+            if not isinstance(name, str):
+                continue
+            year = int(year)
+            self.exact.setdefault((name, year), pos)
+            self.normalized.setdefault((normalize_song_name(name), year), pos)
+
+    def __len__(self):
+        return len(self.exact)
+
+    def get(self, name: str, year: int) -> Optional[int]:
+        pos = self.exact.get((name, year))
+        if pos is None:
+            pos = self.normalized.get((normalize_song_name(name), year))
+        return pos
+
+    def positions(self, song_list: List[Dict]) -> np.ndarray:
+        """row positions of every song in song_list that is in the catalog, unknown songs are skipped"""
+        found = (self.get(song['name'], int(song['year'])) for song in song_list)
+        return np.fromiter((pos for pos in found if pos is not None), dtype=np.int64)
+
+
+def get_seed_rows(song_list: List[Dict], spotify_data: pd.DataFrame, lookup: SongLookup) -> pd.DataFrame:
+    """catalog rows of the seed songs in one batched lookup"""
+    positions = lookup.positions(song_list)
+    # the lookup can already know rows ingested after this copy of the catalog was taken
+    return spotify_data.iloc[positions[positions < len(spotify_data)]]
+
+
+def get_song_data(song: Dict, spotify_data: pd.DataFrame, lookup: SongLookup = None):
+    if lookup is not None:
+        pos = lookup.get(song['name'], int(song['year']))
+        return None if pos is None else spotify_data.iloc[pos]
+
     try:
         song_data = spotify_data[(spotify_data['name'] == song['name']) & (spotify_data['year'] == song['year'])].iloc[0]
         return song_data
     except IndexError:
         return None
 
-def get_mean_vector(song_list: List[Dict], spotify_data: pd.DataFrame):
+def get_mean_vector(song_list: List[Dict], spotify_data: pd.DataFrame, lookup: SongLookup = None):
+    if lookup is not None:
+        seeds = get_seed_rows(song_list, spotify_data, lookup)
+        if seeds.empty:
+            return None
+        return seeds[number_cols].to_numpy(dtype=np.float64).mean(axis=0)
+
     song_vectors = []
     for song in song_list:
         song_data = get_song_data(song, spotify_data)
@@ -34,3 +116,5 @@ def flatten_dict_list(dict_list: List[Dict]):
     return flattened_dict
 
 
+
+
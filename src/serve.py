@@ -0,0 +1,128 @@
+"""
+pre-fork launcher. `uvicorn --workers N` starts N fresh interpreters and every one of them loads
+its own catalog, lookups and pipeline. here the model bundle is loaded once in this process and the
+workers are forked from it, so they start with everything in place and share it copy on write
+(the numeric columns, features and annoy index are file mappings and stay shared regardless).
+
+    python -m src.serve --workers 4 --port 8000
+
+connections, pools and background threads are not created here, each worker sets those up in the
+app's startup event after the fork
+"""
+import os
+import gc
+import sys
+import time
+import signal
+import socket
+import argparse
+import traceback
+
+import uvicorn
+
+from src import app as app_module
+from src.catalog import CATALOG_SOURCE
+from src.model_store import load_or_build_bundle
+from src.profiling import STARTUP_PROFILE, phase, print_phases
+from src.database.postgres import index
+
+SERVE_HOST = os.getenv("SERVE_HOST", "0.0.0.0")
+SERVE_PORT = int(os.getenv("SERVE_PORT", 8000))
+SERVE_WORKERS = int(os.getenv("SERVE_WORKERS", os.cpu_count() or 1))
+
+
+def preload():
+    started = time.time()
+    with phase("bundle load"):
+        if CATALOG_SOURCE == "postgres":
+            # only to read the catalog, the pool must not outlive the fork
+            index.init_db_pools()
+            try:
+                bundle = load_or_build_bundle(frame=False)
+            finally:
+                index.close_db_pools()
+        else:
+            bundle = load_or_build_bundle(frame=False)
+    app_module.load_model(bundle)
+    if STARTUP_PROFILE:
+        print_phases()
+
+    # everything loaded so far lives as long as the workers do. frozen objects are skipped by the
+    # collector, so gc passes in the workers don't write to (and un-share) their pages
+    gc.collect()
+    gc.freeze()
+    print(f"✅ Model preloaded in {time.time() - started:.1f}s, forking workers.")
+
+
+def bind(host: str, port: int) -> socket.socket:
+    sock = socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+def run_worker(sock: socket.socket, log_level: str):
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(sig, signal.SIG_DFL)
+    config = uvicorn.Config(app_module.app, log_level=log_level)
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+def spawn(sock: socket.socket, log_level: str) -> int:
+    pid = os.fork()
+    if pid == 0:
+        try:
+            run_worker(sock, log_level)
+        except BaseException:
+            traceback.print_exc()
+            os._exit(1)
+        os._exit(0)
+    return pid
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="serve the api from workers forked off one preloaded model")
+    parser.add_argument("--host", default=SERVE_HOST)
+    parser.add_argument("--port", type=int, default=SERVE_PORT)
+    parser.add_argument("--workers", type=int, default=SERVE_WORKERS)
+    parser.add_argument("--log-level", default="info")
+    args = parser.parse_args(argv)
+
+    preload()
+    sock = bind(args.host, args.port)
+    workers = {spawn(sock, args.log_level) for _ in range(args.workers)}
+    print(f"✅ Serving on {args.host}:{args.port} with {len(workers)} workers.")
+
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in workers:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    while workers:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        workers.discard(pid)
+        if not stopping:
+            # a crashed worker is replaced from the same preloaded parent
+            print(f"Worker {pid} exited with status {status}, starting a new one.")
+            time.sleep(1)
+            workers.add(spawn(sock, args.log_level))
+    sock.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,196 @@
+import io
+import os
+import json
+import time
+import hashlib
+
+from typing import Callable, Optional
+from urllib.parse import urlparse, parse_qs
+
+from redis import RedisError
+
+from src.database.redis.index import get_redis
+from src.song_Gen import youTfileCreateor
+
+CLIP_CACHE_DIR = os.getenv("CLIP_CACHE_DIR", "clip_cache")
+CLIP_CACHE_MAX_BYTES = int(float(os.getenv("CLIP_CACHE_MAX_MB", 512)) * 2 ** 20)
+# mureka file ids are not kept forever, re-upload from the disk clip once the mapping runs out
+CLIP_REF_TTL = int(os.getenv("CLIP_REF_TTL", 3 * 24 * 3600))
+CLIP_DURATION = 30
+CLIP_FORMAT = "mp3"
+
+
+def youtube_video_id(url: str) -> Optional[str]:
+    """the 11 char video id from any of the usual youtube url shapes, None if there is none"""
+    parsed = urlparse(url.strip() if "://" in url else f"https://{url.strip()}")
+    host = (parsed.hostname or "").lower().removeprefix("www.").removeprefix("m.").removeprefix("music.")
+    path = [part for part in parsed.path.split("/") if part]
+
+    if host == "youtu.be" and path:
+        return path[0]
+    if host.endswith("youtube.com") or host == "youtube-nocookie.com":
+        video = parse_qs(parsed.query).get("v")
+        if video:
+            return video[0]
+        if len(path) >= 2 and path[0] in ("shorts", "embed", "live", "v"):
+            return path[1]
+    return None
+
+
+def clip_key(youtube_url: str, duration: int = CLIP_DURATION, fmt: str = CLIP_FORMAT) -> str:
+    """same video + same analysis settings -> same clip, so the key covers both"""
+    video = youtube_video_id(youtube_url) or youtube_url.strip()
+    params = {
+        "video": video,
+        "duration": duration,
+        "format": fmt,
+        "analysis_sr": youTfileCreateor.ANALYSIS_SR,
+        "hop": youTfileCreateor.HOP_SECONDS,
+        "frame": youTfileCreateor.FRAME_SECONDS,
+    }
+    payload = json.dumps(params, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(payload.encode()).hexdigest()[:32]
+
+
+class ClipCache:
+    """
+    reference clips keyed on clip_key. the clip itself is kept on local disk (lru by mtime, bounded
+    to max_bytes, safe to share between worker processes), the mureka file id it was uploaded as
+    lives in redis with a ttl. a hit on the file id skips download, analysis and upload, a hit on
+    the disk clip still skips download and analysis
+    """
+
+    def __init__(self, directory: str = CLIP_CACHE_DIR, max_bytes: int = CLIP_CACHE_MAX_BYTES,
+                 ref_ttl: int = CLIP_REF_TTL, redis_getter: Callable = get_redis, prefix: str = "clipref"):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.ref_ttl = ref_ttl
+        self.redis_getter = redis_getter
+        self.prefix = prefix
+        self._counters = dict.fromkeys(["ref_hits", "clip_hits", "misses", "bytes_saved", "evictions",
+                                        "redis_errors"], 0)
+
+    # --- disk tier ---
+
+    def _paths(self, key: str):
+        return os.path.join(self.directory, f"{key}.{CLIP_FORMAT}"), os.path.join(self.directory, f"{key}.json")
+
+    def load_clip(self, key: str):
+        """(clip bytes, meta) or None, a hit refreshes the clip's place in the lru"""
+        clip_path, meta_path = self._paths(key)
+        try:
+            with open(clip_path, "rb") as f:
+                clip = f.read()
+            with open(meta_path) as f:
+                meta = json.load(f)
+            os.utime(clip_path)
+        except (FileNotFoundError, ValueError):
+            return None
+        return clip, meta
+
+    def store_clip(self, key: str, clip: bytes, meta: dict):
+        os.makedirs(self.directory, exist_ok=True)
+        clip_path, meta_path = self._paths(key)
+        # written under a unique name then renamed, two workers storing the same clip is harmless
+        for path, content, mode in ((meta_path, json.dumps(meta), "w"), (clip_path, clip, "wb")):
+            tmp = f"{path}.{os.getpid()}.tmp"
+            with open(tmp, mode) as f:
+                f.write(content)
+            os.replace(tmp, path)
+        self.evict()
+
+    def disk_usage(self) -> int:
+        try:
+            return sum(entry.stat().st_size for entry in os.scandir(self.directory)
+                       if entry.name.endswith(f".{CLIP_FORMAT}"))
+        except FileNotFoundError:
+            return 0
+
+    def evict(self):
+        """drops least recently used clips until the cache fits in max_bytes"""
+        try:
+            clips = [entry for entry in os.scandir(self.directory) if entry.name.endswith(f".{CLIP_FORMAT}")]
+        except FileNotFoundError:
+            return
+        clips = sorted((entry.stat().st_mtime, entry.stat().st_size, entry.path) for entry in clips)
+        total = sum(size for _, size, _ in clips)
+        for _, size, path in clips:
+            if total <= self.max_bytes:
+                break
+            for stale in (path, f"{os.path.splitext(path)[0]}.json"):
+                try:
+                    os.remove(stale)
+                except FileNotFoundError:
+                    pass
+            total -= size
+            self._counters["evictions"] += 1
+
+    # --- redis tier ---
+
+    def _redis_call(self, method: str, *args):
+        redis_con = self.redis_getter()
+        if redis_con is None:
+            return None
+        try:
+            return getattr(redis_con, method)(*args)
+        except RedisError:
+            self._counters["redis_errors"] += 1
+            return None
+
+    def get_ref(self, key: str) -> Optional[dict]:
+        raw = self._redis_call("get", f"{self.prefix}:{key}")
+        return json.loads(raw) if raw else None
+
+    def set_ref(self, key: str, ref: dict):
+        self._redis_call("setex", f"{self.prefix}:{key}", self.ref_ttl, json.dumps(ref))
+
+    # --- pipeline ---
+
+    def reference_id(self, youtube_url: str, workdir: str, upload: Callable, on_stage: Callable = None):
+        """
+        mureka reference id for the link's best 30s, doing only the stages the cache can't answer.
+        returns (file id, {"cache": "ref_hit" | "clip_hit" | "miss", "bytes_saved": n})
+        """
+        on_stage = on_stage or (lambda stage: None)
+        key = clip_key(youtube_url)
+
+        ref = self.get_ref(key)
+        if ref is not None:
+            saved = ref.get("source_bytes", 0) + ref.get("clip_bytes", 0)
+            return ref["file_id"], self._outcome("ref_hits", "ref_hit", saved)
+
+        cached = self.load_clip(key)
+        if cached is not None:
+            clip, meta = cached
+            outcome = self._outcome("clip_hits", "clip_hit", meta.get("source_bytes", 0))
+        else:
+            on_stage("download")
+            source_path = youTfileCreateor.download_audio(youtube_url, workdir)
+            try:
+                source_bytes = os.path.getsize(source_path)
+                clip = youTfileCreateor.best_30s_clip(source_path, CLIP_DURATION, CLIP_FORMAT).getvalue()
+            finally:
+                os.remove(source_path)
+            meta = {"url": youtube_url, "source_bytes": source_bytes, "clip_bytes": len(clip),
+                    "created_at": int(time.time())}
+            self.store_clip(key, clip, meta)
+            outcome = self._outcome("misses", "miss", 0)
+
+        on_stage("upload")
+        buffer = io.BytesIO(clip)
+        buffer.name = f"best_{CLIP_DURATION}s.{CLIP_FORMAT}"
+        file_id = upload(buffer)
+        self.set_ref(key, {"file_id": file_id, "source_bytes": meta.get("source_bytes", 0), "clip_bytes": len(clip)})
+        return file_id, outcome
+
+    def _outcome(self, counter: str, label: str, saved: int) -> dict:
+        self._counters[counter] += 1
+        self._counters["bytes_saved"] += saved
+        return {"cache": label, "bytes_saved": saved}
+
+    def stats(self) -> dict:
+        stats = dict(self._counters)
+        lookups = stats["ref_hits"] + stats["clip_hits"] + stats["misses"]
+        stats["hit_rate"] = round((lookups - stats["misses"]) / lookups, 4) if lookups else 0.0
+        stats["disk_bytes"] = self.disk_usage()
+        return stats
@@ -0,0 +1,306 @@
+import os
+import json
+import time
+import uuid
+import queue
+import tempfile
+import threading
+import traceback
+import multiprocessing
+
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, Executor
+from concurrent.futures.process import BrokenProcessPool
+
+from src.database.redis.index import get_redis, init_redis_pool
+
+# worker processes per api process, not for the whole service: every uvicorn worker (or src.serve
+# fork) runs its own GenerationQueue, so up to GEN_WORKERS x api workers jobs run at once. scale
+# generation on its own with src.gen_app and keep SERVE_GENERATION=0 on the recommender
+GEN_WORKERS = int(os.getenv("GEN_WORKERS", 2))
+GEN_QUEUE_MAX = int(os.getenv("GEN_QUEUE_MAX", 100))
+GEN_JOB_TTL = int(os.getenv("GEN_JOB_TTL", 24 * 3600))
+# how long mureka may take to render a submitted song before the job fails
+GEN_RENDER_TIMEOUT = float(os.getenv("GEN_RENDER_TIMEOUT", 60))
+# finished songs land in GEN_OUTPUT_DIR/<job_id>.flac, intermediates in a per job temp dir under GEN_WORK_DIR
+GEN_OUTPUT_DIR = os.getenv("GEN_OUTPUT_DIR", "generated_songs")
+GEN_WORK_DIR = os.getenv("GEN_WORK_DIR") or None
+
+TERMINAL_STATUSES = ("succeeded", "failed", "rejected")
+
+
+class QueueFull(Exception):
+    pass
+
+
+class RedisJobStore:
+    """job state as a json blob per job in redis, readable from every worker and api process"""
+
+    def __init__(self, prefix: str = "genjob", ttl: int = GEN_JOB_TTL):
+        self.prefix = prefix
+        self.ttl = ttl
+
+    def _redis(self):
+        # worker processes start without a pool
+        if get_redis() is None:
+            init_redis_pool()
+        return get_redis()
+
+    def get(self, job_id: str):
+        raw = self._redis().get(f"{self.prefix}:{job_id}")
+        return json.loads(raw) if raw else None
+
+    def put(self, job: dict):
+        self._redis().setex(f"{self.prefix}:{job['id']}", self.ttl, json.dumps(job))
+
+
+class MemoryJobStore:
+    """
+    fallback when there is no redis. with process workers the mapping has to be a manager dict
+    so the workers' updates reach the api process, see MemoryJobStore.shared()
+    """
+
+    def __init__(self, mapping=None):
+        self.jobs = mapping if mapping is not None else {}
+
+    @classmethod
+    def shared(cls):
+        return cls(multiprocessing.Manager().dict())
+
+    def get(self, job_id: str):
+        job = self.jobs.get(job_id)
+        return dict(job) if job is not None else None
+
+    def put(self, job: dict):
+        self.jobs[job['id']] = dict(job)
+
+
+def update_job(store, job_id: str, **fields) -> dict:
+    job = store.get(job_id) or {"id": job_id}
+    job.update(fields, updated_at=time.time())
+    store.put(job)
+    return job
+
+
+def run_generation_job(job_id: str, payload: dict, store):
+    """
+    runs inside a worker process: reference clip (download, upload) when a youtube link is given,
+    then lyrics and the song/generate call. returns the mureka task id (None when the job failed),
+    the worker is free again while mureka renders the song: the queue's poller in the api process
+    tracks the task and finish_job downloads the result. each job works in its own temp dir, so
+    parallel jobs never share a file
+    """
+    from src.song_Gen.murka_test import submit_song, upload_file_to_mureka
+
+    update_job(store, job_id, status="running", started_at=time.time())
+    try:
+        with tempfile.TemporaryDirectory(prefix=f"genjob-{job_id}-", dir=GEN_WORK_DIR) as workdir:
+            ref_id = None
+            if payload.get("youTube_link"):
+                from src.song_Gen.clip_cache import ClipCache
+
+                # a link seen before skips download + analysis (clip on disk) or everything (file id in redis)
+                ref_id, clip_cache = ClipCache().reference_id(
+                    payload["youTube_link"], workdir, upload=upload_file_to_mureka,
+                    on_stage=lambda stage: update_job(store, job_id, stage=stage))
+                update_job(store, job_id, clip_cache=clip_cache)
+
+            update_job(store, job_id, stage="generate")
+            task_id = submit_song(payload["lyric_prompt"], prompt=payload.get("song_prompt"), reference_id=ref_id)
+
+        update_job(store, job_id, stage="rendering", task_id=task_id)
+        return task_id
+    except Exception as e:
+        update_job(store, job_id, status="failed", finished_at=time.time(), error=str(e))
+        traceback.print_exc()
+        return None
+
+
+def finish_job(store, job_id: str, poll_data: dict):
+    """downloads the rendered song to GEN_OUTPUT_DIR/<job_id>.flac, in the api process"""
+    from src.song_Gen.murka_test import finish_song
+
+    lyrics, song_path = finish_song(poll_data, os.path.join(GEN_OUTPUT_DIR, f"{job_id}.flac"))
+    update_job(store, job_id, status="succeeded", stage="done", finished_at=time.time(),
+               result={"lyrics": lyrics, "song_path": song_path})
+
+
+class GenerationQueue:
+    """
+    /genSong jobs: submit() stores the job and returns its id straight away, a dispatcher thread
+    hands jobs to the worker pool whenever one of the `workers` slots is free. jobs beyond
+    `max_queued` waiting ones are rejected with QueueFull.
+    a worker only holds its slot until the song is submitted, the render is tracked by one
+    TaskPoller in this process and the finished song is downloaded on a small thread pool
+    """
+
+    def __init__(self, store, workers: int = GEN_WORKERS, max_queued: int = GEN_QUEUE_MAX, executor: Executor = None,
+                 poller=None, render_timeout: float = GEN_RENDER_TIMEOUT, job=run_generation_job):
+        self.store = store
+        self.workers = workers
+        self.job = job
+        # a process pool we made ourselves is replaced when a dead worker process breaks it
+        self._owns_executor = executor is None
+        self.executor = executor or self._new_executor()
+        self.poller = poller  # TaskPoller over mureka's song query, created with the first render
+        self.render_timeout = render_timeout
+        self._finishers = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="genjob-finish")
+        self._pending = queue.Queue(maxsize=max_queued)
+        self._slots = threading.BoundedSemaphore(workers)
+        self._lock = threading.Lock()
+        self._counters = dict.fromkeys(["submitted", "rejected", "succeeded", "failed", "running", "rendering",
+                                        "clip_cache_hits", "clip_cache_misses", "clip_bytes_saved"], 0)
+        self._closed = False
+
+        self._dispatcher = threading.Thread(target=self._dispatch, name="genjob-dispatcher", daemon=True)
+        self._dispatcher.start()
+
+    def submit(self, payload: dict) -> str:
+        job_id = uuid.uuid4().hex
+        # stored before it is queued, so the worker's "running" can never be overwritten by "queued"
+        update_job(self.store, job_id, status="queued", stage="queued", created_at=time.time(),
+                   request={key: value for key, value in payload.items() if value is not None})
+        try:
+            self._pending.put_nowait((job_id, payload))
+        except queue.Full:
+            update_job(self.store, job_id, status="rejected", error="generation queue is full")
+            with self._lock:
+                self._counters["rejected"] += 1
+            raise QueueFull(f"generation queue is full ({self._pending.maxsize} jobs waiting)")
+
+        with self._lock:
+            self._counters["submitted"] += 1
+        return job_id
+
+    def get(self, job_id: str):
+        return self.store.get(job_id)
+
+    def _new_executor(self) -> Executor:
+        return ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+
+    def _replace_broken(self, executor: Executor):
+        """
+        a worker process that dies (oom in ffmpeg or the upload) breaks the whole ProcessPoolExecutor,
+        every later submit would raise BrokenProcessPool. the first one to notice swaps in a new pool
+        """
+        with self._lock:
+            if not self._owns_executor or self._closed or self.executor is not executor:
+                return
+            self.executor = self._new_executor()
+        executor.shutdown(wait=False, cancel_futures=True)
+        print("Generation worker pool was broken by a dead worker process, started a new one.")
+
+    def _dispatch(self):
+        while True:
+            # wait for a free slot first, so a job only leaves the pending queue when it can start
+            self._slots.acquire()
+            item = self._pending.get()
+            if item is None or self._closed:
+                self._slots.release()
+                return
+            job_id, payload = item
+            with self._lock:
+                self._counters["running"] += 1
+                executor = self.executor
+            try:
+                future = executor.submit(self.job, job_id, payload, self.store)
+            except Exception as e:
+                # the job never started: fail it and give its slot back instead of losing the dispatcher
+                update_job(self.store, job_id, status="failed", finished_at=time.time(),
+                           error=f"could not start the job: {e!r}")
+                if isinstance(e, BrokenProcessPool):
+                    self._replace_broken(executor)
+                self._slots.release()
+                with self._lock:
+                    self._counters["running"] -= 1
+                    self._counters["failed"] += 1
+                continue
+            future.add_done_callback(lambda f, job_id=job_id, executor=executor: self._finished(job_id, f, executor))
+
+    def _finished(self, job_id: str, future, executor: Executor = None):
+        if not future.cancelled() and isinstance(future.exception(), BrokenProcessPool):
+            # before the slot is released, so the next job already goes to the new pool
+            self._replace_broken(executor)
+        self._slots.release()
+        task_id = None
+        if future.cancelled():
+            pass
+        elif future.exception() is not None:
+            # the worker process died before it could record the failure itself
+            update_job(self.store, job_id, status="failed", finished_at=time.time(), error=str(future.exception()))
+        else:
+            task_id = future.result()
+
+        job = self.store.get(job_id) or {}
+        with self._lock:
+            self._counters["running"] -= 1
+            if task_id:
+                self._counters["rendering"] += 1
+            elif job.get("status") in ("succeeded", "failed"):
+                self._counters[job["status"]] += 1
+            # the workers are separate processes, so reference clip cache outcomes come back on the job
+            clip_cache = job.get("clip_cache")
+            if clip_cache:
+                self._counters["clip_cache_misses" if clip_cache["cache"] == "miss" else "clip_cache_hits"] += 1
+                self._counters["clip_bytes_saved"] += clip_cache["bytes_saved"]
+
+        if task_id:
+            render = self._poller().track(task_id, self.render_timeout)
+            render.add_done_callback(lambda f, job_id=job_id: self._rendered(job_id, f))
+
+    def _poller(self):
+        with self._lock:
+            if self.poller is None:
+                from src.song_Gen.murka_test import query_song_task
+                from src.song_Gen.task_poller import TaskPoller
+
+                self.poller = TaskPoller(query_song_task)
+            return self.poller
+
+    def _rendered(self, job_id: str, render):
+        """runs on the poller thread, the download goes to the finisher pool so polling never waits on it"""
+        if render.cancelled() or self._closed:
+            self._render_done(job_id, error="the generation queue shut down while the song was rendering")
+        elif render.exception() is not None:
+            self._render_done(job_id, error=str(render.exception()))
+        else:
+            self._finishers.submit(self._download, job_id, render.result())
+
+    def _download(self, job_id: str, poll_data: dict):
+        try:
+            finish_job(self.store, job_id, poll_data)
+            self._render_done(job_id)
+        except Exception as e:
+            traceback.print_exc()
+            self._render_done(job_id, error=str(e))
+
+    def _render_done(self, job_id: str, error: str = None):
+        if error is not None:
+            update_job(self.store, job_id, status="failed", finished_at=time.time(), error=error)
+        with self._lock:
+            self._counters["rendering"] -= 1
+            self._counters["failed" if error is not None else "succeeded"] += 1
+
+    def queue_depth(self) -> int:
+        return self._pending.qsize()
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._counters)
+        lookups = stats["clip_cache_hits"] + stats["clip_cache_misses"]
+        stats["clip_cache_hit_rate"] = round(stats["clip_cache_hits"] / lookups, 4) if lookups else 0.0
+        stats.update(queue_depth=self.queue_depth(), workers=self.workers)
+        return stats
+
+    def shutdown(self, wait: bool = True):
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+        try:
+            self._pending.put_nowait(None)
+        except queue.Full:
+            pass
+        self.executor.shutdown(wait=wait, cancel_futures=not wait)
+        if self.poller is not None:
+            self.poller.shutdown()
+        self._finishers.shutdown(wait=wait)
@@ -0,0 +1,129 @@
+import os
+import json
+import time
+import hashlib
+import threading
+import unicodedata
+
+from typing import Callable, Optional
+from collections import OrderedDict
+from concurrent.futures import Future
+
+from redis import RedisError
+
+from src.database.redis.index import get_redis
+
+LYRICS_CACHE_SIZE = int(os.getenv("LYRICS_CACHE_SIZE", 2000))
+LYRICS_CACHE_TTL = int(os.getenv("LYRICS_CACHE_TTL", 24 * 3600))
+
+_EDGE_PUNCTUATION = " \t\n.,!?;:'\"-"
+
+
+def normalize_prompt(prompt: str) -> str:
+    """unicode form, case, whitespace and surrounding punctuation insensitive, "  Summer LOVE!! " -> "summer love" """
+    return " ".join(unicodedata.normalize("NFKC", prompt).casefold().split()).strip(_EDGE_PUNCTUATION)
+
+
+def prompt_key(prompt: str) -> str:
+    return hashlib.sha1(normalize_prompt(prompt).encode()).hexdigest()
+
+
+class LyricsCache:
+    """
+    generated lyrics per normalized prompt, an in-process LRU with a ttl plus a shared redis tier
+    when a pool is up. concurrent misses on the same prompt are coalesced: the first caller runs the
+    upstream request and everybody else waits on its future. failures are handed to every waiter
+    and never cached
+    """
+
+    def __init__(self, max_entries: int = LYRICS_CACHE_SIZE, ttl: int = LYRICS_CACHE_TTL,
+                 redis_getter: Callable = get_redis, prefix: str = "lyrics"):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.redis_getter = redis_getter
+        self.prefix = prefix
+
+        self._entries = OrderedDict()  # key -> (expires_at, lyrics)
+        self._in_flight = {}  # key -> Future of the one upstream call
+        self._lock = threading.Lock()
+        self._counters = dict.fromkeys(["hits", "misses", "coalesced", "redis_hits", "redis_errors", "errors"], 0)
+
+    def _local(self, key: str) -> Optional[str]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, lyrics = entry
+        if expires_at <= time.time():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return lyrics
+
+    def _store(self, key: str, lyrics: str):
+        self._entries[key] = (time.time() + self.ttl, lyrics)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _redis_call(self, method: str, *args):
+        redis_con = self.redis_getter()
+        if redis_con is None:
+            return None
+        try:
+            return getattr(redis_con, method)(*args)
+        except RedisError:
+            with self._lock:
+                self._counters["redis_errors"] += 1
+            return None
+
+    def get_or_generate(self, prompt: str, generate: Callable[[str], str]) -> str:
+        key = prompt_key(prompt)
+
+        with self._lock:
+            lyrics = self._local(key)
+            if lyrics is not None:
+                self._counters["hits"] += 1
+                return lyrics
+            future = self._in_flight.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._in_flight[key] = future
+            else:
+                self._counters["coalesced"] += 1
+
+        if not leader:
+            return future.result()
+
+        try:
+            raw = self._redis_call("get", f"{self.prefix}:{key}")
+            if raw is not None:
+                lyrics = json.loads(raw)
+                counter = "redis_hits"
+            else:
+                lyrics = generate(prompt)
+                counter = "misses"
+                self._redis_call("setex", f"{self.prefix}:{key}", self.ttl, json.dumps(lyrics))
+        except Exception as e:
+            with self._lock:
+                self._counters["errors"] += 1
+                del self._in_flight[key]
+            future.set_exception(e)
+            raise
+
+        with self._lock:
+            self._store(key, lyrics)
+            self._counters[counter] += 1
+            if counter == "redis_hits":
+                self._counters["hits"] += 1
+            del self._in_flight[key]
+        future.set_result(lyrics)
+        return lyrics
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._counters)
+            stats["size"] = len(self._entries)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = round(stats["hits"] / lookups, 4) if lookups else 0.0
+        return stats
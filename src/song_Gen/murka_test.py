@@ -1,21 +1,47 @@
 
 import requests
-import json
+import asyncio
 import os
-import time
 from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
+
+from src.song_Gen.lyrics_cache import LyricsCache
+from src.song_Gen.task_poller import TaskPoller
 
 load_dotenv()
 
-api_key = os.getenv("MUREKA_API_KEY")
-if not api_key:
-    raise ValueError("MUREKA API key is missing")
 
+# overridable so the client can be pointed at a local mock of the api
+MUREKA_API_URL = os.getenv("MUREKA_API_URL", "https://api.mureka.ai")
+DOWNLOAD_CHUNK_SIZE = int(os.getenv("MUREKA_DOWNLOAD_CHUNK_SIZE", 1 << 16))
 
-headers = {
-    "Authorization": f"Bearer {api_key}",
-    "Content-Type": "application/json"
-    }
+MUREKA_POOL_SIZE = int(os.getenv("MUREKA_POOL_SIZE", 10))
+# a status query is cheap, one that hangs is retried on the next poll instead of waited out
+MUREKA_STATUS_TIMEOUT = float(os.getenv("MUREKA_STATUS_TIMEOUT", 5))
+
+# one keep-alive connection pool for every mureka call in this process
+session = requests.Session()
+session.mount("https://", HTTPAdapter(pool_connections=MUREKA_POOL_SIZE, pool_maxsize=MUREKA_POOL_SIZE))
+session.mount("http://", HTTPAdapter(pool_connections=MUREKA_POOL_SIZE, pool_maxsize=MUREKA_POOL_SIZE))
+
+lyrics_cache = LyricsCache()
+
+
+def api_session():
+    """the shared session with the api key set, checked on the first call instead of at import"""
+    if "Authorization" not in session.headers:
+        api_key = os.getenv("MUREKA_API_KEY")
+        if not api_key:
+            raise ValueError("MUREKA API key is missing")
+        session.headers["Authorization"] = f"Bearer {api_key}"
+    return session
+
+
+class MurekaError(Exception):
+    def __init__(self, status_code: int, message: str):
+        super().__init__(f"Mureka request failed: {status_code} | {message}")
+        self.status_code = status_code
+        self.message = message
 
 
 def generate_lyrics(prompt):
@@ -29,37 +55,45 @@ def generate_lyrics(prompt):
         str: The generated lyrics, or an error message.
     """
 
-    url = "https://api.mureka.ai/v1/lyrics/generate"
+    try:
+        return request_lyrics(prompt)
+    except MurekaError as e:
+        return f"Error {e.status_code}: {e.message}"
+
 
+def request_lyrics(prompt):
+    """one upstream lyrics call, raises MurekaError instead of returning the error text"""
+    url = f"{MUREKA_API_URL}/v1/lyrics/generate"
 
     data = {
         "prompt": prompt
     }
 
-    response = requests.post(url, headers=headers, json=data)
+    response = api_session().post(url, json=data, timeout=60)
 
     if response.status_code == 200:
         return response.json().get("lyrics", "No lyrics returned.")
-    else:
-        return f"Error {response.status_code}: {response.text}"
+    raise MurekaError(response.status_code, response.text)
 
 
-# TODO handel the aduio files in a better way 
-def upload_file_to_mureka(file_path='./best_30s.mp3', purpose="reference"):
-    url = "https://api.mureka.ai/v1/files/upload"
-    headers = {
-        "Authorization": f"Bearer {api_key}"
-    }
-    files = {
-        "file": open(file_path, "rb")
-    }
+def get_lyrics(prompt):
+    """lyrics for the prompt through the shared cache, identical prompts in flight share one call"""
+    return lyrics_cache.get_or_generate(prompt, request_lyrics)
+
+
+def upload_file_to_mureka(file='./best_30s.mp3', purpose="reference"):
+    """`file` is a path or an in memory file object (e.g. the BytesIO from download_songs_sample)"""
+    url = f"{MUREKA_API_URL}/v1/files/upload"
     data = {
         "purpose": purpose
     }
 
-    response = requests.post(url, headers=headers, files=files, data=data)
-
-    files["file"].close()
+    if isinstance(file, (str, os.PathLike)):
+        with open(file, "rb") as f:
+            response = api_session().post(url, files={"file": f}, data=data)
+    else:
+        name = os.path.basename(getattr(file, "name", "reference.mp3"))
+        response = api_session().post(url, files={"file": (name, file, "audio/mpeg")}, data=data)
 
     if response.status_code == 200:
         return response.json()['id']
@@ -67,9 +101,23 @@ def upload_file_to_mureka(file_path='./best_30s.mp3', purpose="reference"):
         raise Exception(f"Upload failed: {response.status_code}, {response.text}")
 
 
-def generate_song(lyricsPrompt, model="auto", prompt=None, reference_id=None, poll_interval=2, timeout=60):
+def download_to(url, path, chunk_size=DOWNLOAD_CHUNK_SIZE):
+    """streams `url` to `path` in chunks through a .part file, so a half written song is never picked up"""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    part = f"{path}.part"
+    # the flac is served from a cdn, the api key is not sent there
+    with session.get(url, stream=True, timeout=60, headers={"Authorization": None}) as response:
+        response.raise_for_status()
+        with open(part, "wb") as f:
+            for chunk in response.iter_content(chunk_size=chunk_size):
+                f.write(chunk)
+    os.replace(part, path)
+    return path
+
 
-    lyrics = generate_lyrics(prompt=lyricsPrompt)
+def submit_song(lyricsPrompt, model="auto", prompt=None, reference_id=None):
+    """lyrics + the song/generate call, returns the mureka task id"""
+    lyrics = get_lyrics(lyricsPrompt)
 
     data = {
         "lyrics": lyrics,
@@ -83,7 +131,7 @@ def generate_song(lyricsPrompt, model="auto", prompt=None, reference_id=None, po
     else:
         raise ValueError("you must provide either a prompt or a reference_id")
 
-    response = requests.post("https://api.mureka.ai/v1/song/generate", json=data, headers=headers)
+    response = api_session().post(f"{MUREKA_API_URL}/v1/song/generate", json=data, timeout=60)
     response.raise_for_status()
     result = response.json()
 
@@ -92,48 +140,55 @@ def generate_song(lyricsPrompt, model="auto", prompt=None, reference_id=None, po
         raise Exception("No task ID returned.")
 
     print(f"Task submitted. Task ID: {task_id}")
+    return task_id
+
 
-    status_url = f"https://api.mureka.ai/v1/song/query/{task_id}"
-    start_time = time.time()
+def finish_song(poll_data, output_path):
+    choice = poll_data["choices"][0]
+    flac_url = choice["flac_url"]
+    lyrics_sections = choice["lyrics_sections"]
 
-    while True:
-        time.sleep(poll_interval)
-        poll_response = requests.get(status_url, headers=headers)
+    full_lyrics = "\n".join(
+        line["text"]
+        for section in lyrics_sections
+        for line in section.get("lines", [])
+    )
 
-        try:
-            poll_data = poll_response.json()
-        except json.JSONDecodeError:
-            print("Failed to parse poll response:", poll_response.text)
-            continue
+    download_to(flac_url, output_path)
+    print(f"Song downloaded: {output_path}")
 
-        status = poll_data.get("status")
-        print(f"Task status: {status}")
+    return full_lyrics, output_path
+
+
+def generate_song(lyricsPrompt, model="auto", prompt=None, reference_id=None, poll_interval=None, timeout=60,
+                  output_path="generated_song.flac"):
+
+    """
+    submit, wait for the render and download in one call. the calling thread blocks until
+    song_poller resolves the task, the /genSong workers don't use this: they only submit and the
+    queue's poller in the api process tracks the render (src/song_Gen/jobs.py)
+    """
+    task_id = submit_song(lyricsPrompt, model, prompt, reference_id)
 
-        if status == "succeeded":
-            choice = poll_data["choices"][0]
-            flac_url = choice["flac_url"]
-            lyrics_sections = choice["lyrics_sections"]
+    poll_data = song_poller.track(task_id, timeout, initial_interval=poll_interval).result()
+    return finish_song(poll_data, output_path)
 
-            full_lyrics = "\n".join(
-                line["text"]
-                for section in lyrics_sections
-                for line in section.get("lines", [])
-            )
 
-            audio_data = requests.get(flac_url).content
-            filename = "generated_song.flac"
-            with open(filename, "wb") as f:
-                f.write(audio_data)
-            print(f"Song downloaded: {filename}")
+async def generate_song_async(lyricsPrompt, model="auto", prompt=None, reference_id=None, poll_interval=None,
+                              timeout=60, output_path="generated_song.flac"):
+    """generate_song for event loops, no thread is held while the task is pending"""
+    task_id = await asyncio.to_thread(submit_song, lyricsPrompt, model, prompt, reference_id)
+    poll_data = await song_poller.wait(task_id, timeout, initial_interval=poll_interval)
+    return await asyncio.to_thread(finish_song, poll_data, output_path)
 
-            return full_lyrics, filename
 
-        elif status == "failed":
-            raise Exception(f"generation failed: {poll_data.get('failed_reason')}")
+def query_song_task(task_id):
+    poll_response = api_session().get(f"{MUREKA_API_URL}/v1/song/query/{task_id}", timeout=MUREKA_STATUS_TIMEOUT)
+    poll_response.raise_for_status()
+    return poll_response.json()
 
-        elif time.time() - start_time > timeout:
-            raise TimeoutError("timed out after waiting too long for the songGen_api")
 
+song_poller = TaskPoller(query_song_task)
 
 
 # prompt = "r&b, slow, passionate, male vocal"
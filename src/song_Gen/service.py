@@ -0,0 +1,76 @@
+"""
+the song generation api, /genSong and its status and events. src.app mounts it next to the
+recommender, src.gen_app serves it alone without loading the catalog, the model bundle or the
+ml libraries. the mureka client and the audio libraries are imported by the job worker when it
+runs its first job (src/song_Gen/jobs.py)
+"""
+import os
+import json
+import asyncio
+
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
+
+from src.utils import GenSongInput
+from src.song_Gen.jobs import GenerationQueue, RedisJobStore, MemoryJobStore, QueueFull, TERMINAL_STATUSES
+from src.database.redis.index import get_redis
+
+GEN_EVENTS_INTERVAL = float(os.getenv("GEN_EVENTS_INTERVAL", 0.5))
+
+router = APIRouter()
+
+generation_queue = None  # GenerationQueue for /genSong, started with the app
+
+
+def start():
+    global generation_queue
+    # job state has to be visible to every api worker, redis when we have it
+    generation_queue = GenerationQueue(RedisJobStore() if get_redis() is not None else MemoryJobStore.shared())
+
+
+def stop():
+    if generation_queue is not None:
+        generation_queue.shutdown(wait=False)
+
+
+def stats():
+    return generation_queue.stats() if generation_queue else None
+
+
+@router.post("/genSong", status_code=202)
+def gen_song(input_data: GenSongInput):
+    """queues the generation and returns its job id, poll GET /genSong/{job_id} or stream /events"""
+    try:
+        job_id = generation_queue.submit(input_data.dict())
+    except QueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    return {"job_id": job_id, "status": "queued"}
+
+
+@router.get("/genSong/{job_id}")
+def gen_song_status(job_id: str):
+    job = generation_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown job id")
+    return job
+
+
+@router.get("/genSong/{job_id}/events")
+async def gen_song_events(job_id: str):
+    """server sent events with the job state every time it changes, until it is finished"""
+    if await run_in_threadpool(generation_queue.get, job_id) is None:
+        raise HTTPException(status_code=404, detail="Unknown job id")
+
+    async def events():
+        last = None
+        while True:
+            job = await run_in_threadpool(generation_queue.get, job_id)
+            if job != last:
+                yield f"data: {json.dumps(job)}\n\n"
+                last = job
+            if job is None or job.get("status") in TERMINAL_STATUSES:
+                return
+            await asyncio.sleep(GEN_EVENTS_INTERVAL)
+
+    return StreamingResponse(events(), media_type="text/event-stream")
@@ -0,0 +1,189 @@
+import os
+import time
+import heapq
+import random
+import asyncio
+import threading
+
+from typing import Callable
+from concurrent.futures import Future, InvalidStateError, ThreadPoolExecutor
+
+POLL_INITIAL = float(os.getenv("MUREKA_POLL_INTERVAL", 0.5))
+POLL_MAX = float(os.getenv("MUREKA_POLL_MAX_INTERVAL", 5))
+POLL_FACTOR = float(os.getenv("MUREKA_POLL_BACKOFF", 1.5))
+# upper bound on status queries in flight at once, due tasks past it wait for a query to finish
+POLL_MAX_PER_TICK = int(os.getenv("MUREKA_POLL_MAX_PER_TICK", 20))
+
+
+class TaskFailed(Exception):
+    pass
+
+
+class _Task:
+    __slots__ = ("task_id", "future", "deadline", "interval", "polls")
+
+    def __init__(self, task_id: str, deadline: float, interval: float):
+        self.task_id = task_id
+        self.future = Future()
+        self.deadline = deadline
+        self.interval = interval
+        self.polls = 0
+
+
+class TaskPoller:
+    """
+    one thread scheduling every in-flight task. each task is re-queried on its own backoff schedule
+    (initial interval, growing by `factor` up to `max_interval`, with jitter so tasks submitted
+    together don't query together) and its future resolves with the final status payload.
+    the queries run on a pool of up to `max_per_tick` threads, a slow upstream call holds up its own
+    task only. `query(task_id)` returns the status dict, "succeeded" / "failed" are terminal
+    """
+
+    def __init__(self, query: Callable[[str], dict], initial_interval: float = POLL_INITIAL,
+                 max_interval: float = POLL_MAX, factor: float = POLL_FACTOR, max_per_tick: int = POLL_MAX_PER_TICK):
+        self.query = query
+        self.initial_interval = initial_interval
+        self.max_interval = max_interval
+        self.factor = factor
+        self.max_per_tick = max_per_tick
+
+        self._tasks = {}
+        self._schedule = []  # heap of (next poll at, seq, task id)
+        self._seq = 0
+        self._cond = threading.Condition()
+        self._thread = None
+        self._queries = None  # ThreadPoolExecutor the status queries run on, started with the thread
+        self._querying = 0
+        self._closed = False
+        self._counters = dict.fromkeys(["tracked", "queries", "query_errors", "succeeded", "failed", "timed_out"], 0)
+
+    def _push(self, at: float, task_id: str):
+        self._seq += 1
+        heapq.heappush(self._schedule, (at, self._seq, task_id))
+
+    def track(self, task_id: str, timeout: float, initial_interval: float = None) -> Future:
+        """
+        starts polling `task_id`, the future gets the final payload, TaskFailed or TimeoutError.
+        after shutdown() the future comes back already cancelled, nothing would ever resolve it
+        """
+        interval = initial_interval if initial_interval is not None else self.initial_interval
+        with self._cond:
+            if self._closed:
+                future = Future()
+                future.cancel()
+                return future
+            task = self._tasks.get(task_id)
+            if task is not None:
+                return task.future
+            task = _Task(task_id, time.monotonic() + timeout, interval)
+            self._tasks[task_id] = task
+            self._push(time.monotonic() + interval, task_id)
+            self._counters["tracked"] += 1
+            if self._thread is None:
+                self._queries = ThreadPoolExecutor(self.max_per_tick, thread_name_prefix="mureka-task-query")
+                self._thread = threading.Thread(target=self._run, name="mureka-task-poller", daemon=True)
+                self._thread.start()
+            self._cond.notify()
+        return task.future
+
+    async def wait(self, task_id: str, timeout: float, initial_interval: float = None) -> dict:
+        return await asyncio.wrap_future(self.track(task_id, timeout, initial_interval))
+
+    def _due(self) -> list:
+        """blocks until something is due and a query slot is free, then pops the due tasks that fit"""
+        with self._cond:
+            while not self._closed:
+                now = time.monotonic()
+                free = self.max_per_tick - self._querying
+                if free > 0 and self._schedule and self._schedule[0][0] <= now:
+                    due = []
+                    while self._schedule and self._schedule[0][0] <= now and len(due) < free:
+                        task = self._tasks.get(heapq.heappop(self._schedule)[2])
+                        if task is not None:
+                            due.append(task)
+                    self._querying += len(due)
+                    return due
+                self._cond.wait(self._schedule[0][0] - now if self._schedule and free > 0 else None)
+            return []
+
+    def _run(self):
+        while not self._closed:
+            for task in self._due():
+                try:
+                    self._queries.submit(self._poll, task)
+                except RuntimeError:
+                    return  # shut down in between, the task's future is cancelled already
+
+    def _poll(self, task: _Task):
+        try:
+            if time.monotonic() >= task.deadline:
+                # the deadline passed while it waited for a slot, no point asking upstream
+                return self._resolve(task, "timed_out",
+                                     error=TimeoutError("timed out after waiting too long for the songGen_api"))
+            self._query(task)
+        finally:
+            with self._cond:
+                self._querying -= 1
+                self._cond.notify()
+
+    def _query(self, task: _Task):
+        task.polls += 1
+        try:
+            payload = self.query(task.task_id)
+            status = payload.get("status")
+        except Exception:
+            # network blips and garbled responses are retried on the normal schedule
+            payload, status = None, None
+            self._count("query_errors")
+        self._count("queries")
+
+        if status == "succeeded":
+            return self._resolve(task, "succeeded", result=payload)
+        if status == "failed":
+            return self._resolve(task, "failed", error=TaskFailed(f"generation failed: {payload.get('failed_reason')}"))
+
+        now = time.monotonic()
+        if now >= task.deadline:
+            return self._resolve(task, "timed_out",
+                                 error=TimeoutError("timed out after waiting too long for the songGen_api"))
+
+        task.interval = min(task.interval * self.factor, self.max_interval)
+        next_at = min(now + task.interval * random.uniform(0.8, 1.2), task.deadline)
+        with self._cond:
+            self._push(next_at, task.task_id)
+
+    def _resolve(self, task: _Task, outcome: str, result: dict = None, error: Exception = None):
+        with self._cond:
+            self._tasks.pop(task.task_id, None)
+            self._counters[outcome] += 1
+        try:
+            if error is not None:
+                task.future.set_exception(error)
+            else:
+                task.future.set_result(result)
+        except InvalidStateError:
+            pass  # cancelled by shutdown() while its last query was out
+
+    def _count(self, name: str):
+        with self._cond:
+            self._counters[name] += 1
+
+    def in_flight(self) -> int:
+        with self._cond:
+            return len(self._tasks)
+
+    def stats(self) -> dict:
+        with self._cond:
+            stats = dict(self._counters)
+            stats["in_flight"] = len(self._tasks)
+        return stats
+
+    def shutdown(self):
+        with self._cond:
+            self._closed = True
+            tasks, self._tasks = list(self._tasks.values()), {}
+            self._cond.notify_all()
+        if self._queries is not None:
+            self._queries.shutdown(wait=False, cancel_futures=True)
+        for task in tasks:
+            task.future.cancel()
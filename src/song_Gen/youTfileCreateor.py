@@ -1,59 +1,160 @@
+import io
 import os
-import librosa
+import shutil
+import subprocess
+
 import numpy as np
-import soundfile as sf
-import yt_dlp
 
-def download_audio(youtube_url, output_filename="input.mp3"):
+# soundfile and yt_dlp are imported where they are used, a clip cache hit (src/song_Gen/clip_cache.py)
+# never downloads or decodes anything and the generation worker doesn't pay for them
+
+# the clip search only needs coarse energy, so the track is decoded mono at a low rate in blocks,
+# only the chosen window is decoded again at full quality
+ANALYSIS_SR = int(os.getenv("CLIP_ANALYSIS_SR", 8000))
+ANALYSIS_BLOCK_SECONDS = int(os.getenv("CLIP_ANALYSIS_BLOCK_SECONDS", 30))
+FRAME_SECONDS = 0.5
+HOP_SECONDS = 0.25
+
+
+def download_audio(youtube_url, workdir="."):
+    """
+    downloads the best audio stream into `workdir` as is and returns its path. there is no full
+    track mp3 transcode any more, the analysis decodes whatever container yt-dlp fetched
+    """
     ydl_opts = {
         'format': 'bestaudio/best',
-        'outtmpl': 'temp_audio.%(ext)s',
-        'postprocessors': [{
-            'key': 'FFmpegExtractAudio',
-            'preferredcodec': 'mp3',
-            'preferredquality': '192',
-        }],
+        'outtmpl': os.path.join(workdir, 'source.%(ext)s'),
         'quiet': True
     }
 
+    import yt_dlp
+
     with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-        ydl.download([youtube_url])
+        info = ydl.extract_info(youtube_url, download=True)
+        path = ydl.prepare_filename(info)
 
-    os.rename("temp_audio.mp3", output_filename)
-    print(f"✅ Downloaded audio as {output_filename}")
+    print(f"✅ Downloaded audio as {path}")
+    return path
 
-def find_best_30s(input_mp3, output_mp3, duration=30):
-    print("🔍 Analyzing audio for best 30-second segment...")
-    y, sr = librosa.load(input_mp3, sr=None)
-    frame_length = int(sr * 0.5)
-    hop_length = int(sr * 0.25)
 
-    energy = np.array([
-        sum(abs(y[i:i+frame_length]**2))
-        for i in range(0, len(y), hop_length)
-    ])
+def _ffmpeg_blocks(path, sr, block_size):
+    proc = subprocess.Popen(
+        ["ffmpeg", "-loglevel", "quiet", "-i", path, "-ac", "1", "-ar", str(sr), "-f", "f32le", "-"],
+        stdout=subprocess.PIPE,
+    )
+    try:
+        while True:
+            raw = proc.stdout.read(block_size * 4)
+            if not raw:
+                break
+            yield np.frombuffer(raw[:len(raw) - len(raw) % 4], dtype=np.float32)
+    finally:
+        proc.stdout.close()
+        proc.kill()
+        proc.wait()
 
-    window_size = int((duration * sr) / hop_length)
-    energy_sum = np.convolve(energy, np.ones(window_size), mode='valid')
-    start_index = np.argmax(energy_sum)
-    start_sample = start_index * hop_length
-    end_sample = start_sample + duration * sr
 
-    best_clip = y[start_sample:end_sample]
-    temp_wav = "temp_best_30s.wav"
-    sf.write(temp_wav, best_clip, sr)
+def _soundfile_blocks(path, block_size):
+    import soundfile as sf
 
-    os.system(f"ffmpeg -y -loglevel quiet -i {temp_wav} {output_mp3}")
-    os.remove(temp_wav)
+    with sf.SoundFile(path) as f:
+        for block in f.blocks(blocksize=block_size, dtype="float32", always_2d=True):
+            yield block.mean(axis=1)
+
+
+def stream_mono_blocks(path, sr=ANALYSIS_SR, block_seconds=ANALYSIS_BLOCK_SECONDS):
+    """
+    (rate, iterator of mono float32 blocks). ffmpeg resamples to `sr` while decoding; without ffmpeg
+    the file is read with soundfile at its native rate, still one block at a time
+    """
+    if shutil.which("ffmpeg"):
+        return sr, _ffmpeg_blocks(path, sr, sr * block_seconds)
+    import soundfile as sf
+
+    native_sr = sf.info(path).samplerate
+    return native_sr, _soundfile_blocks(path, native_sr * block_seconds)
+
+
+def hop_energies(blocks, hop_length: int) -> np.ndarray:
+    """sum of squares per hop of `hop_length` samples, carried across block boundaries"""
+    energies, carry = [], np.empty(0, dtype=np.float32)
+    for block in blocks:
+        samples = np.concatenate([carry, block]) if len(carry) else block
+        n_full = len(samples) // hop_length
+        if n_full:
+            hops = samples[:n_full * hop_length].reshape(n_full, hop_length).astype(np.float64)
+            energies.append(np.einsum("ij,ij->i", hops, hops))
+        carry = samples[n_full * hop_length:]
+    if len(carry):
+        carry = carry.astype(np.float64)
+        energies.append(np.array([carry @ carry]))
+    return np.concatenate(energies) if energies else np.empty(0)
 
-    print(f"🎧 Best 30 seconds saved as {output_mp3}")
 
-def download_songs_sample(youtube_url):
-    input_mp3 = "input.mp3"
-    output_mp3 = "best_30s.mp3"
+def best_window_start(energy: np.ndarray, window_hops: int, frame_hops: int = 2) -> int:
+    """
+    hop index where the `window_hops` long window of overlapping frames (`frame_hops` hops each)
+    has the most energy, both sums as cumsum differences so it stays O(n)
+    """
+    if len(energy) <= window_hops:
+        return 0
+    csum = np.concatenate([[0.0], np.cumsum(energy)])
+    ends = np.minimum(np.arange(len(energy)) + frame_hops, len(energy))
+    frames = csum[ends] - csum[:-1]
 
-    download_audio(youtube_url, input_mp3)
-    find_best_30s(input_mp3, output_mp3)
+    frame_csum = np.concatenate([[0.0], np.cumsum(frames)])
+    window_sums = frame_csum[window_hops:] - frame_csum[:-window_hops]
+    return int(np.argmax(window_sums))
+
+
+def find_best_start(input_path, duration=30, sr=ANALYSIS_SR) -> float:
+    """start, in seconds, of the loudest `duration` second stretch of the track"""
+    rate, blocks = stream_mono_blocks(input_path, sr)
+    hop_length = int(rate * HOP_SECONDS)
+    energy = hop_energies(blocks, hop_length)
+    start_hop = best_window_start(energy, int(duration / HOP_SECONDS), int(FRAME_SECONDS / HOP_SECONDS))
+    return start_hop * hop_length / rate
+
+
+def encode_clip(input_path, start: float, duration=30, fmt="mp3") -> bytes:
+    """decodes just [start, start + duration) at full quality and returns it encoded as `fmt`"""
+    if shutil.which("ffmpeg"):
+        proc = subprocess.run(["ffmpeg", "-loglevel", "quiet", "-ss", f"{start:.3f}", "-t", str(duration),
+                               "-i", input_path, "-f", fmt, "pipe:1"], stdout=subprocess.PIPE, check=True)
+        return proc.stdout
+
+    import soundfile as sf
+
+    with sf.SoundFile(input_path) as f:
+        f.seek(int(start * f.samplerate))
+        clip = f.read(int(duration * f.samplerate), dtype="float32")
+        buffer = io.BytesIO()
+        sf.write(buffer, clip, f.samplerate, format=fmt.upper())
+        return buffer.getvalue()
+
+
+def best_30s_clip(input_path, duration=30, fmt="mp3") -> io.BytesIO:
+    """the loudest `duration` seconds of the track as an in memory file, ready to upload"""
+    print("🔍 Analyzing audio for best 30-second segment...")
+    start = find_best_start(input_path, duration)
+    clip = io.BytesIO(encode_clip(input_path, start, duration, fmt))
+    clip.name = f"best_{duration}s.{fmt}"
+    print(f"🎧 Best {duration} seconds found at {start:.2f}s ({len(clip.getvalue())} bytes)")
+    return clip
+
+
+def find_best_30s(input_mp3, output_mp3, duration=30):
+    fmt = os.path.splitext(output_mp3)[1].lstrip(".") or "mp3"
+    clip = best_30s_clip(input_mp3, duration, fmt)
+    with open(output_mp3, "wb") as f:
+        f.write(clip.getvalue())
+    print(f"🎧 Best 30 seconds saved as {output_mp3}")
 
-    os.remove(input_mp3)
 
+def download_songs_sample(youtube_url, workdir) -> io.BytesIO:
+    """download into the job's own `workdir` and return the reference clip in memory"""
+    input_path = download_audio(youtube_url, workdir)
+    try:
+        return best_30s_clip(input_path)
+    finally:
+        os.remove(input_path)
@@ -1,141 +1,191 @@
-# import os
-# import time
-# import requests
-# import redis
+import os
+import time
+import asyncio
 
-from psycopg2.extras import execute_values
+import httpx
 
+from typing import Callable, Optional
+from email.utils import parsedate_to_datetime
 from dotenv import load_dotenv
 
-load_dotenv()
-
-# CLIENT_ID = os.getenv("CLIENT_ID")
-# CLIENT_SECRET = os.getenv("CLIENT_SECRET")
-
-# TOKEN_URL = 'https://accounts.spotify.com/api/token'
-
-# REDIS_HOST = os.getenv("REDIS_HOST", "localhost")
-# REDIS_PORT = int(os.getenv("REDIS_PORT", 6379))
-
-
-# # TODO add user id with the token
-# REDIS_TOKEN_KEY = "spotify:token" # 
-# REDIS_EXPIRY_KEY = "spotify:token_expiry"
-
-
-
-# redis_pool = redis.ConnectionPool(
-#     host=REDIS_HOST,
-#     port=REDIS_PORT,
-#     decode_responses=True,
-#     max_connections=10  # optional, tune based on usage
-# )
-
-# r = redis.Redis(connection_pool=redis_pool)
-
-# def get_client_token_data(client_id: str, client_secret: str):
-#     return {
-#         "grant_type": "client_credentials",
-#         "client_id": client_id,
-#         "client_secret": client_secret,
-#     }
-
-
-# def get_token_header():
-#     return {
-#         "Content-Type": "application/x-www-form-urlencoded"
-#     }
+from src.database.redis.index import get_redis
+from src.database.redis.sessions import SessionStore
 
+load_dotenv()
 
-# def fetch_new_token() -> str:
-#     res = requests.post(
-#         TOKEN_URL,
-#         headers=get_token_header(),
-#         data=get_client_token_data(CLIENT_ID, CLIENT_SECRET)
-#     )
-#     if res.status_code == 200:
-#         data = res.json()
-#         access_token = data['access_token']
-#         expires_in = data['expires_in']  #  3600
-#         r.set(REDIS_TOKEN_KEY, access_token)
-#         r.set(REDIS_EXPIRY_KEY, int(time.time()) + expires_in - 10)  
-#         return access_token
-#     else:
-#         raise Exception(f"Token request failed: {res.status_code} | {res.text}")
-
-
-# ## TODO create a pol for connects
-# def get_cached_token() -> str:
-#     token = r.get(REDIS_TOKEN_KEY)
-#     expiry = r.get(REDIS_EXPIRY_KEY)
-
-#     if token and expiry:
-#         if int(expiry) > int(time.time()):
-#             return token
-#         else:
-#             print("Token expired — fetching a new one")
-#     else:
-#         print("No token cached — fetching a new one")
-
-#     return fetch_new_token()
+CLIENT_ID = os.getenv("CLIENT_ID")
+CLIENT_SECRET = os.getenv("CLIENT_SECRET")
+REDIRECT_URI = os.getenv("REDIRECT_URI")
 
+TOKEN_URL = os.getenv("SPOTIFY_TOKEN_URL", "https://accounts.spotify.com/api/token")
+API_URL = os.getenv("SPOTIFY_API_URL", "https://api.spotify.com/v1")
 
-# def get_spotify_header() -> dict:
-#     token = get_cached_token()
-#     return {
-#         'Authorization': f'Bearer {token}'
-#     }
+SPOTIFY_MAX_CONNECTIONS = int(os.getenv("SPOTIFY_MAX_CONNECTIONS", 20))
+SPOTIFY_MAX_RETRIES = int(os.getenv("SPOTIFY_MAX_RETRIES", 3))
+# a longer Retry-After is not waited out inside a request, the call fails with a 429 instead
+SPOTIFY_MAX_RETRY_AFTER = float(os.getenv("SPOTIFY_MAX_RETRY_AFTER", 10))
+# refresh this many seconds before the token actually expires
+REFRESH_MARGIN = int(os.getenv("SPOTIFY_REFRESH_MARGIN", 60))
 
 
-# def get_top_artists(headers: dict, limit: int = 10, offset: int = 0):
+class SpotifyError(Exception):
+    def __init__(self, status_code: int, message: str):
+        super().__init__(f"Spotify request failed: {status_code} | {message}")
+        self.status_code = status_code
+        self.message = message
 
-#     url = f"https://api.spotify.com/v1/me/top/artists"
-    
-#     response = requests.get(url, headers=headers)
-    
-#     if response.status_code == 200:
-#         return response.json()['items']
-#     else:
-#         raise Exception(f"Failed to fetch top artists: {response.status_code} | {response.text}")
 
+class SpotifyAuthError(SpotifyError):
+    """no session for the user, or the refresh token was rejected, the user has to log in again"""
 
 
-def insert_top_artists(user_id: str, artists: list, conn):
-    values = []
-    for artist in artists:
-        artist_id = artist['id']
-        name = artist['name']
-        genres = artist['genres']  # List of strings
-        popularity = artist['popularity']
-        image = artist['images'][0]['url'] if artist['images'] else None
-        external_url = artist['external_urls']['spotify']
+def retry_after_seconds(value: str) -> Optional[float]:
+    """Retry-After as seconds from now, it is either a number of seconds or an http date"""
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
 
-        values.append((artist_id, user_id, name, genres, popularity, image, external_url))
 
-    query = """
-        INSERT INTO music.artists (artist_id, user_id, name, genres, popularity, image, external_url)
-        VALUES %s
-        ON CONFLICT (artist_id) DO NOTHING;
+class SpotifyClient:
+    """
+    async spotify client on one shared keep-alive connection pool.
+    retries 429s after Retry-After (and 5xx and connection errors with backoff), and refreshes user
+    tokens proactively from the session's expires_at; concurrent requests for one user share a
+    single refresh. the redis session reads and writes run on a thread, off the event loop
     """
 
-    with conn.cursor() as cur:
-        execute_values(cur, query, values)
-        conn.commit()
-
-
-# # TODO add this to db
-
-import psycopg2
-
-artists = 1
-
-conn = psycopg2.connect(
-    dbname="music_db",
-    user="postgres",
-    password="mysecretpassword",
-    host="localhost",
-    port=5432
-)
-
-
-conn.close()
+    def __init__(self, client_id: str = CLIENT_ID, client_secret: str = CLIENT_SECRET, redirect_uri: str = REDIRECT_URI,
+                 redis_getter: Callable = get_redis, max_connections: int = SPOTIFY_MAX_CONNECTIONS,
+                 max_retries: int = SPOTIFY_MAX_RETRIES, token_url: str = TOKEN_URL, api_url: str = API_URL,
+                 transport: httpx.AsyncBaseTransport = None, sessions: SessionStore = None,
+                 max_retry_after: float = SPOTIFY_MAX_RETRY_AFTER):
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.redirect_uri = redirect_uri
+        self.sessions = sessions or SessionStore(redis_getter)
+        self.max_retries = max_retries
+        self.max_retry_after = max_retry_after
+        self.token_url = token_url
+        self.api_url = api_url
+
+        self._limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+        self._transport = transport
+        self._http: Optional[httpx.AsyncClient] = None
+        self._refreshing = {}  # user_id -> in flight refresh task
+
+    @property
+    def http(self) -> httpx.AsyncClient:
+        if self._http is None:
+            self._http = httpx.AsyncClient(limits=self._limits, timeout=httpx.Timeout(10.0), transport=self._transport)
+        return self._http
+
+    async def close(self):
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+
+    async def _request(self, method: str, url: str, **kwargs) -> httpx.Response:
+        for attempt in range(self.max_retries + 1):
+            try:
+                res = await self.http.request(method, url, **kwargs)
+            except httpx.TransportError as e:
+                # connect errors, timeouts, dropped connections: retried like a 5xx, then a bad gateway
+                if attempt == self.max_retries:
+                    raise SpotifyError(502, f"Spotify unreachable: {e!r}") from e
+                await asyncio.sleep(0.5 * 2 ** attempt)
+                continue
+            if res.status_code == 429 or res.status_code >= 500:
+                if attempt == self.max_retries:
+                    break
+                retry_after = retry_after_seconds(res.headers.get("Retry-After", ""))
+                delay = retry_after if retry_after is not None else 0.5 * 2 ** attempt
+                if delay > self.max_retry_after:
+                    raise SpotifyError(res.status_code, f"rate limited, Spotify asks to retry in {delay:.0f}s")
+                await asyncio.sleep(delay)
+                continue
+            return res
+        return res
+
+    # --- tokens ---
+
+    def store_tokens(self, user_id: str, token_info: dict) -> dict:
+        return self.sessions.save(user_id, token_info)
+
+    async def exchange_code(self, code: str) -> dict:
+        res = await self._request("POST", self.token_url, data={
+            "grant_type": "authorization_code",
+            "code": code,
+            "redirect_uri": self.redirect_uri,
+            "client_id": self.client_id,
+            "client_secret": self.client_secret,
+        })
+        if res.status_code != 200:
+            raise SpotifyError(res.status_code, res.text)
+        return res.json()
+
+    async def _refresh(self, user_id: str) -> str:
+        session = await asyncio.to_thread(self.sessions.get, user_id) or {}
+        refresh_token = session.get("refresh_token")
+        if not refresh_token:
+            raise SpotifyAuthError(401, "User not authenticated")
+
+        res = await self._request("POST", self.token_url, data={
+            "grant_type": "refresh_token",
+            "refresh_token": refresh_token,
+            "client_id": self.client_id,
+            "client_secret": self.client_secret,
+        })
+        if res.status_code != 200:
+            raise SpotifyAuthError(res.status_code, "Token expired or invalid")
+
+        token_info = res.json()
+        await asyncio.to_thread(self.store_tokens, user_id, token_info)
+        return token_info["access_token"]
+
+    async def refresh(self, user_id: str) -> str:
+        """single flight: every caller waiting on the same user's refresh gets the one result"""
+        task = self._refreshing.get(user_id)
+        if task is None:
+            task = asyncio.ensure_future(self._refresh(user_id))
+            self._refreshing[user_id] = task
+            task.add_done_callback(lambda _: self._refreshing.pop(user_id, None))
+        return await asyncio.shield(task)
+
+    async def get_access_token(self, user_id: str) -> str:
+        session = await asyncio.to_thread(self.sessions.get, user_id) or {}
+        access_token, expires_at = session.get("access_token"), session.get("expires_at")
+
+        if access_token and expires_at and int(expires_at) - REFRESH_MARGIN > time.time():
+            return access_token
+        return await self.refresh(user_id)
+
+    # --- api ---
+
+    async def _get(self, path: str, access_token: str, params: dict = None) -> httpx.Response:
+        return await self._request("GET", f"{self.api_url}{path}", params=params,
+                                   headers={"Authorization": f"Bearer {access_token}"})
+
+    async def get_user(self, user_id: str, path: str, params: dict = None) -> dict:
+        """GET on behalf of a stored user, refreshing once if spotify still says the token is invalid"""
+        res = await self._get(path, await self.get_access_token(user_id), params)
+        if res.status_code == 401:
+            res = await self._get(path, await self.refresh(user_id), params)
+        if res.status_code == 401:
+            raise SpotifyAuthError(401, "Token expired or invalid")
+        if res.status_code != 200:
+            raise SpotifyError(res.status_code, res.text)
+        return res.json()
+
+    async def get_me(self, access_token: str) -> dict:
+        res = await self._get("/me", access_token)
+        if res.status_code != 200:
+            raise SpotifyError(res.status_code, res.text)
+        return res.json()
+
+    async def get_top_artists(self, user_id: str, limit: int = 20, time_range: str = "medium_term") -> dict:
+        return await self.get_user(user_id, "/me/top/artists", {"limit": limit, "time_range": time_range})
@@ -0,0 +1,200 @@
+import os
+
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+
+from src.utils import number_cols
+
+# interned columns: int32 codes per row plus a table of the distinct values (-1 for a missing value)
+CATEGORICAL_COLUMNS = ("predicted_genre", "first_artist", "artists")
+YEAR = number_cols.index("year")
+
+
+class StringTable:
+    """
+    utf8 strings back to back in one uint8 buffer, string i is blob[offsets[i]:offsets[i + 1]].
+    two numpy arrays instead of a python object per string, and they memory map like any .npy
+    """
+
+    def __init__(self, blob: np.ndarray, offsets: np.ndarray):
+        self.blob = blob
+        self.offsets = offsets
+        # slicing a memoryview skips the ndarray (or memmap) object numpy makes per slice
+        self._view = memoryview(blob)
+
+    @classmethod
+    def from_strings(cls, values) -> "StringTable":
+        encoded = [v.encode("utf-8") if isinstance(v, str) else b"" for v in values]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(b) for b in encoded], out=offsets[1:])
+        return cls(np.frombuffer(b"".join(encoded), dtype=np.uint8), offsets)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i: int) -> str:
+        return str(self._view[self.offsets[i]:self.offsets[i + 1]], "utf-8")
+
+    def take(self, positions) -> List[str]:
+        positions = np.asarray(positions, dtype=np.int64)
+        starts, ends = self.offsets[positions].tolist(), self.offsets[positions + 1].tolist()
+        view = self._view
+        return [str(view[s:e], "utf-8") for s, e in zip(starts, ends)]
+
+    def to_list(self) -> List[str]:
+        data = self.blob.tobytes()
+        offsets = self.offsets.tolist()
+        return [data[s:e].decode("utf-8") for s, e in zip(offsets[:-1], offsets[1:])]
+
+    def concat(self, other: "StringTable") -> "StringTable":
+        offsets = np.concatenate([self.offsets, other.offsets[1:] + self.offsets[-1]])
+        return StringTable(np.concatenate([self.blob, other.blob]), offsets)
+
+    @property
+    def nbytes(self) -> int:
+        return self.blob.nbytes + self.offsets.nbytes
+
+    def save(self, directory: str, name: str):
+        np.save(os.path.join(directory, f"{name}.utf8.npy"), self.blob)
+        np.save(os.path.join(directory, f"{name}.offsets.npy"), self.offsets)
+
+    @classmethod
+    def load(cls, directory: str, name: str, mmap: bool = False) -> "StringTable":
+        mode = "r" if mmap else None
+        return cls(np.load(os.path.join(directory, f"{name}.utf8.npy"), mmap_mode=mode),
+                   np.load(os.path.join(directory, f"{name}.offsets.npy"), mmap_mode=mode))
+
+
+class SongRecord:
+    """one recommended song, what a response row carries and nothing else"""
+    __slots__ = ("name", "year", "artists", "predicted_genre")
+
+    def __init__(self, name: str, year: int, artists: str, predicted_genre: str):
+        self.name = name
+        self.year = year
+        self.artists = artists
+        self.predicted_genre = predicted_genre
+
+    def as_dict(self) -> Dict:
+        return {"name": self.name, "year": self.year, "artists": self.artists, "predicted_genre": self.predicted_genre}
+
+
+class CatalogStore:
+    """
+    the catalog as the serving path reads it: number_cols as one contiguous float32 matrix,
+    cluster_label as int16, genre / first artist / artists as interned codes and names as a string
+    table. no python object per row, so a bundle's store is memory mapped whole and every worker
+    shares it. appending returns a new store, readers holding the old one keep a consistent view
+    """
+
+    def __init__(self, numbers: np.ndarray, cluster_label: np.ndarray, names: StringTable,
+                 codes: Dict[str, np.ndarray], tables: Dict[str, StringTable]):
+        self.numbers = numbers
+        self.cluster_label = cluster_label
+        self.names = names
+        self.codes = codes
+        self.tables = tables
+        self._decoded = {}  # column -> its table as an object array, None last so code -1 maps to it
+
+    @classmethod
+    def from_frame(cls, data: pd.DataFrame) -> "CatalogStore":
+        codes, tables = {}, {}
+        for col in CATEGORICAL_COLUMNS:
+            col_codes, uniques = pd.factorize(data[col], use_na_sentinel=True)
+            codes[col] = col_codes.astype(np.int32)
+            tables[col] = StringTable.from_strings(uniques)
+        return cls(
+            numbers=np.ascontiguousarray(data[number_cols].to_numpy(dtype=np.float32)),
+            cluster_label=data['cluster_label'].to_numpy(dtype=np.int16),
+            names=StringTable.from_strings(data['name']),
+            codes=codes,
+            tables=tables,
+        )
+
+    def __len__(self):
+        return len(self.numbers)
+
+    def decoded(self, col: str) -> np.ndarray:
+        values = self._decoded.get(col)
+        if values is None:
+            values = np.array(self.tables[col].to_list() + [None], dtype=object)
+            self._decoded[col] = values
+        return values
+
+    def values(self, col: str, rows) -> np.ndarray:
+        """the rows' values of a categorical column, None where it is missing"""
+        return self.decoded(col)[self.codes[col][rows]]
+
+    def __getitem__(self, col: str) -> np.ndarray:
+        """a whole column, for building the lookups and indexes at load time"""
+        if col in number_cols:
+            return self.numbers[:, number_cols.index(col)]
+        if col == 'cluster_label':
+            return self.cluster_label
+        if col == 'name':
+            return np.array(self.names.to_list(), dtype=object)
+        return self.decoded(col)[self.codes[col]]
+
+    def records(self, rows) -> List[SongRecord]:
+        rows = np.asarray(rows, dtype=np.int64)
+        names = self.names.take(rows)
+        years = self.numbers[rows, YEAR].astype(np.int64).tolist()
+        artist_codes = self.codes['artists'][rows]
+        artists = self.tables['artists'].take(np.maximum(artist_codes, 0)) if len(self.tables['artists']) else names
+        genres = self.values('predicted_genre', rows).tolist()
+        return [SongRecord(name, year, artist if code >= 0 else None, genre)
+                for name, year, artist, code, genre in zip(names, years, artists, artist_codes.tolist(), genres)]
+
+    def append(self, data: pd.DataFrame) -> "CatalogStore":
+        """a new store with `data`'s rows after this one's, new categorical values extend the tables"""
+        codes, tables = {}, {}
+        for col in CATEGORICAL_COLUMNS:
+            known = {value: code for code, value in enumerate(self.decoded(col)[:-1])}
+            new_values = []
+            col_codes = np.empty(len(data), dtype=np.int32)
+            for i, value in enumerate(data[col]):
+                if not isinstance(value, str):
+                    col_codes[i] = -1
+                    continue
+                code = known.get(value)
+                if code is None:
+                    code = known[value] = len(known)
+                    new_values.append(value)
+                col_codes[i] = code
+            codes[col] = np.concatenate([self.codes[col], col_codes])
+            tables[col] = self.tables[col].concat(StringTable.from_strings(new_values))
+        return CatalogStore(
+            numbers=np.concatenate([self.numbers, data[number_cols].to_numpy(dtype=np.float32)]),
+            cluster_label=np.concatenate([self.cluster_label, data['cluster_label'].to_numpy(dtype=np.int16)]),
+            names=self.names.concat(StringTable.from_strings(data['name'])),
+            codes=codes,
+            tables=tables,
+        )
+
+    @property
+    def nbytes(self) -> int:
+        return (self.numbers.nbytes + self.cluster_label.nbytes + self.names.nbytes
+                + sum(c.nbytes for c in self.codes.values()) + sum(t.nbytes for t in self.tables.values()))
+
+    def save(self, directory: str):
+        os.makedirs(directory, exist_ok=True)
+        np.save(os.path.join(directory, "numbers.npy"), self.numbers)
+        np.save(os.path.join(directory, "cluster_label.npy"), self.cluster_label)
+        self.names.save(directory, "name")
+        for col in CATEGORICAL_COLUMNS:
+            np.save(os.path.join(directory, f"{col}.codes.npy"), self.codes[col])
+            self.tables[col].save(directory, col)
+
+    @classmethod
+    def load(cls, directory: str, mmap: bool = False) -> "CatalogStore":
+        mode = "r" if mmap else None
+        return cls(
+            numbers=np.load(os.path.join(directory, "numbers.npy"), mmap_mode=mode),
+            cluster_label=np.load(os.path.join(directory, "cluster_label.npy"), mmap_mode=mode),
+            names=StringTable.load(directory, "name", mmap),
+            codes={col: np.load(os.path.join(directory, f"{col}.codes.npy"), mmap_mode=mode)
+                   for col in CATEGORICAL_COLUMNS},
+            tables={col: StringTable.load(directory, col, mmap) for col in CATEGORICAL_COLUMNS},
+        )
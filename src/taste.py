@@ -0,0 +1,232 @@
+import os
+import json
+import time
+import threading
+
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from redis import RedisError, WatchError
+
+from src.reoc import SongLookup
+from src.artists import ArtistIndex
+from src.store import CatalogStore
+from src.utils import number_cols
+from src.database.redis.index import get_redis
+
+TASTE_TTL = int(os.getenv("TASTE_TTL", 7 * 24 * 3600))
+TASTE_CACHE_SIZE = int(os.getenv("TASTE_CACHE_SIZE", 10_000))
+# genres of the profile a personalized query is filtered on, by weight
+TASTE_GENRES = int(os.getenv("TASTE_GENRES", 8))
+# a user's own top tracks are left out of their recommendations, up to this many names
+TASTE_MAX_EXCLUDE = int(os.getenv("TASTE_MAX_EXCLUDE", 200))
+# attempts of a profile update that other workers keep writing under it
+TASTE_WRITE_RETRIES = int(os.getenv("TASTE_WRITE_RETRIES", 5))
+
+
+def artist_item(artist_id: str, name: str) -> dict:
+    return {"id": f"artist:{artist_id}", "kind": "artist", "name": name}
+
+
+def track_item(song_id: str, name: str, artist_name: str, year: Optional[int]) -> dict:
+    return {"id": f"track:{song_id}", "kind": "track", "name": name, "artist": artist_name, "year": year}
+
+
+def items_from_rows(artist_rows: list, song_rows: list) -> List[dict]:
+    """music.artists / music.songs rows (fetch_user_artists, fetch_user_songs) as taste items"""
+    items = [artist_item(artist_id, name) for artist_id, name, *_ in artist_rows]
+    for song_id, song_name, artist_name, release_date, *_ in song_rows:
+        items.append(track_item(song_id, song_name, artist_name, release_date.year if release_date else None))
+    return items
+
+
+def empty_profile(version: str) -> dict:
+    return {"version": version, "count": 0, "sum": [0.0] * len(number_cols), "vector": None,
+            "genres": {}, "exclude": []}
+
+
+def fold_items(profile: dict, items: List[dict], data: CatalogStore, lookup: SongLookup, artists: ArtistIndex,
+               scaler, seen: Set[str] = None) -> List[str]:
+    """
+    folds the items the profile has not seen yet into it, in place. every matched item weighs the
+    same: an artist adds the mean of their catalog rows, a track its own row (or its artist's rows
+    when the track is not in the catalog). the serving vector is the scaled mean of all of them.
+    `seen` holds the ids already folded in (those of `items` are enough), the new ones are added to
+    it. returns the ids folded now, empty when nothing changed
+    """
+    seen = set() if seen is None else seen
+    total = np.asarray(profile["sum"], dtype=np.float64)
+    exclude = list(profile["exclude"])
+    folded = []
+
+    for item in items:
+        if item["id"] in seen:
+            continue
+        seen.add(item["id"])
+        folded.append(item["id"])
+
+        rows = np.empty(0, dtype=np.int64)
+        if item["kind"] == "track":
+            pos = lookup.get(item["name"], int(item["year"])) if item.get("year") else None
+            if pos is not None:
+                rows = np.array([pos])
+                if len(exclude) < TASTE_MAX_EXCLUDE:
+                    exclude.append(data.names[pos])
+            elif item.get("artist"):
+                rows = artists.positions(item["artist"])
+        else:
+            rows = artists.positions(item["name"])
+        rows = rows[rows < len(data)]
+        if not len(rows):
+            continue
+
+        total += data.numbers[rows].mean(axis=0, dtype=np.float64)
+        profile["count"] += 1
+        for genre, share in pd.Series(data.values('predicted_genre', rows)).value_counts(normalize=True).items():
+            profile["genres"][genre] = profile["genres"].get(genre, 0.0) + float(share)
+
+    if folded:
+        profile["sum"] = total.tolist()
+        profile["exclude"] = exclude
+        if profile["count"]:
+            center = pd.DataFrame([total / profile["count"]], columns=number_cols)
+            profile["vector"] = scaler.transform(center)[0].astype(np.float32).tolist()
+    return folded
+
+
+def top_genres(profile: dict, n: int = TASTE_GENRES) -> list:
+    return [genre for genre, _ in sorted(profile["genres"].items(), key=lambda kv: -kv[1])[:n]]
+
+
+class TasteProfiles:
+    """
+    per user taste profiles (scaled query vector plus the running sum it came from, genre weights and
+    the user's own tracks), one json value per user in redis with a ttl, and in an in-process LRU
+    when no redis pool is up. the ids already folded into a profile are a redis set next to it, only
+    updates check them, so a profile read stays one small GET however many items went into it
+    """
+
+    def __init__(self, redis_getter: Callable = get_redis, prefix: str = "taste", ttl: int = TASTE_TTL,
+                 max_entries: int = TASTE_CACHE_SIZE, retries: int = TASTE_WRITE_RETRIES):
+        self.redis_getter = redis_getter
+        self.prefix = prefix
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.retries = retries
+
+        self._local = OrderedDict()  # user_id -> (expires_at, profile json, folded item ids)
+        self._lock = threading.Lock()
+        # updates of one user run one at a time in process, users share a lock per stripe
+        self._user_locks = [threading.Lock() for _ in range(64)]
+        self._counters = dict.fromkeys(["hits", "misses", "builds", "updates", "conflicts", "redis_errors"], 0)
+
+    def _count(self, name: str):
+        with self._lock:
+            self._counters[name] += 1
+
+    def _key(self, user_id: str) -> str:
+        return f"{self.prefix}:{user_id}"
+
+    def _items_key(self, user_id: str) -> str:
+        return f"{self.prefix}:{user_id}:items"
+
+    def get(self, user_id: str) -> Optional[dict]:
+        redis_con = self.redis_getter()
+        if redis_con is not None:
+            try:
+                raw = redis_con.get(self._key(user_id))
+            except RedisError:
+                raw = None
+                self._count("redis_errors")
+            profile = json.loads(raw) if raw is not None else None
+        else:
+            profile, _ = self._get_local(user_id)
+        self._count("hits" if profile is not None else "misses")
+        return profile
+
+    def _get_local(self, user_id: str) -> Tuple[Optional[dict], Set[str]]:
+        with self._lock:
+            expires_at, profile, items = self._local.get(user_id, (0, None, None))
+            if profile is not None and expires_at <= time.time():
+                del self._local[user_id]
+                profile = None
+        return (json.loads(profile), items) if profile is not None else (None, set())
+
+    def update(self, user_id: str, change: Callable) -> Optional[dict]:
+        """
+        read-modify-write of one profile. change(profile, seen) gets the stored profile (None when
+        there is none) and seen(ids), which says which of `ids` are already folded into it. it
+        returns (profile, new item ids, built) to store, built when the profile was started over,
+        or None to keep the stored one. with redis the profile is WATCHed and the change rerun when
+        another worker wrote it in between, in process it runs under the user's lock
+        """
+        redis_con = self.redis_getter()
+        if redis_con is None:
+            with self._user_locks[hash(user_id) % len(self._user_locks)]:
+                stored, items = self._get_local(user_id)
+                result = change(stored, lambda ids: {i for i in ids if i in items})
+                if result is None:
+                    return stored
+                profile, new_ids, built = result
+                self._put_local(user_id, profile, (set() if built else items) | set(new_ids))
+                self._count("builds" if built else "updates")
+                return profile
+
+        key, items_key = self._key(user_id), self._items_key(user_id)
+        stored = result = None
+        try:
+            with redis_con.pipeline(transaction=True) as pipe:
+                for _ in range(self.retries):
+                    try:
+                        pipe.watch(key, items_key)
+                        raw = pipe.get(key)
+                        stored = json.loads(raw) if raw is not None else None
+                        result = change(stored, lambda ids: self._seen(pipe, items_key, ids))
+                        if result is None:
+                            pipe.unwatch()
+                            return stored
+                        profile, new_ids, built = result
+                        pipe.multi()
+                        if built:
+                            pipe.delete(items_key)
+                        pipe.setex(key, self.ttl, json.dumps(profile))
+                        if new_ids:
+                            pipe.sadd(items_key, *new_ids)
+                        pipe.expire(items_key, self.ttl)
+                        pipe.execute()
+                        self._count("builds" if built else "updates")
+                        return profile
+                    except WatchError:
+                        self._count("conflicts")
+                raise WatchError(f"taste profile of {user_id} kept changing, gave up after {self.retries} tries")
+        except WatchError:
+            raise
+        except RedisError:
+            # served without storing it, like a profile that could not be read
+            self._count("redis_errors")
+            if result is None:
+                result = change(None, lambda ids: set())
+            return result[0] if result is not None else stored
+
+    @staticmethod
+    def _seen(pipe, items_key: str, ids: Iterable[str]) -> Set[str]:
+        ids = list(ids)
+        if not ids:
+            return set()
+        return {i for i, member in zip(ids, pipe.smismember(items_key, ids)) if member}
+
+    def _put_local(self, user_id: str, profile: dict, items: Set[str]):
+        with self._lock:
+            self._local[user_id] = (time.time() + self.ttl, json.dumps(profile), items)
+            self._local.move_to_end(user_id)
+            while len(self._local) > self.max_entries:
+                self._local.popitem(last=False)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self._counters)
+            stats["local_size"] = len(self._local)
+        return stats
@@ -1,38 +1,64 @@
-
-
-import pandas as pd
-
 from typing import List, Optional
 
-from sklearn.pipeline import Pipeline
-from sklearn.cluster import KMeans
-from sklearn.preprocessing import StandardScaler
-from sklearn.pipeline import Pipeline
-
-from pydantic import BaseModel 
-from annoy import AnnoyIndex
+from pydantic import BaseModel, Field
 
 
-data: pd.DataFrame = None
-song_cluster_pipeline: Pipeline =  Pipeline([
-        ('scaler', StandardScaler()),
-        ('kmeans', KMeans(n_clusters=20, verbose=False))
-    ])
-annoy_index: AnnoyIndex = None
-index_map: dict = {}
-
 number_cols = ['valence', 'year', 'acousticness', 'danceability', 'duration_ms',
                'energy', 'explicit', 'instrumentalness', 'key', 'liveness',
                'loudness', 'mode', 'popularity', 'speechiness', 'tempo']
 
 
+FILTER_FIELDS = {'genres', 'discovery', 'year_min', 'year_max', 'clusters', 'explicit', 'mood'}
+
+
 class SongInput(BaseModel):
     name: str
     year: int
 
 class SongList(BaseModel):
-    songs: List[SongInput]
+    songs: List[SongInput] = []
+    artists: List[str] = []  # seed artists, matched against first_artist
     n_songs: int = 10
+    max_per_artist: Optional[int] = Field(None, ge=0)  # songs per artist in the result, RECOMMEND_MAX_PER_ARTIST when unset
+    # optional filters on the results, see src/filters.py
+    genres: Optional[List[str]] = None  # instead of the seeds' genres
+    discovery: bool = False  # anything but the seeds' genres
+    year_min: Optional[int] = None
+    year_max: Optional[int] = None
+    clusters: Optional[List[int]] = None
+    explicit: Optional[bool] = None
+    mood: Optional[str] = None  # workout, party, happy, chill, focus, sad, morning or night
+
+    def constraints(self) -> dict:
+        """the filters that were set, empty for a plain request"""
+        return self.dict(include=FILTER_FIELDS, exclude_defaults=True)
+
+class SongListBatch(BaseModel):
+    requests: List[SongList] = Field(..., max_length=10_000)
+
+class TrackInput(BaseModel):
+    id: str
+    name: str
+    artists: List[str]
+    year: int
+    release_date: Optional[str] = None
+    valence: float
+    acousticness: float
+    danceability: float
+    duration_ms: int
+    energy: float
+    explicit: int
+    instrumentalness: float
+    key: int
+    liveness: float
+    loudness: float
+    mode: int
+    popularity: int
+    speechiness: float
+    tempo: float
+
+class TrackBatch(BaseModel):
+    tracks: List[TrackInput]
 
 class GenSongInput(BaseModel):
     lyric_prompt: str  
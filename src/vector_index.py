@@ -0,0 +1,206 @@
+import os
+import tempfile
+
+import numpy as np
+
+from annoy import AnnoyIndex
+
+IVF_N_PROBE = int(os.getenv("ANN_IVF_N_PROBE", 3))
+
+# every engine answers get_nns_by_vector / get_n_items the same way AnnoyIndex does, so the
+# recommender does not care which one it is talking to. ids are catalog row positions
+
+
+class VectorIndex:
+    name = "base"
+
+    def get_n_items(self) -> int:
+        raise NotImplementedError
+
+    def get_nns_by_vector(self, vector, n: int, search_k: int = -1, include_distances: bool = False):
+        raise NotImplementedError
+
+    def memory_bytes(self) -> int:
+        raise NotImplementedError
+
+
+def top_n(dist: np.ndarray, n: int) -> np.ndarray:
+    """column positions of the n smallest values per row, nearest first"""
+    if n < dist.shape[1]:
+        top = np.argpartition(dist, n - 1, axis=1)[:, :n]
+    else:
+        top = np.broadcast_to(np.arange(dist.shape[1]), dist.shape)
+    order = np.argsort(np.take_along_axis(dist, top, axis=1), axis=1, kind="stable")
+    return np.take_along_axis(top, order, axis=1)
+
+
+def _result(idxs: np.ndarray, sq_dist: np.ndarray, include_distances: bool):
+    idxs = idxs.tolist()
+    if include_distances:
+        return idxs, np.sqrt(np.maximum(sq_dist, 0)).tolist()
+    return idxs
+
+
+class AnnoyEngine(VectorIndex):
+    name = "annoy"
+
+    def __init__(self, index: AnnoyIndex, path: str = None, size_bytes: int = None):
+        self.index = index
+        self.path = path
+        self.size_bytes = size_bytes if size_bytes is not None else (os.path.getsize(path) if path else 0)
+
+    @classmethod
+    def build(cls, features: np.ndarray, n_trees: int = 10, metric: str = "euclidean", path: str = None):
+        index = AnnoyIndex(features.shape[1], metric)
+        for i, vector in enumerate(features):
+            index.add_item(i, vector)
+        index.build(n_trees=n_trees)
+
+        # saving also re-opens the index as an mmap of the file, like a loaded bundle. a temp file
+        # can be unlinked right away, the mapping stays valid
+        if path is not None:
+            index.save(path)
+            return cls(index, path=path)
+
+        fd, tmp_path = tempfile.mkstemp(suffix=".ann")
+        os.close(fd)
+        index.save(tmp_path)
+        size_bytes = os.path.getsize(tmp_path)
+        os.remove(tmp_path)
+        return cls(index, size_bytes=size_bytes)
+
+    def get_n_items(self) -> int:
+        return self.index.get_n_items()
+
+    def get_nns_by_vector(self, vector, n: int, search_k: int = -1, include_distances: bool = False):
+        return self.index.get_nns_by_vector(vector, n, search_k=search_k, include_distances=include_distances)
+
+    def memory_bytes(self) -> int:
+        return self.size_bytes
+
+
+class ExactEngine(VectorIndex):
+    """
+    brute force euclidean search with blocked float32 matrix math, the recall baseline.
+    |x - q|^2 = |x|^2 - 2 x.q + |q|^2 over row blocks, keeping a running top n
+    """
+    name = "exact"
+
+    def __init__(self, features: np.ndarray, block_size: int = 65536):
+        self.features = features
+        self.block_size = block_size
+        as_f32 = np.asarray(features, dtype=np.float32)
+        self.sq_norms = np.einsum("ij,ij->i", as_f32, as_f32)
+
+    @classmethod
+    def build(cls, features: np.ndarray, **params):
+        return cls(np.ascontiguousarray(features, dtype=np.float32), **params)
+
+    def get_n_items(self) -> int:
+        return len(self.features)
+
+    def search(self, queries: np.ndarray, n: int):
+        """(idxs, squared distances) of the n nearest rows for every query row, nearest first"""
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        best_idx = np.empty((len(queries), 0), dtype=np.int64)
+        best_dist = np.empty((len(queries), 0), dtype=np.float32)
+        q_norms = np.einsum("ij,ij->i", queries, queries)[:, None]
+
+        for start in range(0, len(self.features), self.block_size):
+            block = np.asarray(self.features[start:start + self.block_size], dtype=np.float32)
+            dist = self.sq_norms[start:start + len(block)] - 2 * (queries @ block.T) + q_norms
+
+            cand_dist = np.concatenate([best_dist, dist], axis=1)
+            cand_idx = np.concatenate([best_idx, np.broadcast_to(np.arange(start, start + len(block)), dist.shape)], axis=1)
+            top = top_n(cand_dist, n)
+            best_idx = np.take_along_axis(cand_idx, top, axis=1)
+            best_dist = np.take_along_axis(cand_dist, top, axis=1)
+
+        return best_idx, best_dist
+
+    def get_nns_by_vector(self, vector, n: int, search_k: int = -1, include_distances: bool = False):
+        idxs, dist = self.search(vector, n)
+        return _result(idxs[0], dist[0], include_distances)
+
+    def memory_bytes(self) -> int:
+        return self.features.nbytes + self.sq_norms.nbytes
+
+
+class IVFEngine(VectorIndex):
+    """
+    inverted file over the kmeans clusters already fitted by song_cluster_pipeline: the query is
+    compared with the centroids, the n_probe closest clusters are scanned exactly. search_k, when
+    given, is the minimum number of rows to scan, more clusters are probed until it is reached
+    """
+    name = "ivf"
+
+    def __init__(self, features: np.ndarray, centroids: np.ndarray, labels: np.ndarray, n_probe: int = 3):
+        self.features = features
+        self.centroids = np.asarray(centroids, dtype=np.float32)
+        self.n_probe = n_probe
+
+        labels = np.asarray(labels)
+        order = np.argsort(labels, kind="stable")
+        bounds = np.searchsorted(labels[order], np.arange(len(self.centroids) + 1))
+        self.lists = [order[bounds[c]:bounds[c + 1]] for c in range(len(self.centroids))]
+
+    @classmethod
+    def build(cls, features: np.ndarray, n_clusters: int = 20, n_probe: int = 3):
+        from sklearn.cluster import KMeans
+
+        kmeans = KMeans(n_clusters=n_clusters, n_init=1, random_state=0).fit(features)
+        return cls(features, kmeans.cluster_centers_, kmeans.labels_, n_probe=n_probe)
+
+    def get_n_items(self) -> int:
+        return len(self.features)
+
+    def get_nns_by_vector(self, vector, n: int, search_k: int = -1, include_distances: bool = False):
+        query = np.asarray(vector, dtype=np.float32)
+        centroid_order = np.argsort(((self.centroids - query) ** 2).sum(axis=1))
+        min_scan = max(n, search_k)
+
+        probed, scanned = [], 0
+        for cluster in centroid_order:
+            probed.append(self.lists[cluster])
+            scanned += len(self.lists[cluster])
+            if len(probed) >= self.n_probe and scanned >= min_scan:
+                break
+
+        rows = np.concatenate(probed)
+        diff = np.asarray(self.features[rows], dtype=np.float32) - query
+        dist = np.einsum("ij,ij->i", diff, diff)
+        top = top_n(dist[None, :], min(n, len(rows)))[0]
+        return _result(rows[top], dist[top], include_distances)
+
+    def memory_bytes(self) -> int:
+        return self.features.nbytes + self.centroids.nbytes + sum(rows.nbytes for rows in self.lists)
+
+
+ENGINES = {engine.name: engine for engine in (AnnoyEngine, ExactEngine, IVFEngine)}
+
+
+def engine_from_bundle(name: str, bundle, **params) -> VectorIndex:
+    """wraps the loaded model bundle in the engine `name` without refitting anything"""
+    if name == "annoy":
+        return AnnoyEngine(bundle.annoy_index, path=os.path.join(bundle.path, "songs.ann"))
+    if name == "exact":
+        return ExactEngine(bundle.features, **params)
+    if name == "ivf":
+        params.setdefault("n_probe", IVF_N_PROBE)
+        return IVFEngine(bundle.features, bundle.cluster_centers, bundle.store.cluster_label, **params)
+    raise ValueError(f"unknown ANN backend {name!r}, expected one of {sorted(ENGINES)}")
+
+
+def build_engine(name: str, features: np.ndarray, centroids: np.ndarray = None, labels: np.ndarray = None,
+                 **params) -> VectorIndex:
+    """fresh engine `name` over `features`, ivf reuses the fitted centroids and labels when given"""
+    if name == "annoy":
+        return AnnoyEngine.build(features, **params)
+    if name == "exact":
+        return ExactEngine.build(features, **params)
+    if name == "ivf":
+        params.setdefault("n_probe", IVF_N_PROBE)
+        if centroids is not None and labels is not None:
+            return IVFEngine(features, centroids, labels, **params)
+        return IVFEngine.build(features, **params)
+    raise ValueError(f"unknown ANN backend {name!r}, expected one of {sorted(ENGINES)}")
@@ -0,0 +1,78 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.utils import number_cols
+
+
+def make_catalog(n_songs: int = 500, n_genres: int = 40, seed: int = 0):
+    """small synthetic stand-in for data/data.csv and data/data_by_genres.csv"""
+    rng = np.random.default_rng(seed)
+
+    songs = pd.DataFrame({
+        'valence': rng.random(n_songs),
+        'year': rng.integers(1960, 2021, n_songs),
+        'acousticness': rng.random(n_songs),
+        'artists': [str([f"Artist {i % 60}", f"Feat {i % 7}"]) for i in range(n_songs)],
+        'danceability': rng.random(n_songs),
+        'duration_ms': rng.integers(90_000, 400_000, n_songs),
+        'energy': rng.random(n_songs),
+        'explicit': rng.integers(0, 2, n_songs),
+        'id': [f"id{i:06d}" for i in range(n_songs)],
+        'instrumentalness': rng.random(n_songs),
+        'key': rng.integers(0, 12, n_songs),
+        'liveness': rng.random(n_songs),
+        'loudness': rng.uniform(-40, 0, n_songs),
+        'mode': rng.integers(0, 2, n_songs),
+        'name': [f"Song {i}" for i in range(n_songs)],
+        'popularity': rng.integers(0, 101, n_songs),
+        'release_date': [f"{y}-01-01" for y in rng.integers(1960, 2021, n_songs)],
+        'speechiness': rng.random(n_songs),
+        'tempo': rng.uniform(60, 200, n_songs),
+    })
+    songs.loc[0, ['name', 'year']] = ["Shut Up and Dance", 2014]
+
+    genres = pd.DataFrame({
+        'mode': rng.integers(0, 2, n_genres),
+        'genres': [f"genre {i}" for i in range(n_genres)],
+        'acousticness': rng.random(n_genres),
+        'danceability': rng.random(n_genres),
+        'duration_ms': rng.uniform(90_000, 400_000, n_genres),
+        'energy': rng.random(n_genres),
+        'instrumentalness': rng.random(n_genres),
+        'liveness': rng.random(n_genres),
+        'loudness': rng.uniform(-40, 0, n_genres),
+        'speechiness': rng.random(n_genres),
+        'tempo': rng.uniform(60, 200, n_genres),
+        'valence': rng.random(n_genres),
+        'popularity': rng.uniform(0, 100, n_genres),
+        'key': rng.integers(0, 12, n_genres),
+    })
+    assert set(number_cols) <= set(songs.columns)
+    return songs, genres
+
+
+@pytest.fixture
+def catalog_csvs(tmp_path):
+    songs, genres = make_catalog()
+    songs_csv = tmp_path / "data.csv"
+    genres_csv = tmp_path / "data_by_genres.csv"
+    songs.to_csv(songs_csv, index=False)
+    genres.to_csv(genres_csv, index=False)
+    return str(songs_csv), str(genres_csv)
+
+
+@pytest.fixture(scope="session")
+def served_app(tmp_path_factory):
+    """src.app serving a bundle built from make_catalog, no postgres, redis or data/data.csv needed"""
+    from src import app
+    from src.model_store import build_bundle, load_bundle
+
+    songs, genres = make_catalog(n_songs=2000)
+    tmp = tmp_path_factory.mktemp("served")
+    songs.to_csv(tmp / "data.csv", index=False)
+    genres.to_csv(tmp / "data_by_genres.csv", index=False)
+    app.load_model(load_bundle(build_bundle(str(tmp / "data.csv"), str(tmp / "data_by_genres.csv"),
+                                            str(tmp / "artifacts")), frame=False))
+    app.songs = songs
+    return app
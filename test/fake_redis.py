@@ -0,0 +1,179 @@
+import time
+
+from redis import WatchError
+
+
+class FakeRedis:
+    """
+    in-memory stand-in for the redis calls the app makes (strings, hashes, sets, ttls, pipelines
+    and WATCH). round_trips counts what would hit the network: one per command, one per pipeline execute
+    """
+
+    def __init__(self, **values):
+        self.store = dict(values)
+        self.expires = {}
+        self.writes = {}  # key -> times written, what WATCH compares
+        self.round_trips = 0
+
+    def _touch(self, key):
+        self.writes[key] = self.writes.get(key, 0) + 1
+
+    def _live(self, key):
+        if key in self.expires and self.expires[key] <= time.time():
+            self.store.pop(key, None)
+            self.expires.pop(key, None)
+        return self.store.get(key)
+
+    def _call(self, fn, *args, **kwargs):
+        self.round_trips += 1
+        return fn(*args, **kwargs)
+
+    # --- commands, each applied by an _op so pipelines can reuse them ---
+
+    def _get(self, key):
+        value = self._live(key)
+        return value if isinstance(value, str) else None
+
+    def _set(self, key, value):
+        self._touch(key)
+        self.store[key] = value
+        self.expires.pop(key, None)
+        return True
+
+    def _setex(self, key, ttl, value):
+        self._touch(key)
+        self.store[key] = value
+        self.expires[key] = time.time() + ttl
+        return True
+
+    def _mget(self, keys):
+        return [self._get(key) for key in keys]
+
+    def _hset(self, key, mapping):
+        current = self._live(key) or {}
+        added = len(set(mapping) - set(current))
+        self._touch(key)
+        self.store[key] = {**current, **{field: str(value) for field, value in mapping.items()}}
+        return added
+
+    def _hgetall(self, key):
+        return dict(self._live(key) or {})
+
+    def _sadd(self, key, *members):
+        current = self._live(key) or set()
+        added = len(set(members) - current)
+        self._touch(key)
+        self.store[key] = current | set(members)
+        return added
+
+    def _smismember(self, key, members):
+        current = self._live(key) or set()
+        return [int(member in current) for member in members]
+
+    def _expire(self, key, ttl):
+        if self._live(key) is None:
+            return False
+        self._touch(key)
+        self.expires[key] = time.time() + ttl
+        return True
+
+    def _ttl(self, key):
+        if self._live(key) is None:
+            return -2
+        return int(self.expires[key] - time.time()) if key in self.expires else -1
+
+    def _delete(self, *keys):
+        removed = sum(1 for key in keys if self._live(key) is not None)
+        for key in keys:
+            self._touch(key)
+            self.store.pop(key, None)
+            self.expires.pop(key, None)
+        return removed
+
+    def get(self, key):
+        return self._call(self._get, key)
+
+    def set(self, key, value):
+        return self._call(self._set, key, value)
+
+    def setex(self, key, ttl, value):
+        return self._call(self._setex, key, ttl, value)
+
+    def mget(self, keys):
+        return self._call(self._mget, keys)
+
+    def hset(self, key, mapping):
+        return self._call(self._hset, key, mapping)
+
+    def hgetall(self, key):
+        return self._call(self._hgetall, key)
+
+    def sadd(self, key, *members):
+        return self._call(self._sadd, key, *members)
+
+    def smismember(self, key, members):
+        return self._call(self._smismember, key, members)
+
+    def expire(self, key, ttl):
+        return self._call(self._expire, key, ttl)
+
+    def ttl(self, key):
+        return self._call(self._ttl, key)
+
+    def delete(self, *keys):
+        return self._call(self._delete, *keys)
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+
+class FakePipeline:
+    """after watch() commands run right away until multi(), like redis-py's pipeline"""
+
+    def __init__(self, redis_con):
+        self.redis_con = redis_con
+        self.commands = []
+        self.watching = None  # key -> writes when it was watched
+        self.buffering = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.reset()
+
+    def reset(self):
+        self.commands = []
+        self.watching = None
+        self.buffering = True
+
+    def watch(self, *keys):
+        self.redis_con.round_trips += 1
+        self.watching = {key: self.redis_con.writes.get(key, 0) for key in keys}
+        self.buffering = False
+
+    def unwatch(self):
+        self.redis_con.round_trips += 1
+        self.reset()
+
+    def multi(self):
+        self.buffering = True
+
+    def __getattr__(self, name):
+        op = getattr(self.redis_con, f"_{name}")
+
+        def queue(*args, **kwargs):
+            if not self.buffering:
+                return self.redis_con._call(op, *args, **kwargs)
+            self.commands.append((op, args, kwargs))
+            return self
+        return queue
+
+    def execute(self):
+        self.redis_con.round_trips += 1
+        watching = self.watching
+        commands = self.commands
+        self.reset()
+        if watching and any(self.redis_con.writes.get(key, 0) != writes for key, writes in watching.items()):
+            raise WatchError("Watched variable changed.")
+        return [op(*args, **kwargs) for op, args, kwargs in commands]
@@ -0,0 +1,111 @@
+import json
+import time
+import hashlib
+import itertools
+import threading
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+FLAC_BYTES = b"fLaC" + b"\x00" * 1024
+
+
+class MockMureka:
+    """local stand-in for the parts of the mureka api we call, records every request path"""
+
+    def __init__(self, polls_before_success: int = 1, lyrics_delay: float = 0.0):
+        self.polls_before_success = polls_before_success
+        self.lyrics_delay = lyrics_delay
+        self.clients = set()  # (host, port) of every connection, to check keep-alive reuse
+        self.requests = []
+        self.polls = {}
+        self.uploads = {}  # file id -> uploaded bytes (multipart body without the boundary)
+        self.tasks = {}  # task id -> song/generate request body
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status, body, content_type="application/json"):
+                payload = json.dumps(body).encode() if content_type == "application/json" else body
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                body = self.rfile.read(length)
+                mock.record(self.path, self.client_address)
+                if self.path == "/v1/lyrics/generate":
+                    prompt = json.loads(body)["prompt"]
+                    time.sleep(mock.lyrics_delay)
+                    if prompt == "fail":
+                        return self._send(500, {"error": "upstream exploded"})
+                    return self._send(200, {"lyrics": f"lyrics about {prompt} #{mock.count(self.path)}"})
+                if self.path == "/v1/files/upload":
+                    boundary = self.headers["Content-Type"].split("boundary=")[-1].encode()
+                    content = body.replace(boundary, b"")
+                    # same content, same id, so tests can tell whose clip was uploaded
+                    file_id = "file-" + hashlib.sha1(content).hexdigest()[:12]
+                    with mock._lock:
+                        mock.uploads[file_id] = content
+                    return self._send(200, {"id": file_id, "bytes": length})
+                if self.path == "/v1/song/generate":
+                    with mock._lock:
+                        task_id = f"task-{next(mock._ids)}"
+                        mock.tasks[task_id] = json.loads(body)
+                    return self._send(200, {"id": task_id})
+                return self._send(404, {"error": "not found"})
+
+            def do_GET(self):
+                mock.record(self.path, self.client_address)
+                if self.path.startswith("/v1/song/query/"):
+                    task_id = self.path.rsplit("/", 1)[-1]
+                    if mock.poll(task_id) <= mock.polls_before_success:
+                        return self._send(200, {"id": task_id, "status": "running"})
+                    return self._send(200, {"id": task_id, "status": "succeeded", "choices": [{
+                        "flac_url": f"{mock.url}/files/{task_id}.flac",
+                        "lyrics_sections": [{"lines": [{"text": "la la"}, {"text": "la"}]}],
+                    }]})
+                if self.path.startswith("/files/"):
+                    return self._send(200, mock.song_bytes(self.path[len("/files/"):-len(".flac")]),
+                                      content_type="audio/flac")
+                return self._send(404, {"error": "not found"})
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def record(self, path: str, client=None):
+        with self._lock:
+            self.requests.append(path)
+            self.clients.add(client)
+
+    def poll(self, task_id: str) -> int:
+        with self._lock:
+            self.polls[task_id] = self.polls.get(task_id, 0) + 1
+            return self.polls[task_id]
+
+    def song_bytes(self, task_id: str) -> bytes:
+        """the 'generated' flac names the reference it was made from"""
+        reference = self.tasks.get(task_id, {}).get("reference_id") or "none"
+        return FLAC_BYTES + reference.encode() * 64
+
+    def count(self, path_prefix: str) -> int:
+        with self._lock:
+            return sum(1 for path in self.requests if path.startswith(path_prefix))
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,86 @@
+import numpy as np
+import pytest
+
+from src.artists import ArtistIndex, cap_per_artist
+
+
+def make_index(backend="exact"):
+    artists = np.array(["Queen", "queen ", "ABBA", None, "Abba", "Muse"], dtype=object)
+    features = np.array([[0, 0], [2, 2], [10, 10], [5, 5], [12, 12], [1, 1]], dtype=np.float32)
+    return ArtistIndex(artists, features, backend=backend), features
+
+
+def test_positions_and_centroids_by_normalized_name():
+    artists, _ = make_index()
+    assert len(artists) == 3
+    assert artists.positions("QUEEN").tolist() == [0, 1]
+    assert artists.positions("abba").tolist() == [2, 4]
+    assert artists.positions("Nobody").tolist() == []
+    assert artists.row_artist.tolist()[3] == -1
+    np.testing.assert_allclose(artists.centroid("Queen"), [1, 1])
+    np.testing.assert_allclose(artists.centroid("ABBA"), [11, 11])
+    assert artists.centroid("Nobody") is None
+
+
+def test_incremental_add_matches_a_full_build():
+    artists, features = make_index()
+    more = np.array(["Muse", "Blur"], dtype=object)
+    more_features = np.array([[3, 3], [7, 7]], dtype=np.float32)
+    artists.add(more, more_features, start=6)
+
+    full = ArtistIndex(np.r_[np.array(["Queen", "queen ", "ABBA", None, "Abba", "Muse"], dtype=object), more],
+                       np.r_[features, more_features], backend="exact")
+    assert artists.names == full.names
+    assert artists.row_artist.tolist() == full.row_artist.tolist()
+    np.testing.assert_allclose(artists.centroids, full.centroids)
+    assert artists.positions("muse").tolist() == [5, 6]
+
+    with pytest.raises(ValueError):
+        artists.add(more, more_features, start=3)
+
+
+@pytest.mark.parametrize("backend", ["exact", "annoy"])
+def test_saved_index_loads_mapped(tmp_path, backend):
+    artists, features = make_index(backend)
+    artists.save(str(tmp_path))
+    loaded = ArtistIndex.load(str(tmp_path), mmap=True, backend=backend)
+
+    assert loaded.names == artists.names
+    assert isinstance(loaded.centroids, np.memmap)
+    np.testing.assert_allclose(loaded.centroids, artists.centroids)
+    for name in ["queen", "ABBA", "Muse", "Nobody"]:
+        assert loaded.positions(name).tolist() == artists.positions(name).tolist()
+    assert loaded.similar("queen", 5) == artists.similar("queen", 5)
+
+    # the loaded arrays are read only, adding rows makes new ones
+    loaded.add(np.array(["Blur"], dtype=object), np.array([[0.5, 0.5]], dtype=np.float32), start=6)
+    assert loaded.positions("blur").tolist() == [6]
+
+
+def test_add_defers_the_centroid_index_to_rebuild_ann():
+    artists, _ = make_index()
+    ann = artists._ann
+    artists.add(np.array(["Blur", "Muse"], dtype=object), np.array([[0.5, 0.5], [9, 9]], dtype=np.float32), start=6)
+    assert artists._ann is ann
+
+    # Blur is not in the centroid index yet but found exactly, Muse is ranked by its moved centroid
+    assert [artists.names[i] for i, _ in artists.nearest([0.4, 0.4], 4)] == ["Blur", "Queen", "Muse", "ABBA"]
+    artists.rebuild_ann()
+    assert artists._ann[1] == 4
+    assert [artists.names[i] for i, _ in artists.nearest([0.4, 0.4], 4)] == ["Blur", "Queen", "Muse", "ABBA"]
+
+
+def test_similar_excludes_the_artist_itself():
+    artists, _ = make_index()
+    similar = artists.similar("queen", 5)
+    assert [s["name"] for s in similar] == ["Muse", "ABBA"]
+    assert similar[0]["songs"] == 1
+    assert artists.similar("Nobody") is None
+
+
+def test_cap_per_artist_keeps_order():
+    row_artist = np.array([0, 0, 1, -1, 0, 1, -1, 2], dtype=np.int32)
+    positions = np.array([4, 0, 3, 1, 2, 6, 5, 7])
+    assert cap_per_artist(positions, row_artist, 1).tolist() == [4, 3, 2, 6, 7]
+    assert cap_per_artist(positions, row_artist, 2).tolist() == [4, 0, 3, 2, 6, 5, 7]
+    assert cap_per_artist(positions, row_artist, 0).tolist() == positions.tolist()
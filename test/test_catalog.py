@@ -0,0 +1,165 @@
+import os
+import datetime
+
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from src import catalog, model_store
+from src.catalog import parse_artists, first_artists, save_columns, load_columns, load_postgres_catalog, CATALOG_COLUMNS
+from src.model_store import build_bundle, load_bundle, load_or_build_bundle, current_version
+from test.conftest import make_catalog
+
+
+class FakeCursor:
+    def __init__(self, db, name=None):
+        self.db = db
+        self.name = name
+        self.itersize = None
+        self._rows = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql, args=None):
+        self.db.queries.append(sql)
+        if sql.startswith("SET TRANSACTION"):
+            return
+        if "count(*)" in sql:
+            self._rows = [(len(self.db.rows), self.db.updated_at)]
+        else:
+            assert self.name, "the catalog has to come through a server side cursor"
+            self._rows = list(self.db.rows)
+
+    def fetchone(self):
+        return self._rows.pop(0)
+
+    def fetchmany(self, size):
+        self.db.round_trips += 1
+        chunk, self._rows = self._rows[:size], self._rows[size:]
+        return chunk
+
+
+class FakeCatalogDB:
+    """music.song_features rows as psycopg2 hands them back, artists as a python list"""
+
+    def __init__(self, songs: pd.DataFrame):
+        rows = songs[CATALOG_COLUMNS].astype(object)
+        rows["artists"] = rows["artists"].map(parse_artists)
+        self.rows = list(rows.itertuples(index=False, name=None))
+        self.updated_at = datetime.datetime(2024, 1, 1)
+        self.queries = []
+        self.round_trips = 0
+
+    def cursor(self, name=None):
+        return FakeCursor(self, name)
+
+    def commit(self):
+        pass
+
+    @contextmanager
+    def connection(self):
+        yield self
+
+
+def test_parse_artists_is_literal_only():
+    assert parse_artists("['A', 'B, Jr.']") == ["A", "B, Jr."]
+    assert parse_artists("'Solo'") == ["Solo"]
+    assert parse_artists(["x"]) == ["x"]
+    assert parse_artists(np.nan) == []
+    for bad in ["__import__('os').system('true')", "['unterminated", "{'a': 1}"]:
+        with pytest.raises(ValueError):
+            parse_artists(bad)
+
+
+def test_first_artists_parses_each_distinct_value_once(monkeypatch):
+    calls = []
+    real = catalog.parse_artists
+    monkeypatch.setattr(catalog, "parse_artists", lambda v: calls.append(v) or real(v))
+
+    artists = pd.Series(["['A', 'B']", "['C']", "['A', 'B']", None, "[]"] * 100)
+    firsts = first_artists(artists)
+    assert list(firsts[:3]) == ["A", "C", "A"]
+    assert firsts[3:5].isna().all()
+    assert len(calls) == 3
+
+
+def test_columns_roundtrip(tmp_path):
+    df = pd.DataFrame({"n": [1.5, 2.0], "i": [1, 2], "s": ["a\tb", None]})
+    loaded = load_columns(str(tmp_path), save_columns(str(tmp_path), df))
+    assert loaded["n"].tolist() == [1.5, 2.0] and loaded["i"].tolist() == [1, 2]
+    assert loaded["s"][0] == "a\tb" and pd.isna(loaded["s"][1])
+    assert sorted(os.listdir(tmp_path)) == ["i.npy", "n.npy", "s.nulls.npy", "s.utf8"]
+
+
+def test_postgres_catalog_is_snapshotted(tmp_path):
+    songs, _ = make_catalog(n_songs=120)
+    db = FakeCatalogDB(songs)
+    snapshot_dir = str(tmp_path / "snapshots")
+
+    data, fingerprint = load_postgres_catalog(snapshot_dir, chunk_rows=50, connection=db.connection)
+    assert db.round_trips == 4  # 50 + 50 + 20 + the empty fetch that ends it
+    assert len(data) == 120 and data.loc[0, "name"] == "Shut Up and Dance"
+    assert data.loc[5, "artists"] == songs.loc[5, "artists"]
+    assert data.loc[5, "first_artist"] == parse_artists(songs.loc[5, "artists"])[0]
+
+    # unchanged table: the next boot reads the snapshot and only runs the fingerprint query
+    db.round_trips = 0
+    again, same = load_postgres_catalog(snapshot_dir, chunk_rows=50, connection=db.connection)
+    assert same == fingerprint and db.round_trips == 0
+    pd.testing.assert_frame_equal(again[data.columns], data, check_dtype=False)
+
+    # a write bumps updated_at, the old snapshot is replaced
+    db.updated_at = datetime.datetime(2024, 1, 2)
+    _, newer = load_postgres_catalog(snapshot_dir, chunk_rows=50, connection=db.connection)
+    assert newer != fingerprint and os.listdir(snapshot_dir) == [newer]
+
+
+def test_bundle_from_postgres_matches_csv(catalog_csvs, tmp_path, monkeypatch):
+    songs_csv, genres_csv = catalog_csvs
+    db = FakeCatalogDB(pd.read_csv(songs_csv))
+    monkeypatch.setattr(catalog.index, "connection", db.connection)
+    monkeypatch.setattr(catalog, "CATALOG_SNAPSHOT_DIR", str(tmp_path / "snapshots"))
+
+    from_csv = load_bundle(build_bundle(songs_csv, genres_csv, str(tmp_path / "csv")))
+    out_dir = str(tmp_path / "pg")
+    from_pg = load_or_build_bundle("missing.csv", genres_csv, out_dir, source="postgres")
+
+    assert from_pg.manifest["sources"]["songs"] == "postgres:music.song_features"
+    assert current_version(out_dir) == from_pg.version != from_csv.version
+    by_id = from_csv.data.set_index("id")
+    pg = from_pg.data.set_index("id")
+    assert (pg["first_artist"] == by_id.loc[pg.index, "first_artist"]).all()
+    assert (pg["predicted_genre"] == by_id.loc[pg.index, "predicted_genre"]).all()
+
+    # stays put while the table does
+    assert load_or_build_bundle("missing.csv", genres_csv, out_dir, source="postgres").version == from_pg.version
+
+    # a write lands between the boot's fingerprint check and the catalog read: the bundle is versioned
+    # by the rows it was built from, so the next boot finds it current instead of rebuilding
+    builds = []
+    real_load = catalog.load_postgres_catalog
+
+    def load_after_a_write(*args, **kwargs):
+        db.updated_at = datetime.datetime(2024, 1, 3)
+        return real_load(*args, **kwargs)
+
+    with monkeypatch.context() as m:
+        m.setattr(model_store, "load_postgres_catalog", load_after_a_write)
+        m.setattr(model_store, "build_bundle", lambda *a, **kw: builds.append(kw["src_hash"]) or build_bundle(*a, **kw))
+        db.updated_at = datetime.datetime(2024, 1, 2)
+        raced = load_or_build_bundle("missing.csv", genres_csv, out_dir, source="postgres")
+        assert load_or_build_bundle("missing.csv", genres_csv, out_dir, source="postgres").version == raced.version
+    assert len(builds) == 1 and raced.manifest["source_hash"] == model_store.postgres_source_hash(genres_csv)
+    from_pg = raced
+
+    # db down at boot: the current bundle is served
+    def down():
+        raise ConnectionError("db down")
+    monkeypatch.setattr(catalog.index, "connection", down)
+    assert load_or_build_bundle("missing.csv", genres_csv, out_dir, source="postgres").version == from_pg.version
@@ -0,0 +1,50 @@
+import numpy as np
+import soundfile as sf
+
+from src.song_Gen.youTfileCreateor import hop_energies, best_window_start, find_best_start, find_best_30s
+
+
+def _reference_start(y, sr, duration):
+    # the original per frame formulation
+    frame_length, hop_length = int(sr * 0.5), int(sr * 0.25)
+    energy = np.array([np.sum(np.abs(y[i:i + frame_length] ** 2)) for i in range(0, len(y), hop_length)])
+    window_size = int((duration * sr) / hop_length)
+    return int(np.argmax(np.convolve(energy, np.ones(window_size), mode='valid')))
+
+
+def test_hop_energies_are_independent_of_block_boundaries():
+    y = np.random.default_rng(0).standard_normal(10_007).astype(np.float32)
+    expected = np.array([np.sum(y[i:i + 100].astype(np.float64) ** 2) for i in range(0, len(y), 100)])
+
+    for block_size in (1, 37, 100, 4096, 20_000):
+        blocks = (y[i:i + block_size] for i in range(0, len(y), block_size))
+        np.testing.assert_allclose(hop_energies(blocks, 100), expected, rtol=1e-6)
+
+
+def test_best_window_matches_the_per_frame_loop():
+    sr, duration = 400, 10
+    rng = np.random.default_rng(1)
+    for _ in range(5):
+        y = (rng.standard_normal(sr * 60) * np.repeat(rng.random(60), sr)).astype(np.float32)
+        energy = hop_energies([y], int(sr * 0.25))
+        assert best_window_start(energy, int(duration / 0.25)) == _reference_start(y, sr, duration)
+
+
+def test_short_track_starts_at_zero():
+    assert best_window_start(np.ones(10), 120) == 0
+
+
+def test_finds_and_cuts_the_loud_stretch(tmp_path):
+    sr = 8000
+    t = np.arange(sr * 120) / sr
+    y = 0.05 * np.sin(2 * np.pi * 220 * t)
+    y[sr * 70:sr * 100] *= 10  # loud between 70s and 100s
+    source = tmp_path / "track.wav"
+    sf.write(source, y.astype(np.float32), sr)
+
+    assert abs(find_best_start(str(source), duration=30) - 70) <= 0.5
+
+    output = tmp_path / "best.wav"
+    find_best_30s(str(source), str(output))
+    info = sf.info(str(output))
+    assert info.samplerate == sr and abs(info.duration - 30) < 0.01
@@ -0,0 +1,94 @@
+import os
+import time
+
+import numpy as np
+import soundfile as sf
+
+from src.song_Gen import youTfileCreateor
+from src.song_Gen.clip_cache import ClipCache, clip_key, youtube_video_id
+
+
+class FakeRedis:
+    def __init__(self):
+        self.store = {}
+
+    def get(self, key):
+        return self.store.get(key)
+
+    def setex(self, key, ttl, value):
+        self.store[key] = value
+
+
+def test_video_id_from_the_usual_url_shapes():
+    for url in ("https://www.youtube.com/watch?v=dQw4w9WgXcQ&t=42s", "youtube.com/watch?v=dQw4w9WgXcQ",
+                "https://youtu.be/dQw4w9WgXcQ?si=abc", "https://m.youtube.com/shorts/dQw4w9WgXcQ",
+                "https://music.youtube.com/watch?v=dQw4w9WgXcQ&list=RD", "https://www.youtube.com/embed/dQw4w9WgXcQ"):
+        assert youtube_video_id(url) == "dQw4w9WgXcQ", url
+    assert youtube_video_id("https://example.com/watch?v=dQw4w9WgXcQ") is None
+
+
+def test_key_follows_the_video_not_the_url():
+    assert clip_key("https://youtu.be/dQw4w9WgXcQ") == clip_key("https://www.youtube.com/watch?v=dQw4w9WgXcQ&t=1")
+    assert clip_key("https://youtu.be/dQw4w9WgXcQ") != clip_key("https://youtu.be/9bZkp7q19f0")
+
+
+def _fake_download(calls, sr=8000):
+    def download(youtube_url, workdir="."):
+        calls.append(youtube_url)
+        path = os.path.join(workdir, "source.wav")
+        sf.write(path, np.random.default_rng(len(calls)).standard_normal(sr * 40).astype(np.float32) * 0.1, sr)
+        return path
+    return download
+
+
+def test_repeated_link_skips_download_analysis_and_upload(monkeypatch, tmp_path):
+    downloads, uploads = [], []
+    monkeypatch.setattr(youTfileCreateor, "download_audio", _fake_download(downloads))
+
+    def upload(clip):
+        uploads.append(clip.getvalue())
+        return f"file-{len(uploads)}"
+
+    redis_con = FakeRedis()
+    cache = ClipCache(str(tmp_path / "clips"), redis_getter=lambda: redis_con)
+    stages = []
+
+    ref, outcome = cache.reference_id("https://youtu.be/dQw4w9WgXcQ", str(tmp_path), upload, stages.append)
+    assert (ref, outcome["cache"], stages) == ("file-1", "miss", ["download", "upload"])
+
+    ref, outcome = cache.reference_id("https://www.youtube.com/watch?v=dQw4w9WgXcQ", str(tmp_path), upload)
+    assert (ref, outcome["cache"]) == ("file-1", "ref_hit")
+    assert outcome["bytes_saved"] > len(uploads[0])
+    assert len(downloads) == 1 and len(uploads) == 1
+
+    # the file id ran out in redis: the clip on disk is uploaded again, no new download
+    redis_con.store.clear()
+    ref, outcome = cache.reference_id("https://youtu.be/dQw4w9WgXcQ", str(tmp_path), upload)
+    assert (ref, outcome["cache"]) == ("file-2", "clip_hit")
+    assert len(downloads) == 1 and uploads[1] == uploads[0]
+
+    stats = cache.stats()
+    assert (stats["misses"], stats["ref_hits"], stats["clip_hits"], stats["hit_rate"]) == (1, 1, 1, 0.6667)
+    assert os.listdir(tmp_path / "clips") and stats["disk_bytes"] == len(uploads[0])
+
+
+def test_disk_tier_evicts_least_recently_used(tmp_path):
+    cache = ClipCache(str(tmp_path), max_bytes=250, redis_getter=lambda: None)
+
+    def age(key, seconds):
+        stamp = time.time() - seconds
+        os.utime(os.path.join(tmp_path, f"{key}.mp3"), (stamp, stamp))
+
+    for key, seconds in (("a", 30), ("b", 20), ("c", 10)):
+        cache.store_clip(key, b"x" * 100, {"source_bytes": 1000})
+        age(key, seconds)
+
+    # three clips don't fit, "a" was used least recently
+    assert cache.load_clip("a") is None
+    assert cache.load_clip("b") is not None  # b is now the most recent
+
+    cache.store_clip("d", b"x" * 100, {})
+    assert cache.load_clip("c") is None
+    assert cache.load_clip("b") is not None and cache.load_clip("d") is not None
+    assert not os.path.exists(os.path.join(tmp_path, "c.json"))
+    assert cache.stats()["evictions"] == 2
@@ -0,0 +1,78 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.filters import CatalogFilters, MOOD_BANDS, MOODS, contains, count, pack, rows_of
+from src.partitions import GenrePartitions
+
+
+def make_catalog(n_rows=1003, seed=0):
+    rng = np.random.default_rng(seed)
+    data = pd.DataFrame({
+        'year': rng.integers(1950, 2021, n_rows),
+        'predicted_genre': [f"genre {i}" for i in rng.integers(0, 40, n_rows)],
+        'cluster_label': rng.integers(0, 20, n_rows),
+        'explicit': rng.integers(0, 2, n_rows),
+        'energy': rng.random(n_rows),
+        'valence': rng.random(n_rows),
+        'tempo': rng.uniform(60, 180, n_rows),
+    })
+    features = rng.normal(size=(n_rows, 15)).astype(np.float32)
+    return data, CatalogFilters(data, GenrePartitions(data['predicted_genre'].to_numpy(), features))
+
+
+def test_bitset_helpers():
+    mask = np.zeros(21, dtype=bool)
+    mask[[0, 7, 8, 20]] = True
+    bits = pack(mask)
+    assert len(bits) == 3 and count(bits) == 4
+    assert rows_of(bits, 21).tolist() == [0, 7, 8, 20]
+    assert contains(bits, np.arange(21)).tolist() == mask.tolist()
+
+
+def test_mask_matches_the_dataframe_filters():
+    data, filters = make_catalog()
+    bits = filters.mask(genres=["genre 3", "genre 5", "not a genre"], year_min=1970, year_max=1999,
+                        clusters=[1, 2, 3, 99], explicit=False)
+    expected = (data['predicted_genre'].isin(["genre 3", "genre 5"]) & data['year'].between(1970, 1999)
+                & data['cluster_label'].isin([1, 2, 3]) & (data['explicit'] == 0))
+    assert rows_of(bits, len(data)).tolist() == np.flatnonzero(expected).tolist()
+    assert filters.selectivity(bits) == pytest.approx(expected.mean())
+
+
+def test_year_ranges_are_open_ended_and_can_miss_the_catalog():
+    data, filters = make_catalog()
+    assert rows_of(filters.mask(year_min=2015), len(data)).tolist() == np.flatnonzero(data['year'] >= 2015).tolist()
+    assert rows_of(filters.mask(year_max=1955), len(data)).tolist() == np.flatnonzero(data['year'] <= 1955).tolist()
+    assert count(filters.mask(year_min=1800, year_max=1900)) == 0
+    assert count(filters.mask(year_min=2000, year_max=1990)) == 0
+
+
+def test_exclude_genres_and_the_padding_bits():
+    data, filters = make_catalog()
+    bits = filters.mask(exclude_genres=["genre 1"], explicit=True)
+    expected = (data['predicted_genre'] != "genre 1") & (data['explicit'] == 1)
+    assert count(bits) == expected.sum()
+    # 1003 rows, the last 5 bits of the last byte never get set
+    assert bits[-1] & 0b11111 == 0
+
+
+def test_moods_are_bands_of_energy_valence_and_tempo():
+    data, filters = make_catalog()
+    bits = filters.mood_bits("workout")
+    low, high = MOOD_BANDS["energy"][1], MOOD_BANDS["tempo"][0]
+    expected = (data['energy'] >= low) & (data['tempo'] >= high)
+    assert MOODS["workout"] == {"energy": ["high"], "tempo": ["mid", "high"]}
+    assert rows_of(bits, len(data)).tolist() == np.flatnonzero(expected).tolist()
+
+    with pytest.raises(ValueError):
+        filters.mask(mood="grumpy")
+
+
+def test_nearest_searches_only_the_filtered_rows():
+    data, filters = make_catalog()
+    bits = filters.mask(genres=["genre 7"])
+    query = np.zeros(15)
+    rows = np.flatnonzero(data['predicted_genre'] == "genre 7")
+    dist = (filters.features[rows] ** 2).sum(axis=1)
+    assert filters.nearest(query, bits, 5).tolist() == rows[np.argsort(dist)][:5].tolist()
@@ -0,0 +1,169 @@
+import os
+import time
+
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+
+from src.song_Gen.jobs import GenerationQueue, MemoryJobStore, QueueFull, update_job
+from src.song_Gen.task_poller import TaskPoller
+from test.mock_mureka import MockMureka
+
+
+def _wait_for(queue, job_id, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = queue.get(job_id)
+        if job["status"] in ("succeeded", "failed"):
+            return job
+        time.sleep(0.1)
+    raise AssertionError(f"job {job_id} did not finish: {queue.get(job_id)}")
+
+
+def test_job_runs_in_a_worker_process_against_mock_mureka(monkeypatch, tmp_path):
+    with MockMureka() as mureka:
+        monkeypatch.setenv("MUREKA_API_KEY", "test-key")
+        monkeypatch.setenv("MUREKA_API_URL", mureka.url)
+        monkeypatch.setenv("MUREKA_POLL_INTERVAL", "0.05")
+        monkeypatch.chdir(tmp_path)
+        # the worker process reads the env, the render is polled from this one
+        from src.song_Gen import murka_test
+        monkeypatch.setattr(murka_test, "MUREKA_API_URL", mureka.url)
+
+        queue = GenerationQueue(MemoryJobStore.shared(), workers=1,
+                                poller=TaskPoller(murka_test.query_song_task, initial_interval=0.05))
+        try:
+            job_id = queue.submit({"lyric_prompt": "summer", "song_prompt": "pop", "youTube_link": None})
+            assert queue.get(job_id)["status"] in ("queued", "running")
+
+            job = _wait_for(queue, job_id)
+        finally:
+            queue.shutdown()
+
+    assert job["status"] == "succeeded", job
+    assert job["result"]["lyrics"] == "la la\nla"
+    assert job["request"] == {"lyric_prompt": "summer", "song_prompt": "pop"}
+    assert mureka.count("/v1/song/query/") == 2
+    assert queue.stats()["succeeded"] == 1 and queue.stats()["rendering"] == 0
+
+
+def test_the_api_key_is_checked_on_the_first_call(monkeypatch):
+    monkeypatch.delenv("MUREKA_API_KEY", raising=False)
+    from src.song_Gen import murka_test  # importing needs no key
+    monkeypatch.delitem(murka_test.session.headers, "Authorization", raising=False)
+
+    with pytest.raises(ValueError, match="key is missing"):
+        murka_test.submit_song("summer", prompt="pop")
+
+
+def test_worker_slot_is_free_while_the_song_renders(monkeypatch, tmp_path):
+    monkeypatch.setenv("MUREKA_API_KEY", "test-key")
+    from src.song_Gen import murka_test
+
+    monkeypatch.chdir(tmp_path)
+    with MockMureka(polls_before_success=6) as mureka:
+        monkeypatch.setattr(murka_test, "MUREKA_API_URL", mureka.url)
+        poller = TaskPoller(murka_test.query_song_task, initial_interval=0.05, max_interval=0.05)
+        queue = GenerationQueue(MemoryJobStore(), workers=1, executor=ThreadPoolExecutor(1), poller=poller)
+        try:
+            job_ids = [queue.submit({"lyric_prompt": f"song {k}", "song_prompt": "pop"}) for k in range(3)]
+
+            # one worker, yet every job got submitted and is waiting on mureka at the same time
+            deadline = time.time() + 10
+            while time.time() < deadline and poller.in_flight() < 3:
+                time.sleep(0.01)
+            assert poller.in_flight() == 3
+            stats = queue.stats()
+            assert (stats["running"], stats["rendering"]) == (0, 3)
+            assert {queue.get(job_id)["stage"] for job_id in job_ids} == {"rendering"}
+
+            jobs = [_wait_for(queue, job_id) for job_id in job_ids]
+        finally:
+            queue.shutdown()
+
+    assert [job["status"] for job in jobs] == ["succeeded"] * 3
+    assert all(os.path.exists(job["result"]["song_path"]) for job in jobs)
+    assert queue.stats()["succeeded"] == 3
+
+
+class StuckExecutor:
+    """every job stays running forever, so the one worker slot is never released"""
+
+    def submit(self, fn, *args):
+        return Future()
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        pass
+
+
+def test_queue_depth_and_rejection_when_full():
+    queue = GenerationQueue(MemoryJobStore(), workers=1, max_queued=1, executor=StuckExecutor())
+
+    first = queue.submit({"lyric_prompt": "a"})
+    time.sleep(0.1)  # dispatched, holds the only slot
+    second = queue.submit({"lyric_prompt": "b"})
+
+    try:
+        queue.submit({"lyric_prompt": "c"})
+        assert False, "expected QueueFull"
+    except QueueFull:
+        pass
+
+    stats = queue.stats()
+    assert (stats["running"], stats["queue_depth"], stats["submitted"], stats["rejected"]) == (1, 1, 2, 1)
+    assert queue.get(first)["status"] == queue.get(second)["status"] == "queued"
+    queue.shutdown(wait=False)
+
+
+def exit_or_succeed(job_id, payload, store):
+    """a job for the spawned worker processes, {"crash": True} kills its worker like an oom would"""
+    if payload.get("crash"):
+        os._exit(1)
+    update_job(store, job_id, status="succeeded", stage="done", finished_at=time.time())
+
+
+def test_a_dead_worker_process_fails_its_job_and_the_pool_recovers():
+    queue = GenerationQueue(MemoryJobStore.shared(), workers=1, job=exit_or_succeed)
+    try:
+        crashed = queue.submit({"lyric_prompt": "a", "crash": True})
+        assert _wait_for(queue, crashed)["status"] == "failed"
+
+        after = [queue.submit({"lyric_prompt": f"song {k}"}) for k in range(2)]
+        assert [_wait_for(queue, job_id)["status"] for job_id in after] == ["succeeded", "succeeded"]
+    finally:
+        queue.shutdown()
+
+    stats = queue.stats()
+    assert (stats["running"], stats["failed"], stats["succeeded"]) == (0, 1, 2)
+
+
+class BrokenOnceExecutor:
+    """the first submit finds the pool broken, later ones run on a thread"""
+
+    def __init__(self):
+        self.pool = ThreadPoolExecutor(1)
+        self.broken = True
+
+    def submit(self, fn, *args):
+        if self.broken:
+            self.broken = False
+            raise BrokenProcessPool("a child process terminated abruptly")
+        return self.pool.submit(fn, *args)
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        self.pool.shutdown(wait=wait)
+
+
+def test_a_failed_submit_keeps_the_dispatcher_and_the_slot():
+    queue = GenerationQueue(MemoryJobStore(), workers=1, executor=BrokenOnceExecutor(), job=exit_or_succeed)
+    try:
+        lost = queue.submit({"lyric_prompt": "a"})
+        job = _wait_for(queue, lost)
+        assert job["status"] == "failed" and "BrokenProcessPool" in job["error"]
+
+        later = queue.submit({"lyric_prompt": "b"})
+        assert _wait_for(queue, later)["status"] == "succeeded"
+    finally:
+        queue.shutdown()
+    assert (queue.stats()["running"], queue.stats()["failed"], queue.stats()["succeeded"]) == (0, 1, 1)
@@ -0,0 +1,84 @@
+import os
+import time
+
+import numpy as np
+import soundfile as sf
+
+from concurrent.futures import ThreadPoolExecutor
+
+from src.song_Gen import jobs, youTfileCreateor
+from src.song_Gen.jobs import GenerationQueue, MemoryJobStore
+from src.song_Gen.task_poller import TaskPoller
+from test.mock_mureka import MockMureka, FLAC_BYTES
+
+N_JOBS = 6
+
+
+def _write_source(path, loud_at, sr=8000, seconds=60):
+    t = np.arange(sr * seconds) / sr
+    y = 0.05 * np.sin(2 * np.pi * (200 + 40 * loud_at) * t)
+    y[sr * loud_at:sr * (loud_at + 30)] *= 10
+    sf.write(path, y.astype(np.float32), sr)
+
+
+def test_parallel_jobs_do_not_share_files(monkeypatch, tmp_path):
+    sources = tmp_path / "sources"
+    sources.mkdir()
+    for k in range(N_JOBS):
+        _write_source(str(sources / f"{k}.wav"), loud_at=k)
+
+    def fake_download(youtube_url, workdir="."):
+        # stands in for yt-dlp: copies the local source into the job's workdir under the same name
+        # every job would use, so a shared directory would make the jobs clobber each other
+        k = youtube_url.rsplit("/", 1)[-1]
+        path = os.path.join(workdir, "source.wav")
+        with open(sources / f"{k}.wav", "rb") as src, open(path, "wb") as dst:
+            dst.write(src.read())
+        time.sleep(0.05)
+        return path
+
+    monkeypatch.setenv("MUREKA_API_KEY", "test-key")
+    from src.song_Gen import murka_test
+
+    work_root = tmp_path / "work"
+    work_root.mkdir()
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(youTfileCreateor, "download_audio", fake_download)
+    monkeypatch.setattr(jobs, "GEN_WORK_DIR", str(work_root))
+    monkeypatch.setattr(jobs, "GEN_OUTPUT_DIR", str(tmp_path / "songs"))
+
+    with MockMureka() as mureka:
+        monkeypatch.setattr(murka_test, "MUREKA_API_URL", mureka.url)
+
+        queue = GenerationQueue(MemoryJobStore(), workers=N_JOBS, executor=ThreadPoolExecutor(N_JOBS),
+                                poller=TaskPoller(murka_test.query_song_task, initial_interval=0.02))
+        job_ids = [queue.submit({"lyric_prompt": f"song {k}", "youTube_link": f"https://youtu.be/{k}"})
+                   for k in range(N_JOBS)]
+
+        deadline = time.time() + 30
+        while time.time() < deadline and queue.stats()["succeeded"] + queue.stats()["failed"] < N_JOBS:
+            time.sleep(0.05)
+        queue.shutdown()
+
+    results = [queue.get(job_id) for job_id in job_ids]
+    assert queue.stats()["clip_cache_misses"] == N_JOBS
+    assert [job["status"] for job in results] == ["succeeded"] * N_JOBS, results
+
+    # every job uploaded its own clip and got back the song made from it
+    assert len(mureka.uploads) == N_JOBS
+    song_paths = [job["result"]["song_path"] for job in results]
+    assert len(set(song_paths)) == N_JOBS
+    references = set()
+    for job_id, path in zip(job_ids, song_paths):
+        assert os.path.basename(path) == f"{job_id}.flac"
+        with open(path, "rb") as f:
+            content = f.read()
+        reference = content[len(FLAC_BYTES):len(FLAC_BYTES) + len("file-") + 12].decode()
+        assert reference in mureka.uploads and content == FLAC_BYTES + reference.encode() * 64
+        references.add(reference)
+    assert len(references) == N_JOBS
+
+    # nothing left in the cwd or the workspaces
+    assert sorted(os.listdir(tmp_path)) == ["clip_cache", "songs", "sources", "work"]
+    assert os.listdir(work_root) == []
+    assert not [name for name in os.listdir(tmp_path / "songs") if name.endswith(".part")]
@@ -0,0 +1,33 @@
+import numpy as np
+
+from sklearn.metrics.pairwise import cosine_similarity
+
+from src.genres import assign_genres
+
+
+def test_blocked_assignment_matches_dense_cosine_argmax():
+    rng = np.random.default_rng(0)
+    songs = rng.normal(size=(5000, 13))
+    genres = rng.normal(size=(300, 13))
+    songs[10] = 0  # zero vector, sklearn scores it 0 against every genre
+
+    expected = np.argmax(cosine_similarity(songs, genres), axis=1)
+    idx, scores = assign_genres(songs, genres, block_size=777)
+
+    np.testing.assert_array_equal(idx, expected)
+    assert scores.dtype == np.float32
+    assert scores[10] == 0
+
+
+def test_top_k_is_sorted_and_starts_with_best():
+    rng = np.random.default_rng(1)
+    songs = rng.normal(size=(1000, 13))
+    genres = rng.normal(size=(50, 13))
+
+    dense = cosine_similarity(songs, genres)
+    idx, scores = assign_genres(songs, genres, block_size=128, top_k=3)
+
+    assert idx.shape == scores.shape == (1000, 3)
+    np.testing.assert_array_equal(idx[:, 0], np.argmax(dense, axis=1))
+    assert np.all(np.diff(scores, axis=1) <= 0)
+    np.testing.assert_allclose(scores, np.take_along_axis(dense, idx, axis=1), atol=1e-5)
@@ -0,0 +1,92 @@
+import numpy as np
+
+from src.ingest import LiveIndex, prepare_tracks, ingested_version
+from src.model_store import build_bundle, load_bundle
+from src.rec_cache import RecommendationCache
+from src.vector_index import ExactEngine
+from test.conftest import make_catalog
+
+
+def _live_index(n=1000, dim=15, threshold=10_000):
+    features = np.random.default_rng(0).normal(size=(n, dim)).astype(np.float32)
+    return LiveIndex(ExactEngine.build(features), features, rebuild=ExactEngine.build, compact_threshold=threshold)
+
+
+def test_delta_is_searched_and_merged_with_main():
+    index = _live_index()
+    new = np.full((2, 15), 50, dtype=np.float32)
+
+    ids = index.add(new)
+    assert list(ids) == [1000, 1001]
+    assert index.get_n_items() == 1002
+    assert sorted(index.get_nns_by_vector(new[0], 2)) == [1000, 1001]
+
+    # main results still come back, and in distance order with the delta
+    idxs, dists = index.get_nns_by_vector(index.features()[5], 3, include_distances=True)
+    assert idxs[0] == 5
+    assert dists == sorted(dists)
+
+
+def test_compaction_folds_the_delta_into_main():
+    index = _live_index()
+    index.add(np.full((3, 15), 50, dtype=np.float32))
+    before = index.get_nns_by_vector(np.full(15, 50), 3)
+
+    index.compact()
+
+    assert index.delta_size() == 0
+    assert index.main.get_n_items() == 1003
+    assert sorted(index.get_nns_by_vector(np.full(15, 50), 3)) == sorted(before) == [1000, 1001, 1002]
+
+
+def test_background_compaction_starts_at_threshold():
+    index = _live_index(threshold=5)
+    index.add(np.ones((5, 15), dtype=np.float32))
+    index._compacting.join()
+
+    assert index.delta_size() == 0
+    assert index.get_n_items() == 1005
+
+
+def test_prepare_tracks_uses_fitted_models(catalog_csvs, tmp_path):
+    bundle = load_bundle(build_bundle(*catalog_csvs, out_dir=str(tmp_path / "artifacts")))
+    songs, _ = make_catalog(5, seed=3)
+    songs['artists'] = [["Someone", "Else"]] * 5
+
+    rows, vectors = prepare_tracks(songs, bundle.song_cluster_pipeline, bundle.genre_model)
+
+    assert list(rows['first_artist']) == ["Someone"] * 5
+    assert rows['artists'].iloc[0] == "['Someone', 'Else']"
+    assert set(rows['predicted_genre']) <= set(bundle.genre_model['genre_names'])
+    assert vectors.shape == (5, bundle.features.shape[1]) and vectors.dtype == np.float32
+
+
+def test_workers_with_different_ingests_dont_share_cached_lists():
+    redis_store = {}
+
+    class SharedRedis:
+        def get(self, key):
+            return redis_store.get(key)
+
+        def setex(self, key, ttl, value):
+            redis_store[key] = value
+
+    songs, _ = make_catalog(4, seed=5)
+    seeds = [{"name": "Shut Up and Dance", "year": 2014}]
+    workers = [RecommendationCache(redis_getter=SharedRedis) for _ in range(2)]
+    for worker in workers:
+        worker.invalidate("bundle")
+
+    # same catalog length on both, different tracks
+    workers[0].invalidate(ingested_version(workers[0].version, songs.iloc[:2]))
+    workers[1].invalidate(ingested_version(workers[1].version, songs.iloc[2:]))
+    assert workers[0].version != workers[1].version
+
+    workers[0].set(seeds, 10, [{"name": songs.loc[0, "name"]}])
+    assert workers[1].get(seeds, 10) is None
+
+    # the same ingests in the same order do share them, and further ingests chain on
+    same = ingested_version("bundle", songs.iloc[:2])
+    assert same == workers[0].version
+    assert ingested_version(same, songs.iloc[2:]) != ingested_version("bundle", songs.iloc[2:])
+    assert ingested_version(same, songs.iloc[2:]).startswith("bundle+")
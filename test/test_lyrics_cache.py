@@ -0,0 +1,95 @@
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from src.song_Gen.lyrics_cache import LyricsCache, normalize_prompt
+from test.mock_mureka import MockMureka
+
+
+@pytest.fixture
+def mureka(monkeypatch):
+    monkeypatch.setenv("MUREKA_API_KEY", "test-key")
+    from src.song_Gen import murka_test
+
+    with MockMureka(lyrics_delay=0.2) as server:
+        monkeypatch.setattr(murka_test, "MUREKA_API_URL", server.url)
+        monkeypatch.setattr(murka_test, "lyrics_cache", LyricsCache(redis_getter=lambda: None))
+        yield server, murka_test
+
+
+def test_prompt_normalization():
+    assert normalize_prompt("  Summer   LOVE!! ") == normalize_prompt("summer love") == "summer love"
+    assert normalize_prompt("ｓｕｍｍｅｒ love") == "summer love"
+    assert normalize_prompt("summer, love") != normalize_prompt("summer love")
+
+
+def test_identical_prompts_in_flight_share_one_upstream_call(mureka):
+    server, murka_test = mureka
+    prompts = ["Summer love", "summer love", "SUMMER  LOVE!", " summer love."] * 3
+
+    start = threading.Barrier(len(prompts))
+
+    def ask(prompt):
+        start.wait()
+        return murka_test.get_lyrics(prompt)
+
+    with ThreadPoolExecutor(len(prompts)) as pool:
+        results = list(pool.map(ask, prompts))
+
+    assert server.count("/v1/lyrics/generate") == 1
+    assert len(set(results)) == 1
+    stats = murka_test.lyrics_cache.stats()
+    assert stats["misses"] == 1 and stats["coalesced"] + stats["hits"] == len(prompts) - 1
+
+    # later callers are served from the cache
+    assert murka_test.get_lyrics("summer love") == results[0]
+    assert server.count("/v1/lyrics/generate") == 1
+
+
+def test_entries_expire_after_the_ttl(mureka, monkeypatch):
+    server, murka_test = mureka
+    now = [1000.0]
+    monkeypatch.setattr("src.song_Gen.lyrics_cache.time.time", lambda: now[0])
+    monkeypatch.setattr(murka_test, "lyrics_cache", LyricsCache(ttl=60, redis_getter=lambda: None))
+
+    first = murka_test.get_lyrics("rain")
+    now[0] += 30
+    assert murka_test.get_lyrics("rain") == first
+    now[0] += 31
+    assert murka_test.get_lyrics("rain") != first
+    assert server.count("/v1/lyrics/generate") == 2
+
+
+def test_failures_reach_every_waiter_and_are_not_cached(mureka):
+    server, murka_test = mureka
+
+    with ThreadPoolExecutor(4) as pool:
+        futures = [pool.submit(murka_test.get_lyrics, "fail") for _ in range(4)]
+    for future in futures:
+        with pytest.raises(murka_test.MurekaError) as error:
+            future.result()
+        assert error.value.status_code == 500
+
+    calls = server.count("/v1/lyrics/generate")
+    with pytest.raises(murka_test.MurekaError):
+        murka_test.get_lyrics("fail")
+    assert server.count("/v1/lyrics/generate") == calls + 1
+
+    # the legacy helper still reports the error as text
+    assert murka_test.generate_lyrics("fail").startswith("Error 500")
+
+
+def test_calls_reuse_one_pooled_connection(mureka, tmp_path):
+    server, murka_test = mureka
+    server.lyrics_delay = 0
+
+    for i in range(5):
+        murka_test.get_lyrics(f"prompt {i}")
+    lyrics, path = murka_test.generate_song("prompt 0", prompt="pop", poll_interval=0.01,
+                                            output_path=str(tmp_path / "song.flac"))
+
+    assert lyrics == "la la\nla"
+    assert server.count("/v1/lyrics/generate") == 5
+    assert len(server.clients) == 1
@@ -0,0 +1,95 @@
+import time
+import threading
+
+import pytest
+
+from src.database.postgres.managed_pool import ManagedPool, PoolTimeout
+
+
+class FakeConn:
+    def __init__(self, n):
+        self.n = n
+        self.closed = 0
+        self.commits = self.rollbacks = 0
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        self.rollbacks += 1
+
+
+class FakePsycopgPool:
+    """psycopg2 pools raise right away when exhausted, which is what ManagedPool smooths over"""
+
+    def __init__(self, maxconn):
+        self.free = [FakeConn(i) for i in range(maxconn)]
+        self.closed = []
+
+    def getconn(self):
+        if not self.free:
+            raise RuntimeError("connection pool exhausted")
+        return self.free.pop()
+
+    def putconn(self, conn, close=False):
+        if close:
+            self.closed.append(conn)
+            conn = FakeConn(conn.n)
+        self.free.append(conn)
+
+    def closeall(self):
+        pass
+
+
+def _pool(maxconn=2, timeout=0.1):
+    return ManagedPool(FakePsycopgPool(maxconn), maxconn=maxconn, timeout=timeout)
+
+
+def test_waits_for_a_free_connection_then_times_out():
+    pool = _pool(maxconn=1, timeout=0.5)
+    held = pool.getconn()
+    threading.Timer(0.1, pool.putconn, (held,)).start()
+
+    started = time.monotonic()
+    with pool.connection() as conn:
+        assert 0.05 < time.monotonic() - started < 0.5
+        with pytest.raises(PoolTimeout):
+            pool.getconn(timeout=0.05)
+
+    stats = pool.stats()
+    assert (stats["acquired"], stats["timeouts"], stats["in_use"], stats["waiting"]) == (2, 1, 0, 0)
+    assert sum(stats["acquire_ms"].values()) == 2 and stats["acquire_ms"]["le_1ms"] == 1
+
+
+def test_waiting_and_in_use_are_reported():
+    pool = _pool(maxconn=1, timeout=1)
+    conn = pool.getconn()
+    waiter = threading.Thread(target=lambda: pool.putconn(pool.getconn()))
+    waiter.start()
+    time.sleep(0.05)
+    assert (pool.stats()["in_use"], pool.stats()["waiting"]) == (1, 1)
+    pool.putconn(conn)
+    waiter.join()
+    assert (pool.stats()["in_use"], pool.stats()["waiting"]) == (0, 0)
+
+
+def test_transaction_commits_or_rolls_back_and_always_returns_the_connection():
+    pool = _pool()
+    with pool.transaction() as conn:
+        pass
+    assert conn.commits == 1
+
+    with pytest.raises(ValueError):
+        with pool.transaction() as failed:
+            commits = failed.commits
+            raise ValueError("boom")
+    assert (failed.commits - commits, failed.rollbacks) == (0, 1)
+    assert pool.stats()["in_use"] == 0 and len(pool.pool.free) == 2
+
+
+def test_broken_connections_are_discarded():
+    pool = _pool()
+    with pool.connection() as conn:
+        conn.closed = 2  # server went away
+    assert pool.pool.closed == [conn]
+    assert pool.stats()["discarded"] == 1
@@ -0,0 +1,133 @@
+import os
+import mmap
+import threading
+
+import numpy as np
+import pytest
+
+from src import model_store
+from src.model_store import build_bundle, load_bundle, load_or_build_bundle, current_version
+
+
+def test_bundle_roundtrip(catalog_csvs, tmp_path):
+    songs_csv, genres_csv = catalog_csvs
+    out_dir = str(tmp_path / "artifacts")
+
+    path = build_bundle(songs_csv, genres_csv, out_dir)
+    bundle = load_bundle(path)
+
+    assert current_version(out_dir) == bundle.version
+    assert {'first_artist', 'predicted_genre', 'cluster_label'} <= set(bundle.data.columns)
+    assert bundle.annoy_index.get_n_items() == len(bundle.data)
+    assert bundle.features.shape == (len(bundle.data), bundle.manifest["dim"])
+    assert bundle.data.loc[0, 'name'] == "Shut Up and Dance"
+    assert bundle.data.loc[0, 'year'] == 2014
+
+    # annoy ids are row positions of the catalog
+    nearest = bundle.annoy_index.get_nns_by_vector(np.asarray(bundle.features[3]), 1)
+    assert nearest == [3]
+
+    # the serving store holds the same rows, and is all the api loads
+    assert len(bundle.store) == len(bundle.data)
+    assert bundle.store.records([0])[0].name == "Shut Up and Dance"
+    assert load_bundle(path, frame=False).data is None
+
+    # the artist index comes built with the bundle
+    assert bundle.artists.names[bundle.artists.row_artist[0]] == bundle.data.loc[0, 'first_artist']
+    assert 0 in bundle.artists.positions(bundle.data.loc[0, 'first_artist'])
+
+    # queries are scaled from the saved arrays, the pipeline itself is only unpickled on demand
+    assert bundle._pipeline is None
+    pipeline = bundle.song_cluster_pipeline
+    X = bundle.data[bundle.manifest["params"]["number_cols"]]
+    np.testing.assert_allclose(bundle.scaler.transform(X), pipeline.named_steps['scaler'].transform(X))
+    np.testing.assert_array_equal(bundle.cluster_centers, pipeline.named_steps['kmeans'].cluster_centers_)
+
+
+def test_load_or_build_only_rebuilds_when_stale(catalog_csvs, tmp_path):
+    songs_csv, genres_csv = catalog_csvs
+    out_dir = str(tmp_path / "artifacts")
+
+    first = load_or_build_bundle(songs_csv, genres_csv, out_dir)
+    built_at = os.path.getmtime(os.path.join(first.path, "manifest.json"))
+
+    again = load_or_build_bundle(songs_csv, genres_csv, out_dir)
+    assert again.version == first.version
+    assert os.path.getmtime(os.path.join(again.path, "manifest.json")) == built_at
+
+    with open(songs_csv, "a") as f:
+        f.write(f"0.5,2001,0.5,\"['New Artist']\",0.5,200000,0.5,0,newid,0.1,5,0.1,-5.0,1,New Song,50,2001-01-01,0.05,120.0\n")
+
+    rebuilt = load_or_build_bundle(songs_csv, genres_csv, out_dir)
+    assert rebuilt.version != first.version
+    assert len(rebuilt.data) == len(first.data) + 1
+
+
+def _is_mapped(values) -> bool:
+    while values is not None:
+        if isinstance(values, (np.memmap, mmap.mmap)):
+            return True
+        values = getattr(values, "base", None)
+    return False
+
+
+def test_shared_load_maps_numeric_columns(catalog_csvs, tmp_path):
+    songs_csv, genres_csv = catalog_csvs
+    path = build_bundle(songs_csv, genres_csv, str(tmp_path / "artifacts"))
+
+    shared = load_bundle(path, shared=True)
+    private = load_bundle(path, shared=False)
+
+    for col in ('year', 'valence', 'cluster_label'):
+        assert _is_mapped(shared.data[col].to_numpy())
+        assert not _is_mapped(private.data[col].to_numpy())
+    assert shared.data.equals(private.data)
+
+
+def test_workers_starting_together_build_once(catalog_csvs, tmp_path, monkeypatch):
+    songs_csv, genres_csv = catalog_csvs
+    out_dir = str(tmp_path / "artifacts")
+    builds = []
+
+    def counted_build(*args, **kwargs):
+        builds.append(threading.get_ident())
+        return build_bundle(*args, **kwargs)
+
+    monkeypatch.setattr(model_store, "build_bundle", counted_build)
+    versions = []
+    workers = [threading.Thread(target=lambda: versions.append(load_or_build_bundle(songs_csv, genres_csv, out_dir).version))
+               for _ in range(3)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    assert len(builds) == 1
+    assert len(versions) == 3 and len(set(versions)) == 1
+
+
+def test_forced_build_swaps_the_bundle_in(catalog_csvs, tmp_path, monkeypatch):
+    songs_csv, genres_csv = catalog_csvs
+    out_dir = str(tmp_path / "artifacts")
+    args = ["build", "--songs", songs_csv, "--genres", genres_csv, "--out", out_dir, "--source", "csv"]
+    assert model_store.main(args) == 0
+    path = os.path.join(out_dir, current_version(out_dir))
+    serving = load_bundle(path, shared=True)
+    built_at = serving.manifest["built_at"]
+
+    # a failing forced build leaves the live bundle alone
+    def broken(*args, **kwargs):
+        raise RuntimeError("build failed")
+
+    with monkeypatch.context() as m:
+        m.setattr(model_store.CatalogStore, "from_frame", broken)
+        with pytest.raises(RuntimeError):
+            model_store.main(args + ["--force"])
+    assert load_bundle(path).manifest["built_at"] == built_at
+
+    assert model_store.main(args + ["--force"]) == 0
+    assert os.path.exists(os.path.join(path, "manifest.json"))
+    assert not [name for name in os.listdir(out_dir) if ".old-" in name]
+    # a worker still serving the replaced bundle reads its mapped files
+    assert serving.store.records([0])[0].name == "Shut Up and Dance"
+    assert float(np.asarray(serving.features[0]).sum()) == float(np.asarray(load_bundle(path).features[0]).sum())
@@ -0,0 +1,29 @@
+import numpy as np
+
+from src.partitions import GenrePartitions
+
+
+def test_nearest_only_returns_requested_genres_in_distance_order():
+    rng = np.random.default_rng(0)
+    features = rng.normal(size=(2000, 15)).astype(np.float32)
+    genres = np.array([f"genre {i % 30}" for i in range(2000)], dtype=object)
+    partitions = GenrePartitions(genres, features)
+    query = rng.normal(size=15)
+
+    wanted = ["genre 3", "genre 17"]
+    exclude = np.zeros(2000, dtype=bool)
+    exclude[3] = True  # genre 3's first song is a seed
+
+    idxs = partitions.nearest(query, wanted, 10, exclude=exclude)
+
+    candidates = np.flatnonzero(np.isin(genres, wanted) & ~exclude)
+    dist = ((features[candidates] - query) ** 2).sum(axis=1)
+    np.testing.assert_array_equal(idxs, candidates[np.argsort(dist)][:10])
+
+
+def test_nearest_returns_everything_for_small_genres():
+    features = np.eye(4, dtype=np.float32)
+    partitions = GenrePartitions(["a", "b", "a", np.nan], features)
+
+    assert list(partitions.nearest(np.zeros(4), ["a"], 10)) == [0, 2]
+    assert len(partitions.nearest(np.zeros(4), ["missing"], 10)) == 0
@@ -0,0 +1,147 @@
+"""
+runs against a throwaway postgres cluster initialised from fixtures/init.sql. skipped when the
+postgres server binaries (initdb, pg_ctl, psql) are not installed, or when running as root
+"""
+import os
+import glob
+import time
+import shutil
+import socket
+import asyncio
+import subprocess
+
+import pytest
+
+from src.database.postgres import index
+from src.database.postgres.managed_pool import PoolTimeout
+from src.database.postgres.write_behind import WriteBehindWriter, ARTISTS
+
+INIT_SQL = os.path.join(os.path.dirname(__file__), "..", "fixtures", "init.sql", "inti.sql")
+
+
+def _pg_bin(name):
+    found = shutil.which(name)
+    if found:
+        return found
+    candidates = sorted(glob.glob(f"/usr/lib/postgresql/*/bin/{name}") + glob.glob(f"/usr/local/pgsql/bin/{name}"))
+    return candidates[-1] if candidates else None
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@pytest.fixture(scope="module")
+def postgres(tmp_path_factory):
+    binaries = {name: _pg_bin(name) for name in ("initdb", "pg_ctl", "psql")}
+    if not all(binaries.values()):
+        pytest.skip("postgres server binaries are not installed")
+    if hasattr(os, "geteuid") and os.geteuid() == 0:
+        pytest.skip("initdb refuses to run as root")
+
+    data_dir = tmp_path_factory.mktemp("pgdata")
+    port = _free_port()
+    subprocess.run([binaries["initdb"], "-D", str(data_dir), "-U", "postgres", "--auth=trust"],
+                   check=True, capture_output=True)
+    subprocess.run([binaries["pg_ctl"], "-D", str(data_dir), "-w", "-l", str(data_dir / "log"),
+                    "-o", f"-p {port} -k {data_dir} -c listen_addresses=127.0.0.1", "start"],
+                   check=True, capture_output=True)
+    try:
+        subprocess.run([binaries["psql"], "-h", "127.0.0.1", "-p", str(port), "-U", "postgres", "-d", "postgres",
+                        "-v", "ON_ERROR_STOP=1", "-f", INIT_SQL], check=True, capture_output=True)
+        yield {"host": "127.0.0.1", "port": port, "user": "postgres", "password": "", "database": "music_db"}
+    finally:
+        subprocess.run([binaries["pg_ctl"], "-D", str(data_dir), "-m", "immediate", "stop"], capture_output=True)
+
+
+@pytest.fixture
+def db(postgres):
+    index.init_db_pools(minconn=1, maxconn=3, timeout=0.5, **postgres)
+    with index.transaction() as conn, conn.cursor() as cur:
+        cur.execute("TRUNCATE music.artists, music.songs, music.song_features")
+    yield index
+    index.close_db_pools()
+
+
+def _artist(i, name=None):
+    return {"id": f"a{i}", "name": name or f"Artist {i}", "genres": ["pop", 'r"b'], "popularity": 50 + i,
+            "images": [{"url": f"http://img/{i}"}], "external_urls": {"spotify": f"http://sp/{i}"}}
+
+
+def test_insert_top_artists_uses_the_prepared_statement(db):
+    assert db.insert_top_artists("u1", [_artist(i) for i in range(5)]) == 5
+    assert db.insert_top_artists("u1", [_artist(0, name="Renamed")]) == 1  # DO NOTHING on conflict
+
+    rows = sorted(db.fetch_user_artists("u1"))
+    assert len(rows) == 5 and rows[0][1] == "Artist 0" and rows[0][2] == ["pop", 'r"b']
+
+    # the same artist for another user is its own row
+    db.insert_top_artists("u2", [_artist(0)])
+    assert len(db.fetch_user_artists("u2")) == 1
+
+    with db.connection() as conn, conn.cursor() as cur:
+        cur.execute("SELECT count(*) FROM pg_prepared_statements")
+        assert cur.fetchone()[0] >= 1
+
+
+def test_transaction_rolls_back_on_error(db):
+    with pytest.raises(ValueError):
+        with db.transaction() as conn, conn.cursor() as cur:
+            cur.execute("INSERT INTO music.artists (artist_id, user_id, name) VALUES ('x', 'u1', 'X')")
+            raise ValueError("boom")
+    assert db.fetch_user_artists("u1") == []
+    assert db.pool_stats()["in_use"] == 0
+
+
+def test_acquisition_times_out_when_the_pool_is_exhausted(db):
+    held = [db.get_db_conn() for _ in range(3)]
+    started = time.monotonic()
+    with pytest.raises(PoolTimeout):
+        db.get_db_conn()
+    assert time.monotonic() - started >= 0.45
+    for conn in held:
+        db.release_db_conn(conn)
+
+    stats = db.pool_stats()
+    assert stats["timeouts"] == 1 and stats["in_use"] == 0 and stats["max"] == 3
+
+
+def test_run_transaction_from_the_event_loop(db):
+    async def main():
+        return await asyncio.gather(*[db.run_transaction(lambda conn, i: db.insert_top_artists(f"u{i}", [_artist(i)], conn), i)
+                                      for i in range(6)])
+
+    assert asyncio.run(main()) == [1] * 6
+    assert sum(len(db.fetch_user_artists(f"u{i}")) for i in range(6)) == 6
+
+
+def test_write_behind_copy_upsert(db):
+    writer = WriteBehindWriter(ARTISTS, batch_rows=100, flush_interval=0.05)
+    from src.database.postgres.write_behind import artist_row
+
+    writer.submit([artist_row("u1", _artist(i)) for i in range(250)])
+    writer.submit([artist_row("u1", _artist(0, name="Tab\tand\\slash"))])
+    assert writer.flush(timeout=10)
+
+    rows = dict((artist_id, name) for artist_id, name, _, _ in db.fetch_user_artists("u1"))
+    assert len(rows) == 250 and rows["a0"] == "Tab\tand\\slash"
+    assert writer.stats()["failed"] == 0
+    writer.close()
+
+
+def test_catalog_import_and_snapshot(db, tmp_path, catalog_csvs):
+    from src.catalog import import_csv, load_postgres_catalog
+
+    songs_csv, _ = catalog_csvs
+    assert import_csv(songs_csv, chunk_rows=200) == 500
+    data, fingerprint = load_postgres_catalog(str(tmp_path / "snapshots"), chunk_rows=128)
+    assert len(data) == 500 and data["first_artist"].notna().all()
+
+    again, same = load_postgres_catalog(str(tmp_path / "snapshots"))
+    assert same == fingerprint and len(again) == 500
+
+    # an upsert touches updated_at, so the snapshot goes stale
+    import_csv(songs_csv, chunk_rows=500)
+    assert load_postgres_catalog(str(tmp_path / "snapshots"))[1] != fingerprint
@@ -0,0 +1,32 @@
+from src.profiling import by_package, import_times, parse_importtime, phase, startup_phases
+
+IMPORTTIME = """import time: self [us] | cumulative | imported package
+import time:       120 |        120 |   numpy._core
+import time:       300 |        420 | numpy
+import time:        50 |        470 | src.app
+"""
+
+
+def test_phase_records_the_last_run():
+    with phase("test phase"):
+        pass
+    with phase("test phase"):
+        sum(range(10_000))
+    assert startup_phases()["test phase"] >= 0
+
+
+def test_parse_importtime():
+    modules = parse_importtime(IMPORTTIME)
+    assert [m["module"] for m in modules] == ["numpy._core", "numpy", "src.app"]
+    assert modules[0]["depth"] == 1 and modules[1]["cumulative_us"] == 420
+    assert by_package(modules) == {"numpy": 420, "src": 50}
+
+
+def test_heavy_libraries_are_not_imported_at_startup():
+    recommend = {m["module"] for m in import_times("src.app")}
+    assert not {name.split(".")[0] for name in recommend} & {"sklearn", "soundfile", "yt_dlp", "joblib"}
+    # the mureka client loads with the first generation job
+    assert "src.song_Gen.murka_test" not in recommend
+
+    generate = {m["module"].split(".")[0] for m in import_times("src.gen_app")}
+    assert not generate & {"pandas", "sklearn", "annoy", "psycopg2"}
@@ -0,0 +1,79 @@
+from src.rec_cache import RecommendationCache, cache_key
+
+
+class FakeRedis:
+    def __init__(self):
+        self.store = {}
+
+    def get(self, key):
+        return self.store.get(key)
+
+    def setex(self, key, ttl, value):
+        self.store[key] = value
+
+
+SEEDS = [{'name': "Shut Up and Dance", 'year': 2014}, {'name': "Hello", 'year': 2015}]
+RECS = [{'name': "Song 1", 'year': 2001, 'artists': "['A']", 'predicted_genre': "pop"}]
+
+
+def test_key_is_canonical_over_seed_order_and_case():
+    reordered = [{'name': "hello", 'year': 2015}, {'name': "Shut Up and Dance", 'year': 2014}]
+    assert cache_key(SEEDS, 10, "v1") == cache_key(reordered, 10, "v1")
+    assert cache_key(SEEDS, 10, "v1") != cache_key(SEEDS, 5, "v1")
+    assert cache_key(SEEDS, 10, "v1") != cache_key(SEEDS, 10, "v2")
+
+
+def test_lru_eviction_and_counters():
+    cache = RecommendationCache(max_entries=1, use_redis=False)
+    assert cache.get(SEEDS, 10) is None
+    cache.set(SEEDS, 10, RECS)
+    assert cache.get(SEEDS, 10) == RECS
+
+    cache.set(SEEDS, 5, RECS)
+    assert cache.get(SEEDS, 10) is None
+
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["evictions"], stats["size"]) == (1, 2, 1, 1)
+
+
+def test_ttl_and_invalidation():
+    cache = RecommendationCache(ttl=-1, use_redis=False)
+    cache.set(SEEDS, 10, RECS)
+    assert cache.get(SEEDS, 10) is None
+    assert cache.stats()["expired"] == 1
+
+    cache = RecommendationCache(use_redis=False)
+    cache.invalidate("v1")
+    cache.set(SEEDS, 10, RECS)
+    cache.invalidate("v2")
+    assert cache.get(SEEDS, 10) is None
+
+
+def test_redis_tier_is_shared_between_processes():
+    redis_con = FakeRedis()
+    writer = RecommendationCache(redis_getter=lambda: redis_con)
+    reader = RecommendationCache(redis_getter=lambda: redis_con)
+
+    writer.set(SEEDS, 10, RECS)
+    assert reader.get(SEEDS, 10) == RECS
+    assert reader.stats()["redis_hits"] == 1
+    # promoted into the local tier
+    assert reader.stats()["size"] == 1
+
+
+def test_a_result_computed_across_an_invalidate_is_not_stored():
+    redis_con = FakeRedis()
+    cache = RecommendationCache(redis_getter=lambda: redis_con)
+    cache.invalidate("v1")
+
+    def compute_while_reloading():
+        cache.invalidate("v2")  # an ingest or reload lands while this list is computed
+        return RECS
+
+    assert cache.get_or_compute(SEEDS, 10, compute_while_reloading) == RECS
+    assert cache.get(SEEDS, 10) is None and redis_con.store == {}
+    assert cache.stats()["stale_writes"] == 1
+
+    # a set for the version it was computed on still lands
+    cache.set(SEEDS, 10, RECS, version="v2")
+    assert cache.get(SEEDS, 10) == RECS
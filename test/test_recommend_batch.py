@@ -0,0 +1,69 @@
+import pytest
+
+
+@pytest.fixture
+def app(served_app):
+    served_app.recommendation_cache.invalidate()
+    return served_app
+
+
+def _song(songs, i):
+    return {"name": songs.loc[i, 'name'], "year": int(songs.loc[i, 'year'])}
+
+
+def test_batch_matches_single_requests_and_answers_every_index_once(app):
+    songs = app.songs
+    song_lists = [[_song(songs, 0)], [_song(songs, i) for i in range(10, 20)], [], [_song(songs, 5), _song(songs, 6)]]
+    artists = [[], [], ["Artist 40"], ["Artist 3"]]
+    n_songs = [5, 8, 4, 6]
+
+    results = list(app.recommend_songs_batch(song_lists, app.data, n_songs, artists=artists))
+    assert sorted(i for i, _ in results) == [0, 1, 2, 3]
+
+    for i, recommendations in results:
+        assert not isinstance(recommendations, Exception), recommendations
+        app.recommendation_cache.invalidate()  # recompute, not the entry the batch just cached
+        assert recommendations == app.recommend_songs(song_lists[i], app.data, n_songs[i], artists[i])
+        assert len(recommendations) == n_songs[i]
+
+
+def test_missing_seeds_come_back_as_error_entries(app):
+    songs = app.songs
+    song_lists = [[{"name": "This Song Does Not Exist", "year": 1900}], [_song(songs, 0)], []]
+    results = dict(app.recommend_songs_batch(song_lists, app.data, 5, artists=[[], [], ["Nobody At All"]]))
+
+    assert isinstance(results[0], ValueError) and "None of the input songs" in str(results[0])
+    assert len(results[1]) == 5
+    assert isinstance(results[2], ValueError) and "or artists" in str(results[2])
+
+
+def test_cached_lists_skip_the_pipeline(app, monkeypatch):
+    songs = app.songs
+    song_lists = [[_song(songs, 0)], [_song(songs, 7)]]
+    first = dict(app.recommend_songs_batch(song_lists, app.data, 5))
+    hits = app.recommendation_cache.stats()["hits"]
+
+    def no_search(*args, **kwargs):
+        raise AssertionError("a cached list went through the search")
+
+    monkeypatch.setattr(app, "_recommend_from_vector", no_search)
+    again = list(app.recommend_songs_batch(song_lists, app.data, 5))
+
+    assert dict(again) == first and len(again) == 2
+    assert app.recommendation_cache.stats()["hits"] == hits + 2
+
+    # a different n_songs is a different key, it goes through the (now failing) pipeline
+    assert isinstance(dict(app.recommend_songs_batch(song_lists[:1], app.data, 6))[0], AssertionError)
+
+
+def test_repeated_seeds_count_once(app):
+    songs = app.songs
+    a, b = _song(songs, 0), _song(songs, 9)
+    shouty = {"name": a["name"].upper(), "year": a["year"]}
+
+    once = app._recommend_songs([a, b], app.data, 10)
+    assert app.recommend_songs([a, a, shouty, b], app.data, 10, artists=["Artist 3", "artist 3"]) == \
+        app._recommend_songs([a, b], app.data, 10, ["Artist 3"])
+    app.recommendation_cache.invalidate()
+    assert app.recommend_songs([a, a, b], app.data, 10) == once
+    assert dict(app.recommend_songs_batch([[a, b, b, a], [a, b]], app.data, 10)) == {0: once, 1: once}
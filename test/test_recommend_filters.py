@@ -0,0 +1,83 @@
+import numpy as np
+import pytest
+
+from fastapi.testclient import TestClient
+
+from src.filters import FILTER_EXACT_SELECTIVITY
+
+SEED = [{"name": "Shut Up and Dance", "year": 2014}]
+
+
+@pytest.fixture
+def app(served_app, monkeypatch):
+    served_app.recommendation_cache.invalidate()
+    monkeypatch.setattr(served_app, "SEARCH_MODE", "adaptive")
+    return served_app
+
+
+@pytest.fixture
+def branches(app, monkeypatch):
+    """counts which search each request took: rows_of is only used by the exact one, contains by the ann one"""
+    taken = {"exact": 0, "ann": 0}
+
+    def counted(name, fn):
+        def wrapper(*args, **kwargs):
+            taken[name] += 1
+            return fn(*args, **kwargs)
+        return wrapper
+
+    monkeypatch.setattr(app, "rows_of", counted("exact", app.rows_of))
+    monkeypatch.setattr(app, "contains", counted("ann", app.contains))
+    return taken
+
+
+def _genre_of(app, row):
+    return app.data.values('predicted_genre', np.array([row]))[0]
+
+
+def test_rare_genre_is_searched_exactly(app, branches):
+    filters = app.catalog_filters
+    rare = min((g for g, rows in filters.genres.rows.items() if len(rows) >= 3), key=lambda g: len(filters.genres.rows[g]))
+    bits = app._filter_bits(filters, [], {"genres": [rare]})
+    assert 0 < filters.selectivity(bits) <= FILTER_EXACT_SELECTIVITY
+
+    recs = app.recommend_songs(SEED, app.data, 3, constraints={"genres": [rare]})
+    assert branches == {"exact": 1, "ann": 0}
+    assert recs and all(r['predicted_genre'] == rare for r in recs)
+
+
+def test_loose_filter_filters_the_ann_candidates(app, branches):
+    seed_genre = _genre_of(app, 0)
+    bits = app._filter_bits(app.catalog_filters, [seed_genre], {"discovery": True})
+    assert app.catalog_filters.selectivity(bits) > FILTER_EXACT_SELECTIVITY
+
+    recs = app.recommend_songs(SEED, app.data, 5, constraints={"discovery": True})
+    assert branches["ann"] >= 1 and branches["exact"] == 0
+    assert len(recs) == 5 and all(r['predicted_genre'] != seed_genre for r in recs)
+
+
+def test_year_range_with_no_songs_returns_nothing(app):
+    assert app.recommend_songs(SEED, app.data, 5, constraints={"year_min": 2030, "year_max": 2040}) == []
+    assert app.recommend_songs(SEED, app.data, 5, constraints={"year_min": 2000, "year_max": 1990}) == []
+
+
+def test_unknown_mood_is_a_bad_request(app):
+    client = TestClient(app.app)
+    response = client.post("/recommend", json={"songs": SEED, "mood": "grumpy"})
+    assert response.status_code == 400
+    assert "Unknown mood" in response.json()["detail"]
+
+    assert client.post("/recommend", json={"songs": SEED, "mood": "happy", "n_songs": 3}).status_code == 200
+
+
+def test_constraints_are_part_of_the_cache_key(app):
+    cache = app.recommendation_cache
+    hits = cache.stats()["hits"]
+    plain = app.recommend_songs(SEED, app.data, 5)
+    recent = app.recommend_songs(SEED, app.data, 5, constraints={"year_min": 2015})
+    assert cache.stats()["hits"] == hits
+    assert all(r['year'] >= 2015 for r in recent) and recent != plain
+
+    assert app.recommend_songs(SEED, app.data, 5, constraints={"year_min": 2015}) == recent
+    assert app.recommend_songs(SEED, app.data, 5) == plain
+    assert cache.stats()["hits"] == hits + 2
@@ -1,3 +1,5 @@
+import json
+
 import pytest
 from fastapi.testclient import TestClient
 from src.app import app
@@ -49,6 +51,20 @@ def test_invalid_request_structure():
     assert response.status_code == 422 
 
 
+def test_recommend_batch_streams_ndjson():
+    response = client.post("/recommend/batch", json={"requests": [
+        {"songs": [{"name": "Shut Up and Dance", "year": 2014}], "n_songs": 5},
+        {"songs": [{"name": "This Song Does Not Exist", "year": 1900}], "n_songs": 5},
+    ]})
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    lines = {line["index"]: line for line in map(json.loads, response.text.splitlines())}
+    assert set(lines) == {0, 1}
+    assert len(lines[0]["recommendations"]) <= 5
+    assert "None of the input songs" in lines[1]["error"]
+
+
 def test_health_check():
     response = client.get("/health")
     assert response.status_code == 200
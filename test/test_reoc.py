@@ -0,0 +1,27 @@
+import numpy as np
+
+from src.reoc import SongLookup, get_mean_vector, get_song_data
+from test.conftest import make_catalog
+
+
+def test_lookup_matches_full_scan():
+    songs, _ = make_catalog()
+    lookup = SongLookup(songs)
+    song_list = [{'name': songs['name'].iat[i], 'year': int(songs['year'].iat[i])} for i in (0, 7, 42, 499)]
+    song_list.append({'name': "This Song Does Not Exist", 'year': 1900})
+
+    np.testing.assert_allclose(
+        get_mean_vector(song_list, songs, lookup),
+        get_mean_vector(song_list, songs).astype(np.float64),
+    )
+    assert get_song_data(song_list[-1], songs, lookup) is None
+
+
+def test_lookup_is_case_and_whitespace_insensitive():
+    songs, _ = make_catalog()
+    lookup = SongLookup(songs)
+
+    assert lookup.get("Shut Up and Dance", 2014) == 0
+    assert lookup.get("  shut up   AND dance ", 2014) == 0
+    assert lookup.get("shut up and dance", 2015) is None
+    assert list(lookup.positions([{'name': "SONG 3", 'year': songs['year'].iat[3]}])) == [3]
@@ -0,0 +1,73 @@
+import time
+
+import pytest
+
+from src.database.redis.sessions import SessionStore
+from test.fake_redis import FakeRedis
+
+
+def _store(redis_con, **params):
+    return SessionStore(redis_getter=lambda: redis_con, **params)
+
+
+def test_session_is_one_hash_written_in_one_round_trip_with_a_ttl():
+    redis_con = FakeRedis()
+    sessions = _store(redis_con, refresh_grace=100)
+
+    session = sessions.save("u1", {"access_token": "a", "refresh_token": "r", "expires_in": 3600})
+
+    assert redis_con.round_trips == 1
+    assert session["access_token"] == "a" and session["refresh_token"] == "r"
+    assert set(redis_con.store) == {"spotify:session:u1"}
+    assert 3600 < redis_con._ttl("spotify:session:u1") <= 3700
+
+
+def test_refresh_without_a_new_refresh_token_keeps_the_old_one():
+    redis_con = FakeRedis()
+    sessions = _store(redis_con)
+    sessions.save("u1", {"access_token": "a", "refresh_token": "r", "expires_in": 3600})
+    session = sessions.save("u1", {"access_token": "b", "expires_in": 3600})
+    assert (session["access_token"], session["refresh_token"]) == ("b", "r")
+
+
+def test_reads_are_one_round_trip_and_hot_users_come_from_the_cache():
+    redis_con = FakeRedis()
+    writer, reader = _store(redis_con), _store(redis_con, cache_ttl=0.2)
+    writer.save("u1", {"access_token": "a", "refresh_token": "r", "expires_in": 3600})
+    redis_con.round_trips = 0
+
+    assert reader.get("u1")["access_token"] == "a"
+    assert redis_con.round_trips == 1
+    for _ in range(10):
+        reader.get("u1")
+    assert redis_con.round_trips == 1
+
+    # another process refreshed the token, this one sees it once the cache entry runs out
+    writer.save("u1", {"access_token": "b", "expires_in": 3600})
+    assert reader.get("u1")["access_token"] == "a"
+    time.sleep(0.25)
+    assert reader.get("u1")["access_token"] == "b"
+    assert reader.stats()["cache_hits"] == 11
+
+
+def test_unknown_users_are_not_cached():
+    redis_con = FakeRedis()
+    reader = _store(redis_con)
+    assert reader.get("u1") is None
+    _store(redis_con).save("u1", {"access_token": "a", "refresh_token": "r", "expires_in": 3600})
+    assert reader.get("u1")["access_token"] == "a"
+
+
+def test_legacy_keys_are_migrated_into_the_hash():
+    redis_con = FakeRedis(**{"spotify:u1:access_token": "a", "spotify:u1:refresh_token": "r",
+                             "spotify:u1:expires_at": "123"})
+    sessions = _store(redis_con, refresh_grace=50)
+
+    assert sessions.get("u1") == {"access_token": "a", "refresh_token": "r", "expires_at": "123"}
+    assert set(redis_con.store) == {"spotify:session:u1"}
+    assert 0 < redis_con._ttl("spotify:session:u1") <= 50
+
+
+def test_missing_pool_is_reported():
+    with pytest.raises(RuntimeError, match="init_redis_pool"):
+        _store(None).get("u1")
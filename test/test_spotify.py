@@ -0,0 +1,140 @@
+import time
+import asyncio
+import threading
+
+import httpx
+import pytest
+
+from email.utils import formatdate
+
+from src.spotify import SpotifyClient, SpotifyAuthError, SpotifyError, retry_after_seconds
+from test.fake_redis import FakeRedis
+
+
+def _client(handler, redis_con, **kwargs):
+    return SpotifyClient("id", "secret", "http://localhost/callback", redis_getter=lambda: redis_con,
+                         transport=httpx.MockTransport(handler), token_url="https://accounts.test/api/token",
+                         api_url="https://api.test/v1", **kwargs)
+
+
+def _run(client, call):
+    async def run():
+        try:
+            return await call(client)
+        finally:
+            await client.close()
+    return asyncio.run(run())
+
+
+def test_expired_token_is_refreshed_once_for_concurrent_requests():
+    redis_con = FakeRedis(**{"spotify:session:u1": {
+        "access_token": "old",
+        "refresh_token": "refresh-me",
+        "expires_at": str(int(time.time()) - 5),
+    }})
+    refreshes = []
+
+    async def handler(request):
+        if request.url.host == "accounts.test":
+            refreshes.append(request.content)
+            await asyncio.sleep(0.01)
+            return httpx.Response(200, json={"access_token": "new", "expires_in": 3600})
+        assert request.headers["Authorization"] == "Bearer new"
+        return httpx.Response(200, json={"items": [{"id": "a1"}]})
+
+    async def run():
+        client = _client(handler, redis_con)
+        results = await asyncio.gather(*(client.get_top_artists("u1") for _ in range(5)))
+        await client.close()
+        return results
+
+    results = asyncio.run(run())
+    assert all(result["items"][0]["id"] == "a1" for result in results)
+    assert len(refreshes) == 1
+    session = redis_con.hgetall("spotify:session:u1")
+    assert (session["access_token"], session["refresh_token"]) == ("new", "refresh-me")
+    assert redis_con.ttl("spotify:session:u1") > 3600
+
+
+def test_429_is_retried_after_retry_after():
+    calls = []
+
+    def handler(request):
+        calls.append(request.url.path)
+        if len(calls) == 1:
+            return httpx.Response(429, headers={"Retry-After": "0"})
+        return httpx.Response(200, json={"id": "me"})
+
+    async def run():
+        client = _client(handler, FakeRedis())
+        me = await client.get_me("token")
+        await client.close()
+        return me
+
+    assert asyncio.run(run()) == {"id": "me"}
+    assert len(calls) == 2
+
+
+def test_missing_session_raises_auth_error():
+    async def run():
+        client = _client(lambda request: httpx.Response(500), FakeRedis())
+        try:
+            await client.get_top_artists("nobody")
+        finally:
+            await client.close()
+
+    try:
+        asyncio.run(run())
+        assert False, "expected SpotifyAuthError"
+    except SpotifyAuthError as e:
+        assert e.status_code == 401
+
+
+def test_retry_after_seconds_or_http_date():
+    assert retry_after_seconds("3") == 3.0
+    assert 25 < retry_after_seconds(formatdate(time.time() + 30, usegmt=True)) <= 30
+    assert retry_after_seconds(formatdate(time.time() - 30, usegmt=True)) == 0.0
+    assert retry_after_seconds("soon") is None and retry_after_seconds("") is None
+
+
+def test_long_retry_after_fails_fast_with_429():
+    calls = []
+
+    def handler(request):
+        calls.append(request.url.path)
+        return httpx.Response(429, headers={"Retry-After": formatdate(time.time() + 3600, usegmt=True)})
+
+    started = time.time()
+    with pytest.raises(SpotifyError) as error:
+        _run(_client(handler, FakeRedis(), max_retry_after=5), lambda client: client.get_me("token"))
+    assert error.value.status_code == 429 and len(calls) == 1
+    assert time.time() - started < 1
+
+
+def test_transport_errors_become_spotify_errors():
+    def handler(request):
+        raise httpx.ConnectError("connection refused", request=request)
+
+    with pytest.raises(SpotifyError) as error:
+        _run(_client(handler, FakeRedis(), max_retries=0), lambda client: client.get_me("token"))
+    assert error.value.status_code == 502
+
+
+def test_session_reads_run_off_the_event_loop():
+    redis_con = FakeRedis(**{"spotify:session:u1": {
+        "access_token": "fresh", "refresh_token": "r", "expires_at": str(int(time.time()) + 3600)}})
+    readers = []
+    hgetall = redis_con.hgetall
+
+    def recording_hgetall(key):
+        readers.append(threading.get_ident())
+        return hgetall(key)
+
+    redis_con.hgetall = recording_hgetall
+
+    async def token(client):
+        return await client.get_access_token("u1"), threading.get_ident()
+
+    access_token, loop_thread = _run(_client(lambda request: httpx.Response(500), redis_con), token)
+    assert access_token == "fresh"
+    assert readers and loop_thread not in readers
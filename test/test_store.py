@@ -0,0 +1,68 @@
+import numpy as np
+import pandas as pd
+
+from src.store import CatalogStore, StringTable
+from src.utils import number_cols
+from test.conftest import make_catalog
+
+
+def make_songs(n_songs=200):
+    songs, _ = make_catalog(n_songs=n_songs)
+    songs['first_artist'] = [f"Artist {i % 60}" for i in range(n_songs)]
+    songs['predicted_genre'] = [f"genre {i % 7}" for i in range(n_songs)]
+    songs['cluster_label'] = np.arange(n_songs) % 20
+    songs.loc[1, 'name'] = "Café del Mar ☕"
+    songs.loc[2, ['artists', 'first_artist']] = None
+    return songs
+
+
+def test_string_table():
+    table = StringTable.from_strings(["a", None, "Café ☕", ""])
+    assert len(table) == 4
+    assert [table[i] for i in range(4)] == ["a", "", "Café ☕", ""]
+    assert table.take([2, 0]) == ["Café ☕", "a"]
+    both = table.concat(StringTable.from_strings(["b"]))
+    assert both.to_list() == ["a", "", "Café ☕", "", "b"]
+
+
+def test_records_match_the_frame():
+    songs = make_songs()
+    store = CatalogStore.from_frame(songs)
+    rows = [5, 1, 2, 199]
+
+    records = [r.as_dict() for r in store.records(rows)]
+    expected = songs.iloc[rows][['name', 'year', 'artists', 'predicted_genre']].to_dict(orient='records')
+    expected[2]['artists'] = None
+    assert records == expected
+    assert store.numbers.dtype == np.float32 and store.numbers.flags.c_contiguous
+    np.testing.assert_allclose(store['tempo'], songs['tempo'], rtol=1e-6)
+    assert list(store['first_artist'][:3]) == ["Artist 0", "Artist 1", None]
+
+
+def test_save_load_mapped(tmp_path):
+    songs = make_songs()
+    CatalogStore.from_frame(songs).save(str(tmp_path))
+    store = CatalogStore.load(str(tmp_path), mmap=True)
+
+    assert isinstance(store.numbers, np.memmap) and isinstance(store.names.blob, np.memmap)
+    assert list(store['name']) == list(songs['name'])
+    assert list(store.values('predicted_genre', [0, 8])) == ["genre 0", "genre 1"]
+
+
+def test_append_extends_the_tables():
+    songs = make_songs()
+    store = CatalogStore.from_frame(songs.iloc[:150])
+    more = store.append(songs.iloc[150:])
+
+    assert len(store) == 150 and len(more) == 200
+    full = CatalogStore.from_frame(songs)
+    assert [r.as_dict() for r in more.records(range(200))] == [r.as_dict() for r in full.records(range(200))]
+    np.testing.assert_array_equal(more.numbers, full.numbers)
+
+    new = pd.DataFrame([dict(songs.iloc[0], name="Brand new", artists="['Nobody']", first_artist="Nobody",
+                             predicted_genre="genre 99")])
+    grown = more.append(new)
+    assert grown.records([200])[0].as_dict() == {"name": "Brand new", "year": 2014, "artists": "['Nobody']",
+                                                  "predicted_genre": "genre 99"}
+    assert list(grown.values('first_artist', [0, 200])) == ["Artist 0", "Nobody"]
+    assert grown.numbers.shape == (201, len(number_cols))
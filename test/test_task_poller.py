@@ -0,0 +1,158 @@
+import time
+import asyncio
+import threading
+
+import pytest
+
+from src.song_Gen.task_poller import TaskPoller, TaskFailed
+from test.mock_mureka import MockMureka
+
+
+class FakeTasks:
+    """task id -> list of statuses returned by successive queries, the last one repeats"""
+
+    def __init__(self, statuses: dict):
+        self.statuses = statuses
+        self.queries = {task_id: [] for task_id in statuses}
+        self.lock = threading.Lock()
+
+    def query(self, task_id):
+        with self.lock:
+            self.queries[task_id].append(time.monotonic())
+            n = len(self.queries[task_id])
+        status = self.statuses[task_id][min(n, len(self.statuses[task_id])) - 1]
+        if status == "error":
+            raise ConnectionError("blip")
+        return {"id": task_id, "status": status, "failed_reason": "bad prompt"}
+
+
+def test_one_thread_resolves_many_tasks():
+    tasks = FakeTasks({f"t{i}": ["running"] * (i % 4) + ["succeeded"] for i in range(50)})
+    poller = TaskPoller(tasks.query, initial_interval=0.01, max_interval=0.05, max_per_tick=4)
+    threads_before = threading.active_count()
+
+    futures = {task_id: poller.track(task_id, timeout=10) for task_id in tasks.statuses}
+
+    for task_id, future in futures.items():
+        assert future.result(timeout=5)["id"] == task_id
+    # the scheduler and its query pool, however many tasks there are
+    assert threading.active_count() <= threads_before + 1 + 4
+    assert {task_id: len(times) for task_id, times in tasks.queries.items()} == \
+           {f"t{i}": i % 4 + 1 for i in range(50)}
+    assert poller.stats()["succeeded"] == 50 and poller.in_flight() == 0
+    poller.shutdown()
+
+
+def test_backoff_grows_up_to_the_max_interval():
+    tasks = FakeTasks({"slow": ["running"] * 8 + ["succeeded"]})
+    poller = TaskPoller(tasks.query, initial_interval=0.01, max_interval=0.08, factor=2)
+    poller.track("slow", timeout=10).result(timeout=5)
+
+    times = tasks.queries["slow"]
+    gaps = [b - a for a, b in zip(times, times[1:])]
+    assert gaps[0] < 0.05 and gaps[-1] > 0.06
+    assert max(gaps) < 0.08 * 1.2 + 0.05
+    poller.shutdown()
+
+
+def test_failures_timeouts_and_query_errors():
+    tasks = FakeTasks({"bad": ["running", "failed"], "stuck": ["running"], "flaky": ["error", "error", "succeeded"]})
+    poller = TaskPoller(tasks.query, initial_interval=0.01, max_interval=0.02)
+
+    bad, stuck, flaky = (poller.track(task_id, timeout=0.3) for task_id in ("bad", "stuck", "flaky"))
+
+    with pytest.raises(TaskFailed, match="bad prompt"):
+        bad.result(timeout=5)
+    started = time.monotonic()
+    with pytest.raises(TimeoutError):
+        stuck.result(timeout=5)
+    assert time.monotonic() - started < 0.5
+    assert flaky.result(timeout=5)["status"] == "succeeded"
+
+    stats = poller.stats()
+    assert (stats["failed"], stats["timed_out"], stats["succeeded"], stats["query_errors"]) == (1, 1, 1, 2)
+    poller.shutdown()
+
+
+def test_tracking_the_same_task_twice_shares_the_future():
+    tasks = FakeTasks({"t": ["running", "succeeded"]})
+    poller = TaskPoller(tasks.query, initial_interval=0.01)
+    assert poller.track("t", timeout=5) is poller.track("t", timeout=5)
+    poller.shutdown()
+
+
+def test_tracking_after_shutdown_does_not_hang():
+    tasks = FakeTasks({"t": ["succeeded"]})
+    poller = TaskPoller(tasks.query, initial_interval=0.01)
+    poller.track("t", timeout=5).result(timeout=5)
+    poller.shutdown()
+
+    assert poller.track("late", timeout=5).cancelled()
+    with pytest.raises(asyncio.CancelledError):
+        asyncio.run(asyncio.wait_for(poller.wait("late", timeout=5), 1))
+
+
+def test_a_slow_query_holds_up_only_its_own_task():
+    tasks = FakeTasks({f"t{i}": ["running", "succeeded"] for i in range(5)})
+    slow_started = threading.Event()
+
+    def query(task_id):
+        if task_id == "slow":
+            slow_started.set()
+            time.sleep(1)
+            return {"id": task_id, "status": "running"}
+        return tasks.query(task_id)
+
+    poller = TaskPoller(query, initial_interval=0.01, max_interval=0.02, max_per_tick=2)
+    slow = poller.track("slow", timeout=0.2, initial_interval=0)
+    slow_started.wait(5)
+    started = time.monotonic()
+    futures = [poller.track(f"t{i}", timeout=5) for i in range(5)]
+    for future in futures:
+        assert future.result(timeout=5)["status"] == "succeeded"
+    assert time.monotonic() - started < 0.5
+
+    # the slow task itself times out once its query comes back
+    with pytest.raises(TimeoutError):
+        slow.result(timeout=5)
+    poller.shutdown()
+
+
+def test_the_deadline_is_checked_before_querying():
+    calls = []
+
+    def query(task_id):
+        calls.append(task_id)
+        time.sleep(0.4)
+        return {"id": task_id, "status": "succeeded"}
+
+    poller = TaskPoller(query, initial_interval=0, max_per_tick=1)
+    first = poller.track("first", timeout=5)
+    late = poller.track("late", timeout=0.1)
+    assert first.result(timeout=5)["status"] == "succeeded"
+    with pytest.raises(TimeoutError):
+        late.result(timeout=5)
+    assert calls == ["first"]
+    poller.shutdown()
+
+
+def test_generate_song_async_against_mock_mureka(monkeypatch, tmp_path):
+    monkeypatch.setenv("MUREKA_API_KEY", "test-key")
+    from src.song_Gen import murka_test
+
+    with MockMureka(polls_before_success=2) as mureka:
+        monkeypatch.setattr(murka_test, "MUREKA_API_URL", mureka.url)
+        monkeypatch.setattr(murka_test, "song_poller", TaskPoller(murka_test.query_song_task, initial_interval=0.01))
+
+        async def main():
+            return await asyncio.gather(*[
+                murka_test.generate_song_async(f"song {i}", prompt="pop", output_path=str(tmp_path / f"{i}.flac"))
+                for i in range(5)
+            ])
+
+        results = asyncio.run(main())
+
+    assert [path for _, path in results] == [str(tmp_path / f"{i}.flac") for i in range(5)]
+    assert all(lyrics == "la la\nla" for lyrics, _ in results)
+    assert mureka.count("/v1/song/query/") == 5 * 3
+    murka_test.song_poller.shutdown()
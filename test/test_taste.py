@@ -0,0 +1,157 @@
+import json
+import time
+import datetime
+import threading
+
+import numpy as np
+import pandas as pd
+
+from sklearn.preprocessing import StandardScaler
+
+from src.reoc import SongLookup
+from src.artists import ArtistIndex
+from src.store import CatalogStore
+from src.taste import (TasteProfiles, artist_item, track_item, items_from_rows, empty_profile,
+                       fold_items, top_genres)
+from src.utils import number_cols
+from test.conftest import make_catalog
+from test.fake_redis import FakeRedis
+
+
+def make_data():
+    songs, _ = make_catalog(n_songs=300)
+    songs['first_artist'] = [f"Artist {i % 60}" for i in range(len(songs))]
+    songs['predicted_genre'] = [f"genre {i % 5}" for i in range(len(songs))]
+    songs.loc[songs['first_artist'] == "Artist 1", 'predicted_genre'] = "genre 0"
+    songs['cluster_label'] = 0
+    scaler = StandardScaler().fit(songs[number_cols])
+    features = scaler.transform(songs[number_cols]).astype(np.float32)
+    return songs, SongLookup(songs), ArtistIndex(songs['first_artist'].to_numpy(), features), scaler
+
+
+def test_profile_is_the_mean_of_matched_items():
+    songs, lookup, artists, scaler = make_data()
+    data = CatalogStore.from_frame(songs)
+    profile = empty_profile("v1")
+    items = [artist_item("a1", "artist 1"), track_item("t0", "Shut Up and Dance", "Someone", 2014),
+             track_item("t1", "Unknown song", "Artist 2", 1999), artist_item("a9", "Not In Catalog")]
+    folded = fold_items(profile, items, data, lookup, artists, scaler)
+
+    # the store keeps number_cols as float32
+    numbers = songs[number_cols].to_numpy(dtype=np.float32).astype(np.float64)
+    artist1 = numbers[songs['first_artist'] == "Artist 1"].mean(axis=0)
+    artist2 = numbers[songs['first_artist'] == "Artist 2"].mean(axis=0)
+    expected = (artist1 + numbers[0] + artist2) / 3
+
+    assert profile["count"] == 3 and folded == [item["id"] for item in items]
+    np.testing.assert_allclose(np.asarray(profile["sum"]) / 3, expected)
+    np.testing.assert_allclose(profile["vector"], scaler.transform(pd.DataFrame([expected], columns=number_cols))[0],
+                               rtol=1e-5)
+    assert profile["exclude"] == ["Shut Up and Dance"]
+    # artist 1 and the track are all genre 0, artist 2's rows are all genre 2
+    assert profile["genres"] == {"genre 0": 2.0, "genre 2": 1.0}
+    assert top_genres(profile, 1) == ["genre 0"]
+
+
+def test_folding_is_incremental_and_idempotent():
+    songs, lookup, artists, scaler = make_data()
+    data = CatalogStore.from_frame(songs)
+    items = [artist_item(f"a{i}", f"Artist {i}") for i in range(6)]
+
+    at_once = empty_profile("v1")
+    fold_items(at_once, items, data, lookup, artists, scaler)
+
+    bit_by_bit, seen = empty_profile("v1"), set()
+    fold_items(bit_by_bit, items[:2], data, lookup, artists, scaler, seen)
+    assert fold_items(bit_by_bit, items[1:], data, lookup, artists, scaler, seen) == [i["id"] for i in items[2:]]
+    assert not fold_items(bit_by_bit, items, data, lookup, artists, scaler, seen)
+
+    assert bit_by_bit["count"] == at_once["count"] == 6
+    np.testing.assert_allclose(bit_by_bit["vector"], at_once["vector"], rtol=1e-6)
+
+
+def test_items_from_stored_rows():
+    artist_rows = [("a1", "Queen", ["rock"], 80)]
+    song_rows = [("s1", "Bohemian Rhapsody", "Queen", datetime.date(1975, 10, 31), 90),
+                 ("s2", "Undated", "Queen", None, 10)]
+    items = items_from_rows(artist_rows, song_rows)
+    assert [i["id"] for i in items] == ["artist:a1", "track:s1", "track:s2"]
+    assert items[1]["year"] == 1975 and items[2]["year"] is None
+
+
+def _adding(*ids):
+    """a change folding `ids` (as counted items) into the profile, like user_taste does"""
+    def change(stored, seen):
+        built = stored is None
+        profile = empty_profile("v1") if built else stored
+        new_ids = [i for i in ids if i not in seen(ids)]
+        if not new_ids and not built:
+            return None
+        profile["count"] += len(new_ids)
+        return profile, new_ids, built
+    return change
+
+
+def test_profiles_in_redis_and_in_process():
+    redis_con = FakeRedis()
+    shared = TasteProfiles(redis_getter=lambda: redis_con, ttl=60)
+    assert shared.get("u1") is None
+    assert shared.update("u1", _adding("a", "b"))["count"] == 2
+    assert shared.update("u1", _adding("b", "c"))["count"] == 3
+    assert shared.update("u1", _adding("a"))["count"] == 3  # nothing new, nothing written
+    assert 0 < redis_con.ttl("taste:u1") <= 60 and 0 < redis_con.ttl("taste:u1:items") <= 60
+
+    # the folded ids live next to the profile, a read is one GET of just the profile
+    assert redis_con.store["taste:u1:items"] == {"a", "b", "c"}
+    trips = redis_con.round_trips
+    assert shared.get("u1") == json.loads(redis_con.store["taste:u1"]) and "items" not in shared.get("u1")
+    assert redis_con.round_trips == trips + 2
+    stats = shared.stats()
+    assert (stats["builds"], stats["updates"]) == (1, 1)
+
+    local = TasteProfiles(redis_getter=lambda: None, max_entries=1)
+    local.update("u1", _adding("a"))
+    local.update("u2", _adding("a"))
+    assert local.get("u1") is None and local.get("u2")["count"] == 1
+    assert local.update("u2", _adding("a", "b"))["count"] == 2
+    stats = local.stats()
+    assert (stats["hits"], stats["misses"], stats["local_size"]) == (1, 1, 1)
+
+
+def test_a_concurrent_write_reruns_the_update():
+    redis_con = FakeRedis()
+    profiles = TasteProfiles(redis_getter=lambda: redis_con)
+    profiles.update("u1", _adding("a"))
+
+    calls = []
+
+    def racing(stored, seen):
+        calls.append(stored["count"])
+        if len(calls) == 1:
+            # another worker folds "b" in between our read and our write
+            profiles.update("u1", _adding("b"))
+        return _adding("c")(stored, seen)
+
+    assert profiles.update("u1", racing)["count"] == 3
+    assert calls == [1, 2]
+    assert redis_con.store["taste:u1:items"] == {"a", "b", "c"}
+    assert profiles.stats()["conflicts"] == 1
+
+
+def test_in_process_updates_of_a_user_dont_lose_items():
+    profiles = TasteProfiles(redis_getter=lambda: None)
+
+    def slow_adding(i):
+        change = _adding(f"item {i}")
+
+        def run(stored, seen):
+            time.sleep(0.001)  # widen the read-modify-write window
+            return change(stored, seen)
+        return run
+
+    threads = [threading.Thread(target=profiles.update, args=("u1", slow_adding(i))) for i in range(20)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert profiles.get("u1")["count"] == 20
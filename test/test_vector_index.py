@@ -0,0 +1,42 @@
+import numpy as np
+
+from src.vector_index import AnnoyEngine, ExactEngine, IVFEngine
+
+
+def _features(n=3000, dim=15, seed=0):
+    return np.random.default_rng(seed).normal(size=(n, dim)).astype(np.float32)
+
+
+def _brute_force(features, query, n):
+    dist = ((features.astype(np.float64) - query) ** 2).sum(axis=1)
+    return np.argsort(dist)[:n].tolist()
+
+
+def test_exact_engine_matches_brute_force_across_blocks():
+    features = _features()
+    engine = ExactEngine.build(features, block_size=500)
+    query = features[42] + 0.01
+
+    idxs, dist = engine.get_nns_by_vector(query, 10, include_distances=True)
+    assert idxs == _brute_force(features, query, 10)
+    assert idxs[0] == 42
+    assert dist == sorted(dist)
+
+
+def test_ivf_probing_every_cluster_is_exact():
+    features = _features()
+    engine = IVFEngine.build(features, n_clusters=8, n_probe=8)
+    query = features[7]
+
+    assert engine.get_nns_by_vector(query, 10) == _brute_force(features, query, 10)
+    # search_k forces enough clusters to be probed to return n results
+    assert len(IVFEngine.build(features, n_clusters=8, n_probe=1).get_nns_by_vector(query, 2000, search_k=2000)) == 2000
+
+
+def test_annoy_engine_finds_the_item_itself():
+    features = _features(500)
+    engine = AnnoyEngine.build(features, n_trees=5)
+
+    assert engine.get_n_items() == 500
+    assert engine.get_nns_by_vector(features[3], 1) == [3]
+    assert engine.memory_bytes() > 0
@@ -0,0 +1,158 @@
+import time
+import threading
+
+import pytest
+
+from src.database.postgres import index
+from src.database.postgres.write_behind import (WriteBehindWriter, WriteBehindFull, ARTISTS, artist_row, copy_text,
+                                                upsert_batch)
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+    def execute(self, sql):
+        self.conn.statements.append(sql)
+
+    def copy_expert(self, sql, buffer):
+        if self.conn.fail_next:
+            self.conn.fail_next -= 1
+            raise RuntimeError("connection reset")
+        self.conn.copied.append(buffer.read())
+
+
+class FakeConn:
+    def __init__(self):
+        self.statements, self.copied = [], []
+        self.commits = self.rollbacks = self.fail_next = 0
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        self.rollbacks += 1
+
+
+class FakePool:
+    def __init__(self):
+        self.conn = FakeConn()
+        self.checked_out = 0
+
+    def get(self):
+        self.checked_out += 1
+        return self.conn
+
+    def release(self, conn):
+        self.checked_out -= 1
+
+
+def _writer(pool, **params):
+    params.setdefault("flush_interval", 0.05)
+    return WriteBehindWriter(ARTISTS, get_conn=pool.get, release_conn=pool.release, **params)
+
+
+def _rows(n, user="u1"):
+    return [(f"a{i}", user, f"Artist {i}", ["pop"], 50, None, None) for i in range(n)]
+
+
+def test_copy_text_escapes_arrays_nulls_and_separators():
+    text = copy_text([("a\t1", None, ['hip hop', 'r"b', "back\\slash"], 7)]).read()
+    assert text == 'a\\t1\t\\N\t{"hip hop","r\\\\"b","back\\\\\\\\slash"}\t7\n'
+
+
+def test_artist_row_from_a_spotify_artist():
+    artist = {"id": "a1", "name": "Band", "genres": ["rock"], "popularity": 70,
+              "images": [{"url": "http://img"}], "external_urls": {"spotify": "http://sp"}}
+    assert artist_row("u1", artist) == ("a1", "u1", "Band", ["rock"], 70, "http://img", "http://sp")
+    assert artist_row("u1", {"id": "a2", "name": "X", "images": []})[3:] == ([], None, None, None)
+
+
+def test_upsert_dedupes_keys_within_a_batch():
+    conn = FakeConn()
+    rows = _rows(3) + [("a1", "u1", "Renamed", [], 1, None, None)]
+    assert upsert_batch(conn, ARTISTS, rows) == 3
+    assert "Renamed" in conn.copied[0]
+    assert "ON CONFLICT (artist_id, user_id) DO UPDATE SET name = EXCLUDED.name" in conn.statements[-1]
+    assert conn.commits == 1
+
+
+def test_rows_are_flushed_in_batches_by_size_and_by_time():
+    pool = FakePool()
+    writer = _writer(pool, batch_rows=100, flush_interval=0.2)
+
+    for _ in range(10):
+        writer.submit(_rows(25))  # 250 rows -> two full batches right away
+    deadline = time.time() + 1
+    while writer.stats()["batches"] < 2 and time.time() < deadline:
+        time.sleep(0.01)
+    assert writer.stats()["batches"] == 2
+
+    time.sleep(0.3)  # the remaining 50 go out on the timer
+    stats = writer.stats()
+    assert stats["batches"] == 3 and stats["pending"] == 0 and stats["submitted"] == 250
+    assert pool.checked_out == 0
+    writer.close()
+
+
+def test_full_buffer_pushes_back_on_producers():
+    pool = FakePool()
+    gate = threading.Event()
+    original = pool.get
+    pool.get = lambda: (gate.wait(), original())[1]
+    writer = _writer(pool, batch_rows=10, max_rows=20, submit_timeout=0.1)
+
+    writer.submit(_rows(10))
+    time.sleep(0.1)  # the flusher holds those 10 waiting for a connection
+    writer.submit(_rows(20, user="u2"))
+    with pytest.raises(WriteBehindFull):
+        writer.submit(_rows(5, user="u3"))
+    assert writer.stats()["rejected"] == 5
+
+    gate.set()
+    assert writer.flush(timeout=2)
+    writer.submit(_rows(5, user="u3"))
+    writer.close()
+    assert writer.stats()["flushed"] == 35
+
+
+def test_failed_flushes_are_retried_and_never_leak_connections():
+    pool = FakePool()
+    pool.conn.fail_next = 2
+    writer = _writer(pool, retries=3)
+    writer.submit(_rows(5))
+    assert writer.flush(timeout=5)
+
+    stats = writer.stats()
+    assert (stats["flushed"], stats["retries"], stats["failed"]) == (5, 2, 0)
+    assert pool.conn.rollbacks == 2 and pool.checked_out == 0
+
+    pool.conn.fail_next = 10
+    writer.retries = 1
+    writer.submit(_rows(3))
+    assert writer.flush(timeout=5)
+    assert writer.stats()["failed"] == 3 and pool.checked_out == 0
+    writer.close()
+
+
+def test_close_db_pools_drains_buffered_rows(monkeypatch):
+    pool = FakePool()
+    writer = _writer(pool, batch_rows=1000, flush_interval=60)
+    writer.submit(_rows(42))
+    assert writer.stats()["pending"] == 42
+
+    monkeypatch.setattr(index, "PG_POOL", None)
+    index.close_db_pools()
+
+    assert writer.stats()["flushed"] == 42 and writer not in index._WRITERS
+    with pytest.raises(WriteBehindFull):
+        writer.submit(_rows(1))